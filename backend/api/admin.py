@@ -1,28 +1,85 @@
 from django.contrib import admin
-from .models import ParkingSlot, SlotStatus, Booking, VehicleLog, SensorEvent
+from .models import (Facility, ParkingSlot, SlotStatus, ZoneAvailability, Booking, VehicleLog, SensorEvent, SensorDevice,
+                     OcrJob, SensorRollup)
+from .utils import devices, replicas
+
+class ReplicaReadsAdmin(admin.ModelAdmin):
+    """change lists (GET) read from a replica when one is configured, see api.utils.replicas"""
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with replicas.reads():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()  # template rendering runs queries too
+            return response
+
+@admin.register(Facility)
+class FacilityAdmin(admin.ModelAdmin):
+    list_display = ('code','name','is_active')
+    search_fields = ('code','name')
 
 @admin.register(ParkingSlot)
-class ParkingSlotAdmin(admin.ModelAdmin):
-    list_display = ('label','zone','max_vehicle_type','is_active')
+class ParkingSlotAdmin(ReplicaReadsAdmin):
+    list_display = ('label','facility','zone','max_vehicle_type','is_active')
+    list_filter = ('facility',)
     search_fields = ('label','zone')
 
+    def get_readonly_fields(self, request, obj=None):
+        # fixed once created: status, sensor data and zone counters are partitioned by it
+        return ('facility',) if obj else ()
+
 @admin.register(SlotStatus)
-class SlotStatusAdmin(admin.ModelAdmin):
-    list_display = ('slot','status','last_update')
-    list_filter = ('status',)
+class SlotStatusAdmin(ReplicaReadsAdmin):
+    list_display = ('slot','facility','status','last_update')
+    list_filter = ('facility','status')
+
+@admin.register(ZoneAvailability)
+class ZoneAvailabilityAdmin(ReplicaReadsAdmin):
+    list_display = ('zone','facility','free','occupied','reserved','updated_at')
+    list_filter = ('facility',)
+    readonly_fields = ('facility','zone','free','occupied','reserved','updated_at')  # see reconcile_zone_counters
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ReplicaReadsAdmin):
     list_display = ('id','user','vehicle_number','slot','eta','status','created_at')
     list_filter = ('status',)
     search_fields = ('vehicle_number','user__username')
 
 @admin.register(VehicleLog)
-class VehicleLogAdmin(admin.ModelAdmin):
+class VehicleLogAdmin(ReplicaReadsAdmin):
     list_display = ('vehicle_number','slot','entry_ts','exit_ts','booking')
     search_fields = ('vehicle_number',)
 
 @admin.register(SensorEvent)
-class SensorEventAdmin(admin.ModelAdmin):
+class SensorEventAdmin(ReplicaReadsAdmin):
     list_display = ('slot','sensor_type','value','ts')
     list_filter = ('sensor_type',)
+
+@admin.register(SensorDevice)
+class SensorDeviceAdmin(admin.ModelAdmin):
+    list_display = ('name','is_active','rate_limit','burst','created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    filter_horizontal = ('slots',)
+    actions = ['issue_keys']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not obj.key_hash:
+            self.message_user(request, f'key for {obj.name} (shown once): {devices.issue_key(obj)}')
+
+    @admin.action(description='Issue new keys (the old ones stop working)')
+    def issue_keys(self, request, queryset):
+        for device in queryset:
+            self.message_user(request, f'key for {device.name} (shown once): {devices.issue_key(device)}')
+
+@admin.register(OcrJob)
+class OcrJobAdmin(ReplicaReadsAdmin):
+    list_display = ('id','status','plate_text','vehicle_log','created_at','finished_at')
+    list_filter = ('status',)
+
+@admin.register(SensorRollup)
+class SensorRollupAdmin(ReplicaReadsAdmin):
+    list_display = ('slot','sensor_type','granularity','bucket','count','occupied_count','mean_value')
+    list_filter = ('granularity','sensor_type')
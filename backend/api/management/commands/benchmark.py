@@ -0,0 +1,122 @@
+import json
+import platform
+import subprocess
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.utils import loadgen
+
+BENCHMARK_BASELINE = getattr(settings, 'BENCHMARK_BASELINE', settings.BASE_DIR / 'benchmarks' / 'baseline.json')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Run a mixed load (sensor posts, entry/exit cameras, booking bursts, board polling) against a "
+            "throwaway test database and report throughput, p50/p95/p99 latency and queries per request per "
+            "endpoint. Compares against a stored baseline; --save-baseline records a new one. "
+            "Set DATABASE_URL to benchmark on Postgres instead of SQLite.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000, help='measured requests (after warmup)')
+        parser.add_argument('--concurrency', type=int, default=1, help='client threads')
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0, help='random seed for the request mix')
+        parser.add_argument('--baseline', default=str(BENCHMARK_BASELINE), help='baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true', help='write this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='allowed relative p95 slowdown before an endpoint counts as regressed')
+        parser.add_argument('--fail-on-regression', action='store_true', help='exit non-zero on regressions')
+        parser.add_argument('--output', help='also write this run\'s JSON here')
+        parser.add_argument('--keepdb', action='store_true', help='reuse the test database between runs')
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts['keepdb'], serialize=False)
+        try:
+            cache.clear()
+            slot_ids, device_key = loadgen.seed(opts['slots'])
+            gen = loadgen.LoadGenerator(slot_ids, device_key, rng_seed=opts['seed'])
+            elapsed = gen.run(opts['requests'], concurrency=opts['concurrency'], warmup=opts['warmup'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts['keepdb'])
+            teardown_test_environment()
+
+        run = {
+            'meta': {'commit': _git_commit(), 'vendor': connection.vendor, 'python': platform.python_version(),
+                     'django': django.get_version(), 'machine': platform.machine(),
+                     'slots': opts['slots'], 'requests': opts['requests'], 'concurrency': opts['concurrency'],
+                     'seed': opts['seed'], 'elapsed_s': round(elapsed, 3),
+                     'total_rps': round(opts['requests'] / elapsed, 1)},
+            'results': gen.summary(elapsed),
+        }
+        self._report(run)
+        if opts['output']:
+            self._write(opts['output'], run)
+
+        baseline_path = opts['baseline']
+        if opts['save_baseline']:
+            self._write(baseline_path, run)
+            self.stdout.write(f"baseline saved to {baseline_path}")
+            return
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write(f"no baseline at {baseline_path}; run with --save-baseline to record one")
+            return
+        regressions = self._compare(baseline, run, opts['tolerance'])
+        if regressions and opts['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} endpoint(s) regressed against {baseline_path}")
+
+    def _write(self, path, run):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    def _report(self, run):
+        meta = run['meta']
+        self.stdout.write(f"{meta['requests']} requests, {meta['concurrency']} thread(s), {meta['slots']} slots on "
+                          f"{meta['vendor']}: {meta['elapsed_s']}s, {meta['total_rps']} req/s")
+        self.stdout.write(f"{'endpoint':<15}{'n':>6}{'err':>5}{'req/s':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'q/req':>7}")
+        for name, r in run['results'].items():
+            self.stdout.write(f"{name:<15}{r['requests']:>6}{r['errors']:>5}{r['rps']:>9}{r['p50_ms']:>9}"
+                              f"{r['p95_ms']:>9}{r['p99_ms']:>9}{r['queries_per_request']:>7}")
+
+    def _compare(self, baseline, run, tolerance):
+        """print per-endpoint deltas; returns the names of regressed endpoints"""
+        base_meta = baseline.get('meta', {})
+        self.stdout.write(f"vs baseline {base_meta.get('commit') or '?'} ({base_meta.get('vendor')}, "
+                          f"{base_meta.get('requests')} requests, {base_meta.get('concurrency')} thread(s))")
+        regressions = []
+        for name, r in run['results'].items():
+            b = baseline.get('results', {}).get(name)
+            if not b:
+                continue
+            notes = []
+            if r['p95_ms'] > b['p95_ms'] * (1 + tolerance):
+                notes.append(f"p95 {b['p95_ms']} -> {r['p95_ms']}ms")
+            if r['queries_per_request'] > b['queries_per_request'] + 0.5:
+                notes.append(f"queries/request {b['queries_per_request']} -> {r['queries_per_request']}")
+            if notes:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f"  REGRESSION {name}: {', '.join(notes)}"))
+            else:
+                self.stdout.write(f"  ok {name}: p95 {b['p95_ms']} -> {r['p95_ms']}ms, "
+                                  f"queries/request {b['queries_per_request']} -> {r['queries_per_request']}")
+        return regressions
@@ -0,0 +1,94 @@
+import glob
+import io
+import json
+import resource
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageDraw
+
+from api.utils import ocr_engines, ocr_utils
+
+
+def _cpu():
+    """CPU seconds used by this process plus its finished children (pytesseract's tesseract runs)"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _synthetic(n):
+    frames = []
+    for i in range(n):
+        img = Image.new('L', (640, 200), 255)
+        ImageDraw.Draw(img).text((40, 80), f'KA{i % 100:02d}AB{1000 + i}', fill=0)
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG')
+        frames.append(buf.getvalue())
+    return frames
+
+
+class Command(BaseCommand):
+    help = ("Measure per-plate OCR latency and CPU time for each available engine (pytesseract's process per "
+            "image vs pooled in-process tesserocr), bypassing the plate cache. Preprocessing is done up front "
+            "and not timed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('images', nargs='*', help='image files or globs (default: synthetic plates)')
+        parser.add_argument('--synthetic', type=int, default=20, help='synthetic frames when no images are given')
+        parser.add_argument('--engines', default=','.join(ocr_engines.ENGINES), help='comma separated')
+        parser.add_argument('--batch-size', type=int, default=8, help='frames read per engine checkout')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help='print the results as JSON')
+
+    def handle(self, *args, **opts):
+        paths = [p for pattern in opts['images'] for p in sorted(glob.glob(pattern))]
+        if opts['images'] and not paths:
+            raise CommandError('no images matched')
+        frames = [Path(p).read_bytes() for p in paths] if paths else _synthetic(opts['synthetic'])
+        inputs = [ocr_utils.preprocess_image(io.BytesIO(data)) for data in frames]
+        size = max(1, opts['batch_size'])
+
+        results = {}
+        for name in opts['engines'].split(','):
+            if name not in ocr_engines.ENGINES:
+                raise CommandError(f'unknown engine {name!r}')
+            pool = ocr_engines.EnginePool(ocr_engines.ENGINES[name], size=1)
+            try:
+                with pool.engine() as engine:  # start-up is a one-off per worker, not per plate
+                    engine.read(inputs[0])
+            except Exception as e:
+                self.stderr.write(f'{name}: unavailable ({e})')
+                continue
+            latencies, plates = [], 0
+            cpu0, wall0 = _cpu(), time.perf_counter()
+            for _ in range(opts['repeat']):
+                for start in range(0, len(inputs), size):
+                    with pool.engine() as engine:
+                        for img in inputs[start:start + size]:
+                            t0 = time.perf_counter()
+                            plates += bool(ocr_utils.parse_plate(engine.read(img)))
+                            latencies.append(time.perf_counter() - t0)
+            wall, cpu = time.perf_counter() - wall0, _cpu() - cpu0
+            pool.close()
+            latencies.sort()
+            n = len(latencies)
+            results[name] = {
+                'images': n, 'plates_read': plates,
+                'p50_ms': round(latencies[n // 2] * 1000, 2),
+                'p95_ms': round(latencies[min(n - 1, int(n * 0.95))] * 1000, 2),
+                'wall_ms_per_plate': round(wall / n * 1000, 2),
+                'cpu_ms_per_plate': round(cpu / n * 1000, 2),
+            }
+        if not results:
+            raise CommandError('no OCR engine available')
+
+        if opts['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        base = results.get('pytesseract')
+        self.stdout.write(f"{'engine':<12} {'images':>6} {'p50 ms':>8} {'p95 ms':>8} {'wall ms':>8} {'cpu ms':>8}  speedup")
+        for name, r in results.items():
+            speedup = f"{base['wall_ms_per_plate'] / r['wall_ms_per_plate']:.1f}x" if base else '-'
+            self.stdout.write(f"{name:<12} {r['images']:>6} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+                              f"{r['wall_ms_per_plate']:>8} {r['cpu_ms_per_plate']:>8}  {speedup}")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.utils import expiry
+
+
+class Command(BaseCommand):
+    help = ("Cancel active bookings whose reservation window has passed without an arrival and free their "
+            "reserved slots. Run from cron, or with --loop as a long-running sweeper; safe on several nodes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=expiry.EXPIRY_BATCH_SIZE)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='keep sweeping, sleeping this many seconds between passes')
+
+    def handle(self, *args, **opts):
+        while True:
+            cancelled, freed = expiry.sweep(batch_size=opts['batch_size'])
+            if cancelled or freed or not opts['loop']:
+                self.stdout.write(f"cancelled {cancelled} expired bookings, freed {freed} slots")
+            if not opts['loop']:
+                return
+            connections.close_all()
+            time.sleep(opts['loop'])
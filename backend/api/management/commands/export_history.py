@@ -0,0 +1,90 @@
+import argparse
+import gzip
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Facility
+from api.utils import exports, facilities
+
+
+def _when(value):
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not an ISO date / datetime')
+    return timezone.make_aware(ts) if timezone.is_naive(ts) else ts
+
+
+class Command(BaseCommand):
+    help = ("Export VehicleLog or Booking history for [--from, --until) as CSV / NDJSON (optionally gzipped) or "
+            "zstd-compressed Parquet (needs pyarrow), streamed in chunks so memory stays flat. With --prune, "
+            "only the finished rows of the range are exported, and deleted once the file is complete.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--from', dest='start', required=True, type=_when)
+        parser.add_argument('--until', dest='end', required=True, type=_when)
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'parquet'], default='csv')
+        parser.add_argument('--output', default='-', help="file to write, '-' for stdout (csv / ndjson only)")
+        parser.add_argument('--gzip', action='store_true', help='gzip csv / ndjson output (implied by a .gz name)')
+        parser.add_argument('--facility', help='facility code (default: all)')
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE)
+        parser.add_argument('--prune', action='store_true',
+                            help='export only finished rows and delete them afterwards (needs --output)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per delete statement')
+
+    def handle(self, *args, **opts):
+        kind, fmt, output = opts['kind'], opts['format'], opts['output']
+        if output == '-' and (fmt == 'parquet' or opts['prune']):
+            raise CommandError('--output is required for parquet and --prune')
+        if fmt == 'parquet' and exports.pyarrow is None:
+            raise CommandError('parquet export needs pyarrow (pip install pyarrow)')
+        try:
+            facility = facilities.from_code(opts['facility'])
+        except Facility.DoesNotExist:
+            raise CommandError(f"unknown facility {opts['facility']!r}")
+        facility_id = facility.pk if facility else None
+
+        range_args = (kind, opts['start'], opts['end'])
+        if opts['prune']:
+            max_id, open_ids = exports.snapshot(*range_args, facility_id)
+            qs = exports.prunable(*range_args, max_id, open_ids, facility_id)
+        else:
+            qs = exports.queryset(*range_args, facility_id)
+        written = 0
+
+        def counted(rows):
+            nonlocal written
+            for row in rows:
+                written += 1
+                yield row
+
+        rows = counted(exports.rows(qs, kind, opts['chunk_size']))
+        if output == '-':
+            for line in exports.FORMATS[fmt][0](rows, kind):
+                self.stdout.write(line, ending='')
+            return
+        # write next to the target and rename when complete, so a partial file never looks like an archive
+        tmp = f'{output}.part'
+        try:
+            if fmt == 'parquet':
+                exports.write_parquet(rows, kind, tmp, opts['chunk_size'])
+            else:
+                compress = opts['gzip'] or output.endswith('.gz')
+                with (gzip.open(tmp, 'wt', newline='', encoding='utf-8') if compress
+                      else open(tmp, 'w', newline='', encoding='utf-8')) as f:
+                    for line in exports.FORMATS[fmt][0](rows, kind):
+                        f.write(line)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, output)
+        self.stderr.write(f"exported {written} {kind} to {output}")
+
+        if opts['prune'] and written:
+            deleted = exports.prune(*range_args, max_id, open_ids, facility_id, opts['batch_size'])
+            self.stderr.write(f"pruned {deleted} finished {kind}")
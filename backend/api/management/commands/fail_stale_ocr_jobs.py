@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.utils import ocr_jobs
+
+
+class Command(BaseCommand):
+    help = ("Fail OCR jobs left queued or running by a worker that restarted (jobs are queued per process). "
+            "Run from cron, or with --loop as a long-running sweeper.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=ocr_jobs.OCR_JOB_STALE_SECONDS, metavar='SECONDS',
+                            help='age after which a queued or running job counts as abandoned')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='keep sweeping, sleeping this many seconds between passes')
+
+    def handle(self, *args, **opts):
+        while True:
+            failed = ocr_jobs.fail_stale(opts['older_than'])
+            if failed or not opts['loop']:
+                self.stdout.write(f"failed {failed} abandoned OCR jobs")
+            if not opts['loop']:
+                return
+            connections.close_all()
+            time.sleep(opts['loop'])
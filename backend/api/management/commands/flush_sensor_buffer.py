@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import event_buffer
+
+
+class Command(BaseCommand):
+    help = ("Insert the raw sensor readings left in the write-behind buffer by processes that died before "
+            "flushing them (SENSOR_BUFFER_DIR). Segments of running processes are left alone.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(event_buffer.SENSOR_BUFFER_DIR))
+
+    def handle(self, *args, **opts):
+        written = event_buffer.recover(opts['dir'])
+        self.stdout.write(f"recovered {written} sensor events")
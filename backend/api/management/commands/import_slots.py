@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Facility
+from api.utils import facilities, provisioning
+
+
+class Command(BaseCommand):
+    help = ("Create or update slots (and their SlotStatus rows) from a CSV file with a header row or a JSON / "
+            "NDJSON file: label, zone, max_vehicle_type, is_active, facility (code). Upserts on (facility, label), "
+            "so an interrupted import can simply be run again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to import, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'json'], help='default: from the file extension')
+        parser.add_argument('--facility', help='facility code for rows without one (default: the main facility)')
+        parser.add_argument('--chunk-size', type=int, default=provisioning.IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        path = opts['path']
+        fmt = opts['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        try:
+            facility = facilities.from_code(opts['facility'])
+        except Facility.DoesNotExist:
+            raise CommandError(f"unknown facility {opts['facility']!r}")
+        f = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        started = time.perf_counter()
+        try:
+            rows = provisioning.csv_rows(f) if fmt == 'csv' else provisioning.json_rows(f)
+            total, created = provisioning.import_slots(rows, facility, max(1, opts['chunk_size']))
+        except (ValueError, Facility.DoesNotExist) as e:
+            raise CommandError(f'{e} (chunks before this one were imported)')
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        self.stdout.write(f"imported {total} slots ({created} new, {total - created} updated) "
+                          f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import DEFAULT_FACILITY_CODE, Facility, ParkingSlot, SensorDevice
+from api.utils import devices, facilities
+
+
+class Command(BaseCommand):
+    help = ("Register a sensor device, or replace the key of an existing one, and print its new key. Only a hash "
+            "is stored, so the key is shown this once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('name')
+        parser.add_argument('--slots', nargs='+', metavar='LABEL',
+                            help='slot labels the device may report for (default: keep / any slot)')
+        parser.add_argument('--facility', help='facility code of the slots (default: the main facility)')
+        parser.add_argument('--rate', type=float, help='requests per second (default: SENSOR_DEVICE_RATE)')
+        parser.add_argument('--burst', type=int, help='bucket size (default: SENSOR_DEVICE_BURST)')
+
+    def handle(self, *args, **opts):
+        device, created = SensorDevice.objects.get_or_create(name=opts['name'])
+        if opts['rate'] is not None or opts['burst'] is not None:
+            device.rate_limit = opts['rate'] if opts['rate'] is not None else device.rate_limit
+            device.burst = opts['burst'] if opts['burst'] is not None else device.burst
+            device.save(update_fields=['rate_limit', 'burst'])
+        if opts['slots']:
+            try:
+                facility = facilities.from_code(opts['facility'] or DEFAULT_FACILITY_CODE)
+            except Facility.DoesNotExist:
+                raise CommandError(f"unknown facility {opts['facility']!r}")
+            slots = ParkingSlot.objects.filter(facility=facility, label__in=opts['slots'])
+            missing = set(opts['slots']) - {s.label for s in slots}
+            if missing:
+                raise CommandError(f"unknown slots: {', '.join(sorted(missing))}")
+            device.slots.set(slots)
+        key = devices.issue_key(device)
+        self.stdout.write(f"{'registered' if created else 'new key for'} {device.name}: {key}")
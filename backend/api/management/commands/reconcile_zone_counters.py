@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.models import Facility
+from api.utils import facilities, zones
+
+
+class Command(BaseCommand):
+    help = ("Recount the per-zone availability counters from SlotStatus and correct any drift (status changes "
+            "made without slot_status_changed, deleted slots). Run from cron, or with --loop.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facility', help='facility code (default: all)')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='keep reconciling, sleeping this many seconds between passes')
+
+    def handle(self, *args, **opts):
+        try:
+            facility = facilities.from_code(opts['facility'])
+        except Facility.DoesNotExist:
+            raise CommandError(f"unknown facility {opts['facility']!r}")
+        while True:
+            drifted = zones.reconcile(facility.pk if facility else None)
+            if drifted or not opts['loop']:
+                self.stdout.write(f"corrected {drifted} drifted zone counters")
+            if not opts['loop']:
+                return
+            connections.close_all()
+            time.sleep(opts['loop'])
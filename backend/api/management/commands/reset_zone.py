@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Facility, SlotStatus
+from api.utils import facilities, provisioning
+
+
+class Command(BaseCommand):
+    help = ("Set every slot of a zone to one status (default free) in a single update, e.g. after maintenance "
+            "or a sensor outage; reserved slots are kept unless --include-reserved. Signs, streams and zone "
+            "counters follow.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('zone')
+        parser.add_argument('--status', default='free', choices=[c for c, _ in SlotStatus.STATUS_CHOICES])
+        parser.add_argument('--facility', help='facility code (default: the zone in every facility)')
+        parser.add_argument('--include-reserved', action='store_false', dest='keep_reserved',
+                            help='reset reserved slots too, although their bookings still hold them')
+
+    def handle(self, *args, **opts):
+        try:
+            facility = facilities.from_code(opts['facility'])
+        except Facility.DoesNotExist:
+            raise CommandError(f"unknown facility {opts['facility']!r}")
+        changed = provisioning.reset_zone(opts['zone'], opts['status'], facility.pk if facility else None,
+                                          opts['keep_reserved'])
+        self.stdout.write(f"set {changed} slots in zone {opts['zone']!r} to {opts['status']}")
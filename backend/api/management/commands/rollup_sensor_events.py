@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Facility, SensorEvent, SensorRollup
+from api.utils import facilities, rollups
+
+
+class Command(BaseCommand):
+    help = ("Roll raw SensorEvent readings up into minute/hour SensorRollup rows, then delete raw "
+            "readings (and old minute rollups) past their retention age in small batches. Run from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retain-days', type=float,
+                            default=getattr(settings, 'SENSOR_RAW_RETENTION_DAYS', 7),
+                            help='keep raw readings this many days')
+        parser.add_argument('--minute-retain-days', type=float,
+                            default=getattr(settings, 'SENSOR_MINUTE_ROLLUP_RETENTION_DAYS', 90),
+                            help='keep minute rollups this many days (hour rollups are kept)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per delete statement')
+        parser.add_argument('--pause', type=float, default=0.05, help='seconds to sleep between delete batches')
+        parser.add_argument('--no-delete', action='store_true', help='only roll up, delete nothing')
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        minutes, minute_end = rollups.rollup('minute', now)
+        hours, hour_end = rollups.rollup('hour', now)
+        self.stdout.write(f"rolled up {minutes} minute and {hours} hour buckets")
+        if opts['no_delete']:
+            return
+        # never delete raw rows that haven't been rolled up yet
+        raw_cutoff = min(now - timedelta(days=opts['retain_days']), minute_end)
+        minute_cutoff = min(now - timedelta(days=opts['minute_retain_days']), hour_end)
+        deleted = pruned = 0
+        for facility_id in Facility.objects.values_list('pk', flat=True):
+            db = facilities.telemetry_db(facility_id)
+            deleted += rollups.delete_in_batches(
+                SensorEvent.objects.using(db).filter(facility_id=facility_id, ts__lt=raw_cutoff),
+                opts['batch_size'], opts['pause'])
+            pruned += rollups.delete_in_batches(
+                SensorRollup.objects.using(db).filter(facility_id=facility_id, granularity='minute',
+                                                      bucket__lt=minute_cutoff),
+                opts['batch_size'], opts['pause'])
+        self.stdout.write(f"deleted {deleted} raw readings older than {raw_cutoff:%Y-%m-%d %H:%M} "
+                          f"and {pruned} minute rollups")
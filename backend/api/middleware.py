@@ -0,0 +1,66 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .utils import metrics, replicas
+
+
+class _QueryTimer:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    records latency, status, DB query count and DB time per resolved view
+    (see api.utils.metrics; exposed at /metrics)
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        t0 = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - t0
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+        metrics.http_requests.inc(view, request.method, response.status_code)
+        metrics.http_latency.observe(elapsed, view, request.method)
+        metrics.db_queries.observe(timer.count, view)
+        metrics.db_time.inc(view, amount=timer.seconds)
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    read-your-writes for replica reads: a client whose request wrote to the primary is
+    pinned to it for REPLICA_PIN_SECONDS by a cookie (see api.utils.replicas)
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas.REPLICA_DATABASES:
+            return self.get_response(request)
+        with replicas.request_scope(pinned=replicas.PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        if state['wrote']:
+            response.set_cookie(replicas.PIN_COOKIE, '1', max_age=replicas.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_sensorevent_ts_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sensorevent',
+            index=models.Index(fields=['slot', 'sensor_type', '-ts'], name='sensorevent_slot_type_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_sensorevent_window_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='slotstatus',
+            index=models.Index(fields=['status'], name='slotstatus_status_idx'),
+        ),
+    ]
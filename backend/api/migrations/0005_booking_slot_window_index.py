@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_slotstatus_status_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['slot', 'reserved_from', 'reserved_until'], name='booking_slot_window_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+import re
+
+PLATE_FOLD = str.maketrans('OQILZSB', '0011258')
+
+
+def backfill_plate_keys(apps, schema_editor):
+    # same normalisation as api.utils.plates.plate_key at the time of writing
+    for name in ('Booking', 'VehicleLog'):
+        model = apps.get_model('api', name)
+        batch = []
+        for obj in model.objects.only('id', 'vehicle_number').iterator(chunk_size=2000):
+            obj.plate_key = re.sub(r'[^A-Z0-9]', '', (obj.vehicle_number or '').upper()).translate(PLATE_FOLD)
+            batch.append(obj)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['plate_key'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['plate_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_ocrjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='plate_key',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='vehiclelog',
+            name='plate_key',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_plate_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['plate_key', 'status'], name='booking_plate_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehiclelog',
+            index=models.Index(fields=['plate_key', '-entry_ts'], name='vehiclelog_plate_entry_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_plate_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_type', models.CharField(max_length=20)),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('occupied_count', models.IntegerField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('mean_value', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='sensorevent',
+            index=models.Index(fields=['ts'], name='sensorevent_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='slot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sensor_rollups', to='api.parkingslot'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorrollup',
+            index=models.Index(fields=['granularity', 'bucket'], name='sensorrollup_gran_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='sensorrollup',
+            constraint=models.UniqueConstraint(fields=('slot', 'sensor_type', 'granularity', 'bucket'), name='sensorrollup_unique_bucket'),
+        ),
+    ]
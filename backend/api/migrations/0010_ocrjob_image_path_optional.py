@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_booking_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ocrjob',
+            name='image_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,125 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+import api.models
+
+
+def assign_main_facility(apps, schema_editor):
+    # every existing slot (and everything hanging off it) belongs to the 'main' facility
+    Facility = apps.get_model('api', 'Facility')
+    ParkingSlot = apps.get_model('api', 'ParkingSlot')
+    main, _ = Facility.objects.get_or_create(code='main', defaults={'name': 'Main'})
+    ParkingSlot.objects.filter(facility__isnull=True).update(facility=main)
+    slot_facility = Subquery(ParkingSlot.objects.filter(pk=OuterRef('slot_id')).values('facility_id')[:1])
+    for name in ('SlotStatus', 'SensorEvent', 'SensorRollup', 'Booking'):
+        apps.get_model('api', name).objects.filter(facility__isnull=True, slot__isnull=False).update(facility=slot_facility)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_booking_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Facility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=30, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name_plural': 'facilities',
+            },
+        ),
+        migrations.AddField(
+            model_name='parkingslot',
+            name='facility',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='slots', to='api.facility'),
+        ),
+        migrations.AddField(
+            model_name='slotstatus',
+            name='facility',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.facility'),
+        ),
+        migrations.AddField(
+            model_name='sensorevent',
+            name='facility',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.facility'),
+        ),
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='facility',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.facility'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='facility',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='api.facility'),
+        ),
+        migrations.RunPython(assign_main_facility, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='parkingslot',
+            name='facility',
+            field=models.ForeignKey(default=api.models.default_facility, on_delete=django.db.models.deletion.PROTECT, related_name='slots', to='api.facility'),
+        ),
+        migrations.AlterField(
+            model_name='slotstatus',
+            name='facility',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.facility'),
+        ),
+        migrations.AlterField(
+            model_name='sensorevent',
+            name='facility',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.facility'),
+        ),
+        migrations.AlterField(
+            model_name='sensorrollup',
+            name='facility',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.facility'),
+        ),
+        migrations.AlterField(
+            model_name='sensorevent',
+            name='slot',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sensor_events', to='api.parkingslot'),
+        ),
+        migrations.AlterField(
+            model_name='sensorrollup',
+            name='slot',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sensor_rollups', to='api.parkingslot'),
+        ),
+        migrations.AlterField(
+            model_name='parkingslot',
+            name='label',
+            field=models.CharField(max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='parkingslot',
+            constraint=models.UniqueConstraint(fields=('facility', 'label'), name='parkingslot_facility_label_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='slotstatus',
+            index=models.Index(fields=['facility', 'status'], name='slotstatus_facility_status_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='sensorevent',
+            name='sensorevent_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sensorevent',
+            index=models.Index(fields=['facility', 'ts'], name='sensorevent_facility_ts_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='sensorrollup',
+            name='sensorrollup_gran_bucket_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sensorrollup',
+            index=models.Index(fields=['facility', 'granularity', 'bucket'], name='sensorrollup_fac_bucket_idx'),
+        ),
+    ]
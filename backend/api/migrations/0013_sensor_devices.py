@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_facilities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('key_hash', models.CharField(editable=False, max_length=64, null=True, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('rate_limit', models.FloatField(blank=True, null=True)),
+                ('burst', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('slots', models.ManyToManyField(blank=True, related_name='sensor_devices', to='api.parkingslot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_zones(apps, schema_editor):
+    # start the counters from the current statuses of active slots
+    SlotStatus = apps.get_model('api', 'SlotStatus')
+    ZoneAvailability = apps.get_model('api', 'ZoneAvailability')
+    rows = (SlotStatus.objects.filter(slot__is_active=True).values('facility_id', 'slot__zone')
+            .annotate(**{s: Count('pk', filter=Q(status=s)) for s in ('free', 'occupied', 'reserved')}))
+    ZoneAvailability.objects.bulk_create(
+        ZoneAvailability(facility_id=r['facility_id'], zone=r['slot__zone'], free=r['free'],
+                         occupied=r['occupied'], reserved=r['reserved']) for r in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_sensor_devices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZoneAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zone', models.CharField(blank=True, max_length=50)),
+                ('free', models.IntegerField(default=0)),
+                ('occupied', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('facility', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.facility')),
+            ],
+            options={
+                'verbose_name_plural': 'zone availability',
+                'constraints': [models.UniqueConstraint(fields=('facility', 'zone'), name='zoneavailability_facility_zone_uniq')],
+            },
+        ),
+        migrations.RunPython(count_zones, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,57 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .signals import slot_status_changed
+from .utils.plates import plate_key, plate_index
 from django.contrib.auth.models import User
 
+DEFAULT_FACILITY_CODE = 'main'
+
+class Facility(models.Model):
+    """a parking site; slots, their status and sensor data are partitioned by facility (see api.utils.facilities)"""
+    code = models.SlugField(max_length=30, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name_plural = 'facilities'
+
+    def __str__(self):
+        return self.name or self.code
+
+def default_facility():
+    # single-site deployments (and slots created without a facility) use the 'main' facility
+    return Facility.objects.get_or_create(code=DEFAULT_FACILITY_CODE, defaults={'name': 'Main'})[0].pk
+
 class ParkingSlot(models.Model):
-    label = models.CharField(max_length=20, unique=True)
+    facility = models.ForeignKey(Facility, on_delete=models.PROTECT, related_name='slots', default=default_facility)
+    label = models.CharField(max_length=20)
     zone = models.CharField(max_length=50, blank=True)
     max_vehicle_type = models.CharField(max_length=20, default='car')
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facility', 'label'], name='parkingslot_facility_label_uniq'),
+        ]
+
+    _loaded_zone = None  # (facility_id, zone, is_active) as last read from / written to the db, see api.utils.zones
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        if {'facility_id', 'zone', 'is_active'} <= obj.__dict__.keys():  # not deferred
+            obj._loaded_zone = (obj.facility_id, obj.zone, obj.is_active)
+        return obj
+
+    def save(self, *args, **kwargs):
+        # SlotStatus, sensor data and the zone counters keep a copy of the facility; a slot never moves
+        if self._loaded_zone is not None and self.facility_id != self._loaded_zone[0]:
+            raise ValueError(f"slot {self.label!r} can't move to another facility; create a new slot there")
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.label} ({'active' if self.is_active else 'inactive'})"
 
@@ -17,12 +62,56 @@ class SlotStatus(models.Model):
         ('reserved', 'Reserved'),
     ]
     slot = models.OneToOneField(ParkingSlot, on_delete=models.CASCADE, related_name='status')
+    facility = models.ForeignKey(Facility, on_delete=models.CASCADE, related_name='+')  # copy of slot.facility (fixed)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='free')
     last_update = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='slotstatus_status_idx'),  # allocation scans free rows
+            models.Index(fields=['facility', 'status'], name='slotstatus_facility_status_idx'),
+        ]
+
+    _loaded_status = None  # status as last read from / written to the db
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        obj = super().from_db(db, field_names, values)
+        obj._loaded_status = obj.status
+        return obj
+
+    def save(self, *args, **kwargs):
+        if self.facility_id is None:
+            self.facility_id = self.slot.facility_id
+        # receivers of slot_status_changed run in the same transaction as the write
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if self.status != self._loaded_status:
+                slot_status_changed.send(sender=SlotStatus, changes=[(self.slot_id, self._loaded_status, self.status)])
+        self._loaded_status = self.status
+
     def __str__(self):
         return f"{self.slot.label} - {self.status}"
 
+class ZoneAvailability(models.Model):
+    """free / occupied / reserved counts of a zone's active slots, kept current by api.utils.zones"""
+    facility = models.ForeignKey(Facility, on_delete=models.CASCADE, related_name='+')
+    zone = models.CharField(max_length=50, blank=True)
+    # plain integers: a counter that has drifted below zero must not fail the status change
+    free = models.IntegerField(default=0)
+    occupied = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = 'zone availability'
+        constraints = [
+            models.UniqueConstraint(fields=['facility', 'zone'], name='zoneavailability_facility_zone_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.zone or '-'}: {self.free} free"
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('active','Active'),
@@ -31,18 +120,39 @@ class Booking(models.Model):
     ]
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
     slot = models.ForeignKey(ParkingSlot, on_delete=models.SET_NULL, null=True, blank=True)
+    facility = models.ForeignKey(Facility, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings')
     vehicle_number = models.CharField(max_length=20)
+    plate_key = models.CharField(max_length=20, blank=True, editable=False)  # see api.utils.plates
     eta = models.DateTimeField()
     reserved_from = models.DateTimeField(null=True, blank=True)
     reserved_until = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # per-slot window overlap checks, see api.utils.reservations
+            models.Index(fields=['slot', 'reserved_from', 'reserved_until'], name='booking_slot_window_idx'),
+            models.Index(fields=['plate_key', 'status'], name='booking_plate_status_idx'),
+            models.Index(fields=['status', 'reserved_until'], name='booking_status_until_idx'),  # expiry sweep
+            # BookingViewSet.list keyset pages, optionally filtered by status
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created_idx'),
+            models.Index(fields=['user', 'status', 'created_at', 'id'], name='booking_user_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.plate_key = plate_key(self.vehicle_number)
+        if self.facility_id is None and self.slot_id:
+            self.facility_id = self.slot.facility_id
+        super().save(*args, **kwargs)
+        plate_index.add(self.plate_key)
+
     def __str__(self):
         return f"Booking {self.id} - {self.vehicle_number} - {self.status}"
 
 class VehicleLog(models.Model):
     vehicle_number = models.CharField(max_length=20)
+    plate_key = models.CharField(max_length=20, blank=True, editable=False)  # see api.utils.plates
     slot = models.ForeignKey(ParkingSlot, on_delete=models.SET_NULL, null=True, blank=True)
     entry_ts = models.DateTimeField(null=True, blank=True)
     exit_ts = models.DateTimeField(null=True, blank=True)
@@ -50,15 +160,108 @@ class VehicleLog(models.Model):
     plate_image = models.ImageField(upload_to='plates/', null=True, blank=True)
     ocr_text = models.CharField(max_length=200, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['plate_key', '-entry_ts'], name='vehiclelog_plate_entry_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.plate_key = plate_key(self.vehicle_number)
+        super().save(*args, **kwargs)
+        plate_index.add(self.plate_key)
+
     def __str__(self):
         status = "in" if self.entry_ts and not self.exit_ts else "out"
         return f"{self.vehicle_number} ({status})"
 
 class SensorEvent(models.Model):
-    slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='sensor_events')
+    # no db constraints: a facility's sensor tables may live on their own database (api.routers)
+    slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='sensor_events', db_constraint=False)
+    facility = models.ForeignKey(Facility, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
     sensor_type = models.CharField(max_length=20)   # e.g., 'ultrasonic'
     value = models.FloatField()
-    ts = models.DateTimeField(auto_now_add=True)
+    ts = models.DateTimeField(default=timezone.now)  # gateways may send the reading time
+
+    class Meta:
+        indexes = [
+            # newest-first window rebuilds in api.utils.debounce
+            models.Index(fields=['slot', 'sensor_type', '-ts'], name='sensorevent_slot_type_ts_idx'),
+            models.Index(fields=['facility', 'ts'], name='sensorevent_facility_ts_idx'),  # rollups and retention
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.facility_id is None:
+            self.facility_id = self.slot.facility_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"SensorEvent {self.slot.label} {self.sensor_type} {self.value} at {self.ts}"
+
+class SensorDevice(models.Model):
+    """a sensor or gateway allowed to post readings; only a hash of its key is stored (see api.utils.devices)"""
+    name = models.CharField(max_length=50, unique=True)
+    key_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)  # sha256 hex
+    slots = models.ManyToManyField(ParkingSlot, blank=True, related_name='sensor_devices')  # none = any slot
+    is_active = models.BooleanField(default=True)
+    rate_limit = models.FloatField(null=True, blank=True)  # requests per second, default SENSOR_DEVICE_RATE
+    burst = models.PositiveIntegerField(null=True, blank=True)  # default SENSOR_DEVICE_BURST
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class SensorRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('minute','Minute'),
+        ('hour','Hour'),
+    ]
+    slot = models.ForeignKey(ParkingSlot, on_delete=models.CASCADE, related_name='sensor_rollups', db_constraint=False)
+    facility = models.ForeignKey(Facility, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
+    sensor_type = models.CharField(max_length=20)
+    granularity = models.CharField(max_length=6, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()   # bucket start
+    count = models.IntegerField()
+    occupied_count = models.IntegerField()   # readings below OCCUPIED_THRESHOLD_CM
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    mean_value = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['slot', 'sensor_type', 'granularity', 'bucket'], name='sensorrollup_unique_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['facility', 'granularity', 'bucket'], name='sensorrollup_fac_bucket_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.facility_id is None:
+            self.facility_id = self.slot.facility_id
+        super().save(*args, **kwargs)
+
+    @property
+    def occupied_fraction(self):
+        return self.occupied_count / self.count if self.count else None
+
+    def __str__(self):
+        return f"SensorRollup {self.slot_id} {self.sensor_type} {self.granularity} {self.bucket}"
+
+class OcrJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued','Queued'),
+        ('running','Running'),
+        ('done','Done'),
+        ('failed','Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    image_path = models.CharField(max_length=255, blank=True)   # relative to MEDIA_ROOT; blank if not stored
+    plate_text = models.CharField(max_length=200, null=True, blank=True)
+    vehicle_log = models.ForeignKey(VehicleLog, on_delete=models.SET_NULL, null=True, blank=True, related_name='ocr_jobs')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"OcrJob {self.id} - {self.status}"
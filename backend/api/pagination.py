@@ -0,0 +1,79 @@
+"""
+Keyset (cursor) pagination, newest first.
+
+Pages are ordered by (-<ordering_field>, -id) and the cursor carries the
+(ordering_field, id) of the row at the page edge, so fetching page N is one
+index range scan of page_size + 1 rows however deep N is, and rows inserted
+while a client is paging don't shift or repeat entries the way OFFSET does.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    ordering_field = 'created_at'
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def _page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj, reverse):
+        position = {'t': getattr(obj, self.ordering_field).isoformat(), 'i': obj.pk, 'r': int(reverse)}
+        token = base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """(value, pk, reverse) or None for the first page"""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token.encode()))
+            value = parse_datetime(position['t'])
+            if value is None:
+                raise ValueError
+            return value, int(position['i']), bool(position['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        size = self._page_size(request)
+        cursor = self.decode_cursor(request)
+        f = self.ordering_field
+        reverse = bool(cursor and cursor[2])
+        if cursor:
+            value, pk, _ = cursor
+            op = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(Q(**{f'{f}__{op}': value}) | Q(**{f: value, f'pk__{op}': pk}))
+        ordering = (f, 'pk') if reverse else (f'-{f}', '-pk')
+        rows = list(queryset.order_by(*ordering)[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+        # (going backwards, "more" lies before this page; the cursor we came from lies after it)
+        self.next_url = self.previous_url = None
+        if rows:
+            if (has_more if not reverse else cursor is not None):
+                self.next_url = self.encode_cursor(rows[-1], reverse=False)
+            if (has_more if reverse else cursor is not None):
+                self.previous_url = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_url, 'previous': self.previous_url, 'results': data})
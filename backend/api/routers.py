@@ -0,0 +1,62 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .utils import facilities, replicas
+
+
+class FacilityRouter:
+    """
+    places SensorEvent / SensorRollup rows on their facility's database (FACILITY_DATABASES,
+    see api.utils.facilities); every other model stays on 'default'.
+    reads only follow an instance hint - querysets must say .using(facilities.telemetry_db(...))
+    """
+    def _telemetry(self, model):
+        # (a model class or instance)
+        return model._meta.app_label == 'api' and model._meta.model_name in facilities.TELEMETRY_MODELS
+
+    def _route(self, model, hints):
+        instance = hints.get('instance')
+        if self._telemetry(model) and getattr(instance, 'facility_id', None) is not None:
+            return facilities.telemetry_db(instance.facility_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # sensor rows point at slots / facilities on 'default' (no db constraints)
+        if self._telemetry(obj1) or self._telemetry(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in facilities.FACILITY_DATABASES.values():
+            return None
+        return app_label == 'api' and model_name in facilities.TELEMETRY_MODELS
+
+
+class ReplicaRouter:
+    """
+    sends reads to a replica inside replicas.reads() unless the client is pinned to the primary;
+    writes go to 'default' and pin the rest of the request (see api.utils.replicas)
+    """
+    def db_for_read(self, model, **hints):
+        return replicas.read_db()
+
+    def db_for_write(self, model, **hints):
+        replicas.wrote()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a replica holds the same rows as the primary
+        primary = {DEFAULT_DB_ALIAS, *replicas.REPLICA_DATABASES}
+        if obj1._state.db in primary and obj2._state.db in primary:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas.REPLICA_DATABASES:
+            return False  # replicated from the primary
+        return None
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import ParkingSlot, SlotStatus, Booking, VehicleLog, SensorEvent
+from .models import Facility, ParkingSlot, SlotStatus, Booking, VehicleLog, SensorEvent, OcrJob
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,7 +11,8 @@ class ParkingSlotSerializer(serializers.ModelSerializer):
     status = serializers.SerializerMethodField()
     class Meta:
         model = ParkingSlot
-        fields = ['id','label','zone','max_vehicle_type','is_active','status']
+        fields = ['id','facility','label','zone','max_vehicle_type','is_active','status']
+        read_only_fields = ['facility']  # a slot never changes facility, see ParkingSlot.save
 
     def get_status(self, obj):
         try:
@@ -30,13 +31,19 @@ class BookingSerializer(serializers.ModelSerializer):
     slot_label = serializers.CharField(source='slot.label', read_only=True)
     class Meta:
         model = Booking
-        fields = ['id','user','slot','slot_label','vehicle_number','eta','reserved_from','reserved_until','status','created_at']
-        read_only_fields = ['user','created_at','reserved_from','reserved_until','status','slot']
+        fields = ['id','user','facility','slot','slot_label','vehicle_number','eta','reserved_from','reserved_until','status','created_at']
+        read_only_fields = ['user','facility','created_at','reserved_from','reserved_until','status','slot']
 
 class BookingCreateSerializer(serializers.ModelSerializer):
+    # allocation preferences, see api.utils.allocation
+    zone = serializers.CharField(required=False, write_only=True)
+    vehicle_type = serializers.CharField(required=False, write_only=True)
+    facility = serializers.SlugRelatedField(slug_field='code', queryset=Facility.objects.filter(is_active=True),
+                                            required=False)
     class Meta:
         model = Booking
-        fields = ['vehicle_number','eta','slot']  # slot optional; allocation logic in view
+        fields = ['id','vehicle_number','eta','slot','facility','zone','vehicle_type']  # slot optional; allocation logic in view
+        read_only_fields = ['id']
 
 class VehicleLogSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,3 +54,8 @@ class SensorEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = SensorEvent
         fields = ['id','slot','sensor_type','value','ts']
+
+class OcrJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OcrJob
+        fields = ['id','status','image_path','plate_text','vehicle_log','error','created_at','started_at','finished_at']
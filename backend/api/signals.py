@@ -0,0 +1,58 @@
+"""
+slot_status_changed is sent whenever a SlotStatus row changes status, inside the
+transaction that changed it:
+
+    changes = [(slot_id, old_status, new_status), ...]   # old_status is None for a new row
+
+SlotStatus.save() sends it automatically; code that changes status with
+update()/bulk_update() must send it itself. Receivers that talk to anything
+outside the database should defer the work with transaction.on_commit.
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+slot_status_changed = Signal()
+
+
+@receiver(slot_status_changed)
+def invalidate_slot_snapshot(sender, **kwargs):
+    from .utils import slot_snapshot
+    transaction.on_commit(slot_snapshot.invalidate)
+
+
+@receiver([post_save, post_delete], sender='api.ParkingSlot')
+def invalidate_slot_snapshot_on_slot_change(sender, **kwargs):
+    from .utils import slot_snapshot
+    transaction.on_commit(slot_snapshot.invalidate)
+
+
+@receiver(slot_status_changed)
+def stream_slot_changes(sender, changes, **kwargs):
+    from .utils import slot_stream
+    transaction.on_commit(lambda: slot_stream.publish(changes))
+
+
+@receiver([post_save, post_delete], sender='api.SensorDevice')
+@receiver(m2m_changed, sender='api.SensorDevice_slots')
+def forget_device_credentials(sender, **kwargs):
+    from .utils import devices
+    transaction.on_commit(devices.forget)
+
+
+@receiver(slot_status_changed)
+def count_zone_availability(sender, changes, **kwargs):
+    from .utils import zones
+    zones.apply(changes)  # in the transaction of the change, so the counters commit or roll back with it
+
+
+@receiver(post_save, sender='api.ParkingSlot')
+def recount_zones_on_slot_change(sender, instance, **kwargs):
+    from .utils import zones
+    zones.slot_changed(instance)
+
+
+@receiver(post_delete, sender='api.ParkingSlot')
+def recount_zones_on_slot_delete(sender, instance, **kwargs):
+    from .utils import zones
+    zones.slot_changed(instance, deleted=True)
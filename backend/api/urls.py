@@ -1,17 +1,25 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SlotViewSet, BookingViewSet, sensor_event, ocr_plate, vehicle_entry, vehicle_exit, LoginView, LogoutView
+from .views import SlotViewSet, slot_status_stream, BookingViewSet, sensor_event, sensor_event_batch, ocr_plate, ocr_job_status, vehicle_entry, vehicle_exit, occupancy_analytics, zone_availability, export_history, LoginView, LogoutView
 
 router = DefaultRouter()
 router.register(r'slots', SlotViewSet, basename='slots')
 router.register(r'bookings', BookingViewSet, basename='bookings')
 
 urlpatterns = [
+    path('slots/stream/', slot_status_stream, name='slot_stream'),  # before the router's slots/<pk>/
     path('', include(router.urls)),
+    path('zones/availability/', zone_availability, name='zone_availability'),
     path('sensors/event/', sensor_event, name='sensor_event'),
+    path('sensors/event/batch/', sensor_event_batch, name='sensor_event_batch'),
     path('ocr/plate/', ocr_plate, name='ocr_plate'),
+    path('ocr/jobs/<uuid:job_id>/', ocr_job_status, name='ocr_job_status'),
     path('vehicle/entry/', vehicle_entry, name='vehicle_entry'),
     path('vehicle/exit/', vehicle_exit, name='vehicle_exit'),
+    path('analytics/occupancy/', occupancy_analytics, name='occupancy_analytics'),
+    path('exports/<slug:kind>/', export_history, name='export_history'),
     path('auth/login/', LoginView.as_view(), name='api_login'),
     path('auth/logout/', LogoutView.as_view(), name='api_logout'),
 ]
@@ -0,0 +1,78 @@
+"""
+Slot allocation that stays correct under a burst of concurrent bookings.
+
+A slot is claimed with a conditional UPDATE (status 'free' -> 'reserved'), so two
+requests can never reserve the same row. Where the backend supports it the
+candidate rows are also locked with SELECT ... FOR UPDATE SKIP LOCKED, so
+concurrent transactions walk past each other's rows instead of queueing on one.
+Each attempt takes a small window of candidates in random order rather than
+always the first free row, which keeps workers off a single hot row.
+Scans are scoped to one facility when given, through the (facility, status) index.
+"""
+import random
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from ..models import SlotStatus
+from ..signals import slot_status_changed
+
+CANDIDATE_WINDOW = getattr(settings, 'ALLOCATION_CANDIDATE_WINDOW', 16)
+MAX_ATTEMPTS = getattr(settings, 'ALLOCATION_MAX_ATTEMPTS', 5)
+
+
+class NoFreeSlot(Exception):
+    pass
+
+
+def free_slots(zone=None, vehicle_type=None, slot_id=None, busy=None, facility=None):
+    qs = SlotStatus.objects.filter(status='free', slot__is_active=True)
+    if facility:
+        qs = qs.filter(facility_id=facility)
+    if busy is not None:
+        # busy: Booking queryset (e.g. overlapping windows) whose slots are skipped
+        qs = qs.filter(~Exists(busy.filter(slot=OuterRef('slot'))))
+    if zone:
+        qs = qs.filter(slot__zone=zone)
+    if vehicle_type:
+        qs = qs.filter(slot__max_vehicle_type=vehicle_type)
+    if slot_id:
+        qs = qs.filter(slot_id=slot_id)
+    return qs
+
+
+def _claim(qs):
+    features = connection.features
+    for _ in range(MAX_ATTEMPTS):
+        with transaction.atomic():
+            rows = qs
+            if features.has_select_for_update_skip_locked:
+                of = ('self',) if features.has_select_for_update_of else ()
+                rows = rows.select_for_update(skip_locked=True, of=of)
+            ids = list(rows.values_list('pk', flat=True)[:CANDIDATE_WINDOW])
+            if not ids:
+                return None
+            random.shuffle(ids)
+            for pk in ids:
+                # the status guard makes the claim atomic even without row locks
+                if SlotStatus.objects.filter(pk=pk, status='free').update(status='reserved', last_update=timezone.now()):
+                    ss = SlotStatus.objects.select_related('slot').get(pk=pk)
+                    slot_status_changed.send(sender=SlotStatus, changes=[(ss.slot_id, 'free', 'reserved')])
+                    return ss
+    return None
+
+
+def claim_slot(zone=None, vehicle_type=None, slot_id=None, busy=None, facility=None):
+    """
+    reserve a free slot and return its SlotStatus.
+    zone is a preference (falls back to any zone); vehicle_type, slot_id and facility (id) must match.
+    call inside the caller's transaction so the claim rolls back with it. raises NoFreeSlot.
+    """
+    scopes = [zone, None] if zone and not slot_id else [zone]
+    for scope in scopes:
+        ss = _claim(free_slots(scope, vehicle_type, slot_id, busy, facility))
+        if ss:
+            return ss
+    raise NoFreeSlot()
@@ -0,0 +1,192 @@
+"""
+Occupancy analytics for capacity planning.
+
+Per facility and zone (both optional) and date range, at hour or day granularity:
+  occupancy         occupied slot-seconds / (active slots * bucket seconds), from VehicleLog stays
+  peak_utilization  most slots occupied at once within the bucket / active slots
+  avg_dwell_s       mean stay of the vehicles that entered in the bucket (completed stays only)
+  sensor_occupancy  share of sensor readings below the occupied threshold, from the hourly SensorRollup rows
+
+Stays are loaded as flat float64 epoch-second columns (the epoch conversion
+runs in the database) and aggregated with NumPy: occupancy integrates a
++1/-1 event sweep per bucket with bincount, peaks use maximum.reduceat over
+the same sweep. Results are cached per (facility, zone, range, granularity); ranges
+reaching into the last hour get a short TTL since they are still changing.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import FloatField, Func
+from django.utils import timezone
+
+from ..models import Facility, ParkingSlot, SensorRollup, VehicleLog
+from . import facilities
+
+ANALYTICS_CACHE_TTL = getattr(settings, 'ANALYTICS_CACHE_TTL', 3600)
+ANALYTICS_LIVE_CACHE_TTL = getattr(settings, 'ANALYTICS_LIVE_CACHE_TTL', 60)
+ANALYTICS_MAX_DAYS = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+GRANULARITY_SECONDS = {'hour': 3600, 'day': 86400}
+
+
+class Epoch(Func):
+    """seconds since 1970-01-01 UTC of a datetime expression, as a float"""
+    output_field = FloatField()
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)',
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)', **extra_context)
+
+
+def _column(qs, *fields):
+    """
+    rows of qs.values_list(*fields) as a (n, len(fields)) float64 array (NULL -> nan), fetched
+    straight from the cursor; epochs are rounded to the millisecond (julianday isn't exact)
+    """
+    sql, params = qs.values_list(*fields).query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return np.round(np.array(rows, dtype=np.float64).reshape(len(rows), len(fields)), 3)
+
+
+def _dt(epoch):
+    return datetime.fromtimestamp(float(epoch), tz=dt_timezone.utc)
+
+
+def _floor(ts, granularity):
+    ts = ts.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if granularity == 'day' else ts
+
+
+def _stays(facility_id, zone, start, end):
+    """(entry, exit) epochs of stays overlapping [start, end); exit is nan while the vehicle is still parked"""
+    qs = VehicleLog.objects.filter(slot__isnull=False, entry_ts__lt=end).exclude(exit_ts__lte=start)
+    if facility_id:
+        qs = qs.filter(slot__facility_id=facility_id)
+    if zone:
+        qs = qs.filter(slot__zone=zone)
+    return _column(qs.annotate(entry_s=Epoch('entry_ts'), exit_s=Epoch('exit_ts')), 'entry_s', 'exit_s')
+
+
+def _sweep(entries, exits, edges):
+    """
+    occupied slot-seconds and peak concurrency per bucket (edges: n+1 bucket boundaries)
+    for [entry, exit) intervals already clipped to [edges[0], edges[-1]]
+    """
+    n = len(edges) - 1
+    times = np.concatenate([exits, entries, edges])
+    deltas = np.concatenate([np.full(len(exits), -1), np.ones(len(entries), dtype=np.int64),
+                             np.zeros(len(edges), dtype=np.int64)])
+    # at equal times exits sort before entries, so a swap at a slot is never a spurious peak
+    order = np.lexsort((deltas, times))
+    times, level = times[order], np.cumsum(deltas[order])
+    # segment i runs from times[i] to times[i + 1] at level[i]
+    seg_bucket = np.searchsorted(edges, times[:-1], side='right') - 1
+    inside = seg_bucket < n  # drops the zero-length tail at the last edge
+    seg_bucket, seg_level = seg_bucket[inside], level[:-1][inside]
+    area = np.bincount(seg_bucket, weights=seg_level * np.diff(times)[inside], minlength=n)
+    # every bucket has a segment starting at its own edge, so no reduceat group is empty
+    peak = np.maximum.reduceat(seg_level, np.searchsorted(seg_bucket, np.arange(n)))
+    return area, peak
+
+
+def _sensor_series(facility_id, zone, edges):
+    # rollups may sit on per-facility databases, so no join to ParkingSlot: zones become slot id lists
+    ids = [facility_id] if facility_id else list(Facility.objects.values_list('pk', flat=True))
+    parts = [np.empty((0, 3))]
+    for db, facility_ids in facilities.telemetry_databases(ids).items():
+        qs = SensorRollup.objects.using(db).filter(facility_id__in=facility_ids, granularity='hour',
+                                                   bucket__gte=_dt(edges[0]), bucket__lt=_dt(edges[-1]))
+        if zone:
+            qs = qs.filter(slot_id__in=list(ParkingSlot.objects.filter(facility_id__in=facility_ids, zone=zone)
+                                            .values_list('pk', flat=True)))
+        parts.append(_column(qs.annotate(bucket_s=Epoch('bucket')), 'bucket_s', 'count', 'occupied_count'))
+    data = np.concatenate(parts)
+    n = len(edges) - 1
+    idx = np.searchsorted(edges, data[:, 0], side='right') - 1
+    readings = np.bincount(idx, weights=data[:, 1], minlength=n)
+    occupied = np.bincount(idx, weights=data[:, 2], minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(readings > 0, occupied / readings, np.nan)
+
+
+def _num(x, digits=4):
+    return None if x is None or not np.isfinite(x) else round(float(x), digits)
+
+
+def compute(zone, start, end, granularity='hour', now=None, facility_id=None):
+    now = now or timezone.now()
+    step = GRANULARITY_SECONDS[granularity]
+    t0 = _floor(start, granularity).timestamp()
+    n = max(1, math.ceil((end.timestamp() - t0) / step))
+    edges = t0 + step * np.arange(n + 1, dtype=np.float64)
+
+    slots = ParkingSlot.objects.filter(is_active=True)
+    if facility_id:
+        slots = slots.filter(facility_id=facility_id)
+    if zone:
+        slots = slots.filter(zone=zone)
+    capacity = slots.count()
+
+    stays = _stays(facility_id, zone, _dt(edges[0]), _dt(edges[-1]))
+    entry, exit_ = stays[:, 0], stays[:, 1]
+    done = ~np.isnan(exit_)
+    # vehicles still parked count as occupying until now
+    until = np.maximum(np.where(done, exit_, now.timestamp()), entry)
+    area, peak = _sweep(np.clip(entry, edges[0], edges[-1]), np.clip(until, edges[0], edges[-1]), edges)
+
+    # dwell: completed stays, attributed to the bucket they entered in
+    entered = (entry >= edges[0]) & (entry < edges[-1])
+    completed = entered & done
+    entry_bucket = np.searchsorted(edges, entry, side='right') - 1
+    entries = np.bincount(entry_bucket[entered], minlength=n)
+    dwell_n = np.bincount(entry_bucket[completed], minlength=n)
+    dwell_sum = np.bincount(entry_bucket[completed], weights=(exit_ - entry)[completed], minlength=n)
+
+    sensor = _sensor_series(facility_id, zone, edges)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        occupancy = area / (capacity * np.diff(edges)) if capacity else np.full(n, np.nan)
+        utilization = peak / capacity if capacity else np.full(n, np.nan)
+        dwell = np.where(dwell_n > 0, dwell_sum / dwell_n, np.nan)
+
+    buckets = [{'start': _dt(edges[i]).isoformat(), 'occupancy': _num(occupancy[i]),
+                'peak_utilization': _num(utilization[i]), 'entries': int(entries[i]),
+                'avg_dwell_s': _num(dwell[i], 1), 'sensor_occupancy': _num(sensor[i])}
+               for i in range(n)]
+    top = int(np.argmax(peak)) if n else 0
+    return {
+        'facility': facility_id, 'zone': zone or None, 'granularity': granularity, 'slots': capacity,
+        'from': _dt(edges[0]).isoformat(), 'until': _dt(edges[-1]).isoformat(),
+        'summary': {
+            'occupancy': _num(area.sum() / (capacity * (edges[-1] - edges[0]))) if capacity else None,
+            'peak_utilization': _num(utilization[top]) if n else None,
+            'peak_at': _dt(edges[top]).isoformat() if n and peak[top] else None,
+            'entries': int(entries.sum()),
+            'avg_dwell_s': _num(dwell_sum.sum() / dwell_n.sum(), 1) if dwell_n.sum() else None,
+        },
+        'buckets': buckets,
+    }
+
+
+def occupancy(zone, start, end, granularity='hour', facility_id=None):
+    """cached compute(); raises ValueError for a bad range or granularity"""
+    if granularity not in GRANULARITY_SECONDS:
+        raise ValueError('granularity must be hour or day')
+    if not start < end or end - start > timedelta(days=ANALYTICS_MAX_DAYS):
+        raise ValueError(f'from must be before until, at most {ANALYTICS_MAX_DAYS} days apart')
+    now = timezone.now()
+    key = f'analytics:occupancy:{facility_id or "*"}:{zone or "*"}:{start.timestamp():.0f}:{end.timestamp():.0f}:{granularity}'
+    result = cache.get(key)
+    if result is None:
+        result = compute(zone, start, end, granularity, now, facility_id)
+        live = end > now - timedelta(hours=1)
+        cache.set(key, result, ANALYTICS_LIVE_CACHE_TTL if live else ANALYTICS_CACHE_TTL)
+    return result
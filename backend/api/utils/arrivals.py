@@ -0,0 +1,38 @@
+"""
+Matching a recognised plate to its booking at the entry barrier.
+
+Shared by vehicle_entry (plate known inline) and the OCR job pipeline (plate
+known once the job finishes).
+"""
+from ..models import Booking, SlotStatus
+from . import plates
+
+
+def match_booking(plate_text):
+    """
+    newest active booking for this vehicle (normalised plate match, or a fuzzy match that
+    only one active booking is that close to), or None
+    """
+    return plates.match(Booking.objects.filter(status='active').order_by('-created_at'), plate_text, unique=True)
+
+
+def record_arrival(vl, plate_text):
+    """
+    attach a recognised plate to a VehicleLog; if an active booking matches,
+    link it and mark its slot occupied. returns the booking (or None).
+    """
+    vl.ocr_text = plate_text
+    if not vl.vehicle_number or vl.vehicle_number == 'UNKNOWN':
+        vl.vehicle_number = plate_text
+    booking = vl.booking or match_booking(plate_text)
+    vl.booking = booking
+    vl.save()
+    # if booking exists, mark slot as occupied
+    if booking:
+        booking.status = 'active'
+        booking.save()
+        if booking.slot:
+            ss, _ = SlotStatus.objects.get_or_create(slot=booking.slot)
+            ss.status = 'occupied'
+            ss.save()
+    return booking
@@ -0,0 +1,136 @@
+"""
+Debounce engine for slot sensors.
+
+The last N occupied/not-occupied votes per (slot, sensor_type) live in the
+Django cache, so every gunicorn worker shares the same window (settings
+require redis unless DEBUG is on). On redis a window is a list that one Lua
+script appends to, trims and reads, so readings of the same slot handled by
+different workers at the same moment are all counted. A window is rebuilt
+from the newest SensorEvent rows only when it is missing from the cache (cold
+start / eviction), so a status decision normally needs nothing but the new
+reading. The process-local fallback (LocMemCache, development only)
+serialises updates with a lock.
+
+Window size and vote count default to SENSOR_DEBOUNCE['window'/'votes'] and can
+be overridden per zone or per slot label. Zones and labels are only unique
+within a facility, so overrides are keyed '<facility code>:<zone or label>'
+(a key without a code means the main facility):
+
+    SENSOR_DEBOUNCE = {
+        'window': 5, 'votes': 3,
+        'zones': {'main:B': {'window': 7, 'votes': 4}},
+        'slots': {'north:A12': {'votes': 2}},
+    }
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+from ..models import DEFAULT_FACILITY_CODE, Facility, SensorEvent
+from . import facilities
+
+DEBOUNCE_CONFIG = getattr(settings, 'SENSOR_DEBOUNCE', {})
+OCCUPIED_THRESHOLD_CM = getattr(settings, 'OCCUPIED_THRESHOLD_CM', 40)  # <40cm => occupied
+DEBOUNCE_CACHE = getattr(settings, 'SENSOR_DEBOUNCE_CACHE', 'default')
+WINDOW_TTL = DEBOUNCE_CONFIG.get('ttl', 24 * 3600)  # idle windows are rebuilt from the db
+
+# KEYS[1] the window; ARGV: size, ttl, number of seed votes (-1: none, return nil if the window is
+# missing), the seed votes, then the new votes - all '1' (occupied) or '0'
+OBSERVE_SCRIPT = """
+local seeded = tonumber(ARGV[3])
+if redis.call('exists', KEYS[1]) == 0 then
+    if seeded < 0 then return false end
+    for i = 4, 3 + seeded do redis.call('rpush', KEYS[1], ARGV[i]) end
+end
+for i = 4 + math.max(seeded, 0), #ARGV do redis.call('rpush', KEYS[1], ARGV[i]) end
+redis.call('ltrim', KEYS[1], -tonumber(ARGV[1]), -1)
+redis.call('expire', KEYS[1], ARGV[2])
+return redis.call('lrange', KEYS[1], 0, -1)
+"""
+
+_local_lock = threading.Lock()
+_script = None
+_facility_codes = {}  # facility id -> code, for override keys (codes don't change)
+
+
+def _override(kind, slot, name):
+    overrides = DEBOUNCE_CONFIG.get(kind)
+    if not overrides:
+        return {}
+    code = _facility_codes.get(slot.facility_id)
+    if code is None:
+        code = _facility_codes[slot.facility_id] = Facility.objects.values_list('code', flat=True).get(
+            pk=slot.facility_id)
+    found = overrides.get(f'{code}:{name}', {})
+    if not found and code == DEFAULT_FACILITY_CODE:
+        found = overrides.get(name, {})
+    return found
+
+
+def debounce_params(slot):
+    """
+    (window, votes) for a slot; slot overrides win over zone overrides, both only within the slot's facility
+    """
+    params = {'window': DEBOUNCE_CONFIG.get('window', 5), 'votes': DEBOUNCE_CONFIG.get('votes', 3)}
+    params.update(_override('zones', slot, slot.zone))
+    params.update(_override('slots', slot, slot.label))
+    return params['window'], params['votes']
+
+
+def _window_key(slot_id, sensor_type):
+    return f'debounce:{slot_id}:{sensor_type}'
+
+
+def _load_window(slot, sensor_type, size):
+    values = (SensorEvent.objects.using(facilities.telemetry_db(slot.facility_id))
+              .filter(slot_id=slot.id, sensor_type=sensor_type)
+              .order_by('-ts', '-id').values_list('value', flat=True)[:size])
+    return [v < OCCUPIED_THRESHOLD_CM for v in reversed(values)]
+
+
+def _observe_redis(cache, key, slot, sensor_type, size, votes):
+    global _script
+    key = cache.make_and_validate_key(key)
+    client = cache._cache.get_client(key, write=True)
+    if _script is None:
+        _script = client.register_script(OBSERVE_SCRIPT)
+    new = ['1' if v else '0' for v in votes]
+    window = _script(keys=[key], args=[size, WINDOW_TTL, -1, *new], client=client)
+    if window is None:  # cold: seed from the db; a worker that seeded first wins, its window is kept
+        seed = ['1' if v else '0' for v in _load_window(slot, sensor_type, size)]
+        window = _script(keys=[key], args=[size, WINDOW_TTL, len(seed), *seed, *new], client=client)
+    return [v == b'1' for v in window]
+
+
+def _observe_local(cache, key, slot, sensor_type, size, votes):
+    with _local_lock:
+        window = cache.get(key)
+        if window is None:
+            window = _load_window(slot, sensor_type, size)
+        window = (window + votes)[-size:]
+        cache.set(key, window, WINDOW_TTL)
+    return window
+
+
+def observe(slot, sensor_type, values):
+    """
+    push new readings (oldest first) into the slot's window and return the debounced status.
+    must be called before the readings are written to SensorEvent, otherwise a cold
+    rebuild would count them twice.
+    """
+    size, votes = debounce_params(slot)
+    cache = caches[DEBOUNCE_CACHE]
+    key = _window_key(slot.id, sensor_type)
+    new = [float(v) < OCCUPIED_THRESHOLD_CM for v in values]
+    if isinstance(cache, RedisCache):
+        window = _observe_redis(cache, key, slot, sensor_type, size, new)
+    else:
+        window = _observe_local(cache, key, slot, sensor_type, size, new)
+    return 'occupied' if sum(window) >= votes else 'free'
+
+
+def reset(slot_id, sensor_type):
+    """drop a cached window, e.g. after a sensor was replaced"""
+    caches[DEBOUNCE_CACHE].delete(_window_key(slot_id, sensor_type))
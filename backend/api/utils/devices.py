@@ -0,0 +1,160 @@
+"""
+Sensor device credentials.
+
+Every sensor (or gateway) gets its own key; only its sha256 is stored on the
+SensorDevice row, with the slots the device may report for (none = any slot)
+and an optional rate. Keys are issued with `manage.py issue_device_key` or from
+the admin and shown once.
+
+authenticate() keeps the credential for a key hash in a small in-process LRU
+for SENSOR_DEVICE_CACHE_TTL seconds - unknown keys included - so a warm sensor
+costs no query. Saving or deleting a device clears this process's cache; other
+processes pick up a revocation within the TTL.
+
+throttle() is a per-device token bucket (SENSOR_DEVICE_RATE requests a second,
+bursts of SENSOR_DEVICE_BURST) checked right after authentication, before any
+ORM work, so a runaway sensor is turned away for the price of a dict lookup.
+Buckets are per process: with N workers a device gets up to N times its rate.
+
+The old shared SENSOR_DEVICE_TOKEN authenticates only when set (it is empty
+by default), for any slot; the whole legacy fleet shares one bucket of
+SENSOR_DEVICE_LEGACY_RATE / SENSOR_DEVICE_LEGACY_BURST.
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from ..models import SensorDevice
+
+SENSOR_DEVICE_TOKEN = getattr(settings, 'SENSOR_DEVICE_TOKEN', '')
+SENSOR_DEVICE_RATE = getattr(settings, 'SENSOR_DEVICE_RATE', 5)
+SENSOR_DEVICE_BURST = getattr(settings, 'SENSOR_DEVICE_BURST', 20)
+SENSOR_DEVICE_LEGACY_RATE = getattr(settings, 'SENSOR_DEVICE_LEGACY_RATE', 50)
+SENSOR_DEVICE_LEGACY_BURST = getattr(settings, 'SENSOR_DEVICE_LEGACY_BURST', 200)
+SENSOR_DEVICE_CACHE_TTL = getattr(settings, 'SENSOR_DEVICE_CACHE_TTL', 60)
+SENSOR_DEVICE_CACHE_SIZE = getattr(settings, 'SENSOR_DEVICE_CACHE_SIZE', 4096)
+
+
+class Credential(namedtuple('Credential', 'device_id name slot_ids rate burst')):
+    """an authenticated device; slot_ids is None when it may report for any slot"""
+
+    def allows(self, slot_id):
+        if self.slot_ids is None:
+            return True
+        try:
+            return int(slot_id) in self.slot_ids
+        except (TypeError, ValueError):
+            return False
+
+
+LEGACY = Credential(None, 'legacy', None, SENSOR_DEVICE_LEGACY_RATE, SENSOR_DEVICE_LEGACY_BURST)
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_key(device):
+    """give the device a new random key (replacing any old one) and return it; only its hash is kept"""
+    key = secrets.token_urlsafe(24)
+    device.key_hash = hash_key(key)
+    device.save(update_fields=['key_hash'] if device.pk else None)
+    return key
+
+
+class CredentialCache:
+    """bounded LRU/TTL map of key hash -> Credential (or None for an unknown / inactive key)"""
+    def __init__(self, maxsize=SENSOR_DEVICE_CACHE_SIZE, ttl=SENSOR_DEVICE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key hash -> (expires, credential)
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        """(found, credential)"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(digest)
+                return True, entry[1]
+        return False, None
+
+    def store(self, digest, credential):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl, credential)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credentials = CredentialCache()
+
+
+def _load(digest):
+    device = (SensorDevice.objects.using(DEFAULT_DB_ALIAS).filter(key_hash=digest, is_active=True)
+              .prefetch_related('slots').first())
+    if device is None:
+        return None
+    slot_ids = frozenset(s.pk for s in device.slots.all()) or None
+    return Credential(device.pk, device.name, slot_ids,
+                      SENSOR_DEVICE_RATE if device.rate_limit is None else device.rate_limit,
+                      SENSOR_DEVICE_BURST if device.burst is None else device.burst)
+
+
+def authenticate(key):
+    """the Credential for a device key, or None"""
+    if not key or not isinstance(key, str):
+        return None
+    if SENSOR_DEVICE_TOKEN and hmac.compare_digest(key.encode(), SENSOR_DEVICE_TOKEN.encode()):
+        return LEGACY
+    digest = hash_key(key)
+    found, credential = credentials.get(digest)
+    if not found:
+        credential = _load(digest)
+        credentials.store(digest, credential)
+    return credential
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """0 if a token was taken, else seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+_buckets = {}  # device id -> TokenBucket
+_buckets_lock = threading.Lock()
+
+
+def throttle(credential):
+    """count one request against the device's bucket (the legacy key's is shared); 0 if allowed, else seconds to wait"""
+    with _buckets_lock:
+        bucket = _buckets.get(credential.device_id)
+        if bucket is None or (bucket.rate, bucket.burst) != (credential.rate, max(1, credential.burst)):
+            bucket = _buckets[credential.device_id] = TokenBucket(credential.rate, credential.burst)
+        return bucket.take(time.monotonic())
+
+
+def forget():
+    """drop this process's cached credentials, e.g. after a device was changed or revoked"""
+    credentials.clear()
@@ -0,0 +1,248 @@
+"""
+Write-behind persistence of raw SensorEvent rows.
+
+The slot status decision only needs the debounce window (api.utils.debounce),
+not the INSERT of the raw reading. With SENSOR_WRITE_BEHIND on, the sensor
+endpoints append readings to a per-process log under SENSOR_BUFFER_DIR (a
+local disk) and return; a background thread inserts them in large batches
+once SENSOR_BUFFER_FLUSH_SIZE rows are waiting or every
+SENSOR_BUFFER_FLUSH_SECONDS, through bulk_create or, on PostgreSQL, COPY.
+Each facility's rows go to its telemetry database. Off, write() inserts
+right away as before.
+
+Durability: a line is in the log (the OS page cache) before the request
+returns, so a crashed or killed worker loses nothing; SENSOR_BUFFER_FSYNC
+also survives a power cut, at one fsync per request. Every log segment is
+held under flock by the process writing it from before it gets its .log name,
+so recover() - run when a process starts buffering (retried by the flusher
+until it succeeds), and by `manage.py flush_sensor_buffer` - only replays
+segments whose writer has died. A crash between a flush's INSERT and
+the segment's removal replays that segment, so delivery is at least once.
+
+Readings still in the buffer are not in SensorEvent yet: a cold debounce
+window rebuild or a rollup can run up to one flush interval behind.
+"""
+import atexit
+import fcntl
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from ..models import SensorEvent
+from . import facilities, metrics
+
+SENSOR_WRITE_BEHIND = getattr(settings, 'SENSOR_WRITE_BEHIND', False)
+SENSOR_BUFFER_DIR = Path(getattr(settings, 'SENSOR_BUFFER_DIR', 'sensor_buffer'))
+SENSOR_BUFFER_FLUSH_SIZE = getattr(settings, 'SENSOR_BUFFER_FLUSH_SIZE', 500)
+SENSOR_BUFFER_FLUSH_SECONDS = getattr(settings, 'SENSOR_BUFFER_FLUSH_SECONDS', 1.0)
+SENSOR_BUFFER_FSYNC = getattr(settings, 'SENSOR_BUFFER_FSYNC', False)
+COPY_MIN_ROWS = 100  # below this a multi-row INSERT is as quick as COPY
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(connection, db, events):
+    """COPY the rows into the SensorEvent table (psycopg2 or psycopg 3)"""
+    meta = SensorEvent._meta
+    columns = [meta.get_field(name).column for name in ('slot', 'facility', 'sensor_type', 'value', 'ts')]
+    sql = 'COPY {} ({}) FROM STDIN'.format(connection.ops.quote_name(meta.db_table),
+                                           ', '.join(connection.ops.quote_name(c) for c in columns))
+    rows = [(e.slot_id, e.facility_id, e.sensor_type, e.value, e.ts) for e in events]
+    with transaction.atomic(using=db), connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2: text format
+            buf = io.StringIO()
+            for slot_id, facility_id, sensor_type, value, ts in rows:
+                sensor_type = (sensor_type.replace('\\', '\\\\').replace('\t', '\\t')
+                               .replace('\n', '\\n').replace('\r', '\\r'))
+                buf.write(f'{slot_id}\t{facility_id}\t{sensor_type}\t{value!r}\t{ts.isoformat()}\n')
+            buf.seek(0)
+            raw.copy_expert(sql, buf)
+        else:
+            with raw.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+
+def write(events):
+    """insert SensorEvents (facility_id set) now, each facility's into its telemetry database"""
+    by_db = {}
+    for e in events:
+        by_db.setdefault(facilities.telemetry_db(e.facility_id), []).append(e)
+    for db, batch in by_db.items():
+        connection = connections[db]
+        if connection.vendor == 'postgresql' and len(batch) >= COPY_MIN_ROWS:
+            _copy(connection, db, batch)
+        else:
+            SensorEvent.objects.using(db).bulk_create(batch, batch_size=1000)
+
+
+def _encode(e):
+    return json.dumps([e.slot_id, e.facility_id, e.sensor_type, e.value, e.ts.isoformat()]) + '\n'
+
+
+def _decode(line):
+    slot_id, facility_id, sensor_type, value, ts = json.loads(line)
+    return SensorEvent(slot_id=slot_id, facility_id=facility_id, sensor_type=sensor_type, value=value,
+                       ts=datetime.fromisoformat(ts))
+
+
+class WriteBehindBuffer:
+    """
+    Per-process buffer of SensorEvents backed by an append-only log. Rows are
+    appended to the open segment; a flush seals it, starts a new one, inserts the
+    sealed rows and deletes the segment. A segment whose insert fails is retried
+    on the next flush.
+    """
+    def __init__(self, directory=SENSOR_BUFFER_DIR, flush_size=SENSOR_BUFFER_FLUSH_SIZE,
+                 flush_seconds=SENSOR_BUFFER_FLUSH_SECONDS, fsync=SENSOR_BUFFER_FSYNC, background=True):
+        self.directory = Path(directory)
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.background = background
+        self._lock = threading.Lock()        # the open segment
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._wake = threading.Event()
+        self._pid = None
+        self._segment = None   # (path, file)
+        self._pending = []     # events in the open segment
+        self._sealed = []      # [(path, file, events)] waiting to be inserted
+        self.flushed = 0
+
+    def _open_segment(self):
+        path = self.directory / f'{socket.gethostname()}-{os.getpid()}-{time.time_ns()}.log'
+        # locked under a name recover() doesn't look at, then moved into place: a recover() running meanwhile
+        # must never see the segment unlocked and remove it from under us
+        tmp = path.with_suffix('.tmp')
+        f = open(tmp, 'a', encoding='utf-8')
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)  # held until the segment is flushed, see recover()
+        os.rename(tmp, path)
+        return path, f
+
+    def _start(self):
+        # first use in this process (or in a forked child: what the parent buffered is the parent's)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._pid = os.getpid()
+        self._segment = self._open_segment()
+        self._pending, self._sealed = [], []
+        if self.background:
+            threading.Thread(target=self._run, name='sensor-event-flusher', daemon=True).start()
+            atexit.register(self.flush)
+
+    def append(self, events):
+        data = ''.join(_encode(e) for e in events)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            f = self._segment[1]
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._pending.extend(events)
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+
+    def pending(self):
+        return len(self._pending) + sum(len(s[2]) for s in self._sealed)
+
+    def flush(self):
+        """insert everything buffered so far; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid():
+                    return 0
+                if self._pending:
+                    self._sealed.append(self._segment + (self._pending,))
+                    self._segment, self._pending = self._open_segment(), []
+            written = 0
+            while self._sealed:
+                path, f, events = self._sealed[0]
+                write(events)
+                # off the list before anything else can fail, so the rows are never inserted twice
+                self._sealed.pop(0)
+                written += len(events)
+                path.unlink(missing_ok=True)
+                f.close()
+            self.flushed += written
+            return written
+
+    def _run(self):
+        recovered = False
+        while True:
+            if not recovered:  # retried every pass until the database takes the leftovers
+                try:
+                    recover(self.directory)
+                    recovered = True
+                except Exception:
+                    logger.exception('sensor buffer recovery failed; retrying in %ss', self.flush_seconds)
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('sensor event flush failed; retrying in %ss', self.flush_seconds)
+
+
+def recover(directory=SENSOR_BUFFER_DIR):
+    """insert the rows of segments left behind by dead processes; returns the number of rows written"""
+    written = 0
+    for path in Path(directory).glob('*.tmp'):  # a process died while opening a segment: nothing in it yet
+        try:
+            with open(path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                path.unlink(missing_ok=True)
+        except (BlockingIOError, FileNotFoundError):
+            pass
+    for path in sorted(Path(directory).glob('*.log')):
+        try:
+            f = open(path, 'r+', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # its process is alive and will flush it
+            try:
+                if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                    continue  # replayed and removed by someone else meanwhile
+            except FileNotFoundError:
+                continue
+            events = []
+            for line in f:
+                try:
+                    events.append(_decode(line))
+                except ValueError:
+                    pass  # a line torn by the crash
+            write(events)
+            path.unlink(missing_ok=True)
+            written += len(events)
+    return written
+
+
+buffer = WriteBehindBuffer()
+
+metrics.Callback('parking_sensor_buffer_rows', 'Raw sensor readings waiting in the write-behind buffer.',
+                 buffer.pending)
+metrics.Callback('parking_sensor_buffer_flushed_total', 'Raw sensor readings flushed from the write-behind buffer.',
+                 lambda: buffer.flushed, 'counter')
+
+
+def save(events):
+    """persist raw readings: into the write-behind buffer when SENSOR_WRITE_BEHIND is on, else right away"""
+    if SENSOR_WRITE_BEHIND:
+        buffer.append(events)
+    else:
+        write(events)
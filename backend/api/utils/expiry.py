@@ -0,0 +1,71 @@
+"""
+Releasing no-show reservations.
+
+A booking whose reserved_until has passed without the vehicle arriving (no
+VehicleLog linked to it) is cancelled, and its slot goes back from 'reserved'
+to 'free' unless another booking holds it now. Each batch is one transaction
+of set-based UPDATEs driven by the (status, reserved_until) index on Booking,
+with a single slot_status_changed signal for all the slots it frees.
+
+Several nodes can sweep at once: batch rows are taken with SELECT ... FOR
+UPDATE SKIP LOCKED where the backend supports it (SQLite serialises writers
+instead), and every UPDATE re-checks the status it expects, so a booking is
+cancelled and a slot freed exactly once.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from ..models import Booking, SlotStatus, VehicleLog
+from ..signals import slot_status_changed
+from .reservations import HOLD_AHEAD
+
+EXPIRY_GRACE = timedelta(minutes=getattr(settings, 'RESERVATION_EXPIRY_GRACE_MINUTES', 0))
+EXPIRY_BATCH_SIZE = getattr(settings, 'RESERVATION_EXPIRY_BATCH_SIZE', 500)
+
+
+def expired(now=None):
+    """active bookings past reserved_until (plus grace) whose vehicle never arrived"""
+    cutoff = (now or timezone.now()) - EXPIRY_GRACE
+    return (Booking.objects.filter(status='active', reserved_until__lt=cutoff)
+            .filter(~Exists(VehicleLog.objects.filter(booking=OuterRef('pk')))))
+
+
+def _expire_batch(now, batch_size):
+    features = connection.features
+    with transaction.atomic():
+        rows = expired(now).order_by('reserved_until')
+        if features.has_select_for_update_skip_locked:
+            rows = rows.select_for_update(skip_locked=True, of=('self',) if features.has_select_for_update_of else ())
+        batch = list(rows.values_list('pk', 'slot_id')[:batch_size])
+        if not batch:
+            return 0, 0, 0
+        cancelled = Booking.objects.filter(pk__in=[pk for pk, _ in batch], status='active').update(status='cancelled')
+
+        # free the slots unless another booking holds them now
+        holding = Booking.objects.filter(slot=OuterRef('slot'), status='active',
+                                         reserved_from__lte=now + HOLD_AHEAD, reserved_until__gt=now)
+        release = SlotStatus.objects.filter(slot_id__in={slot_id for _, slot_id in batch if slot_id},
+                                            status='reserved').filter(~Exists(holding))
+        if features.has_select_for_update:
+            release = release.select_for_update()
+        slot_ids = list(release.values_list('slot_id', flat=True))
+        SlotStatus.objects.filter(slot_id__in=slot_ids, status='reserved').update(status='free', last_update=now)
+        if slot_ids:
+            slot_status_changed.send(sender=SlotStatus, changes=[(slot_id, 'reserved', 'free') for slot_id in slot_ids])
+    return len(batch), cancelled, len(slot_ids)
+
+
+def sweep(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """cancel expired bookings and free their slots in batches; returns (bookings cancelled, slots freed)"""
+    now = now or timezone.now()
+    cancelled = freed = 0
+    while True:
+        taken, c, f = _expire_batch(now, batch_size)
+        cancelled += c
+        freed += f
+        if taken < batch_size:  # drained (or the rest is locked by another node)
+            return cancelled, freed
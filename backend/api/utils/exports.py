@@ -0,0 +1,139 @@
+"""
+Streaming exports of VehicleLog and Booking history (finance, audits, archival).
+
+Rows are read with values_list(...).iterator(chunk_size) - plain tuples,
+fetched a chunk at a time (a server-side cursor on PostgreSQL) - and written
+out as they arrive, so memory stays flat whatever the date range. The same
+generators feed the admin endpoint (GET /api/exports/<kind>/, CSV or NDJSON
+through a StreamingHttpResponse) and `manage.py export_history`, which can
+also write gzip files or zstd-compressed Parquet for cold storage (needs
+pyarrow) and then prune the archived rows.
+
+Only finished rows are pruned (vehicles that have left, completed or
+cancelled bookings). A pruning export first notes the range's highest id and
+the ids of its rows still open (parked vehicles, active bookings - few, however
+long the range), then writes the finished rows up to that id. Finishing is
+final, so those are exactly the finished rows up to that id that were not open
+then: prune() deletes that set, and a row that finishes while the file is being
+written stays until the next run.
+"""
+import csv
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Max, Q
+
+from ..models import Booking, VehicleLog
+from . import rollups
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, for Parquet archives only
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+Export = namedtuple('Export', 'model date_field facility_field columns finished')
+
+# columns: (values_list lookup, type) - the type is only used for Parquet
+EXPORTS = {
+    'vehicle-logs': Export(VehicleLog, 'entry_ts', 'slot__facility_id', [
+        ('id', 'int'), ('vehicle_number', 'str'), ('plate_key', 'str'), ('slot_id', 'int'), ('slot__label', 'str'),
+        ('entry_ts', 'ts'), ('exit_ts', 'ts'), ('booking_id', 'int'), ('ocr_text', 'str'),
+    ], Q(exit_ts__isnull=False)),
+    'bookings': Export(Booking, 'created_at', 'facility_id', [
+        ('id', 'int'), ('user_id', 'int'), ('user__username', 'str'), ('vehicle_number', 'str'),
+        ('facility__code', 'str'), ('slot_id', 'int'), ('slot__label', 'str'), ('eta', 'ts'),
+        ('reserved_from', 'ts'), ('reserved_until', 'ts'), ('status', 'str'), ('created_at', 'ts'),
+    ], Q(status__in=['completed', 'cancelled'])),
+}
+
+
+def header(kind):
+    return [lookup.replace('__', '_') for lookup, _ in EXPORTS[kind].columns]
+
+
+def queryset(kind, start, end, facility_id=None, using=None):
+    """the kind's rows whose date (entry / creation time) falls in [start, end)"""
+    spec = EXPORTS[kind]
+    qs = spec.model.objects.filter(**{f'{spec.date_field}__gte': start, f'{spec.date_field}__lt': end})
+    if facility_id:
+        qs = qs.filter(**{spec.facility_field: facility_id})
+    return qs.using(using) if using else qs
+
+
+def rows(qs, kind, chunk_size=EXPORT_CHUNK_SIZE):
+    """tuples in header(kind) order, oldest first, fetched chunk_size at a time"""
+    spec = EXPORTS[kind]
+    return (qs.values_list(*[lookup for lookup, _ in spec.columns])
+            .order_by(spec.date_field, 'pk').iterator(chunk_size=chunk_size))
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def csv_lines(rows, kind):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header(kind))
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def ndjson_lines(rows, kind):
+    names = header(kind)
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=_plain) + '\n'
+
+
+FORMATS = {'csv': (csv_lines, 'text/csv'), 'ndjson': (ndjson_lines, 'application/x-ndjson')}
+
+
+def write_parquet(rows, kind, path, chunk_size=EXPORT_CHUNK_SIZE):
+    """write rows to a zstd-compressed Parquet file, one row group per chunk; returns the row count"""
+    if pyarrow is None:
+        raise RuntimeError('Parquet export needs pyarrow (pip install pyarrow)')
+    types = {'int': pyarrow.int64(), 'str': pyarrow.string(), 'ts': pyarrow.timestamp('us', tz='UTC')}
+    schema = pyarrow.schema([(name, types[t]) for name, (_, t) in zip(header(kind), EXPORTS[kind].columns)])
+    count, batch = 0, []
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+        def flush():
+            columns = [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                flush()
+                count += len(batch)
+                batch = []
+        if batch:
+            flush()
+            count += len(batch)
+    return count
+
+
+def snapshot(kind, start, end, facility_id=None):
+    """(highest id, ids of the rows not finished yet) of a range, taken before a pruning export"""
+    qs = queryset(kind, start, end, facility_id)
+    max_id = qs.aggregate(max_id=Max('pk'))['max_id'] or 0
+    return max_id, list(qs.filter(pk__lte=max_id).exclude(EXPORTS[kind].finished).values_list('pk', flat=True))
+
+
+def prunable(kind, start, end, max_id, open_ids, facility_id=None):
+    """the rows a pruning export writes and then deletes: finished, up to max_id, not open at the snapshot"""
+    return (queryset(kind, start, end, facility_id)
+            .filter(EXPORTS[kind].finished, pk__lte=max_id).exclude(pk__in=open_ids))
+
+
+def prune(kind, start, end, max_id, open_ids, facility_id=None, batch_size=5000, pause=0.0):
+    """delete the rows of an exported range given its snapshot() (see prunable); returns the number deleted"""
+    qs = prunable(kind, start, end, max_id, open_ids, facility_id)
+    return rollups.delete_in_batches(qs, batch_size, pause)
@@ -0,0 +1,69 @@
+"""
+Facility scoping and placement of per-facility sensor data.
+
+Slots, their status, bookings and sensor rows all carry a facility, and the
+hot queries (free-slot scans, rollups, retention) filter on it first through
+the (facility, ...) indexes, so one site's traffic doesn't scan another's rows.
+
+A large facility's sensor tables (SensorEvent, SensorRollup) can live on a
+database of their own:
+
+    DATABASES['site_north'] = {...}
+    FACILITY_DATABASES = {'north': 'site_north'}    # facility code -> alias
+    DATABASE_ROUTERS = ['api.routers.FacilityRouter']
+
+Writes of those models are routed by the instance's facility; querysets carry
+no facility, so reads pick the database with .using(telemetry_db(facility_id)).
+Everything else stays on 'default'.
+"""
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from ..models import Facility
+
+FACILITY_DATABASES = getattr(settings, 'FACILITY_DATABASES', {})
+TELEMETRY_MODELS = {'sensorevent', 'sensorrollup'}
+_MAP_TTL = 60
+
+_aliases = {}       # facility id -> alias, for facilities listed in FACILITY_DATABASES
+_loaded_at = None
+
+
+def _alias_map():
+    global _aliases, _loaded_at
+    if _loaded_at is None or time.monotonic() - _loaded_at > _MAP_TTL:
+        _aliases = {pk: FACILITY_DATABASES[code] for pk, code in
+                    Facility.objects.using(DEFAULT_DB_ALIAS).filter(code__in=FACILITY_DATABASES)
+                    .values_list('pk', 'code')}
+        _loaded_at = time.monotonic()
+    return _aliases
+
+
+def telemetry_db(facility_id):
+    """database alias holding the facility's SensorEvent / SensorRollup rows"""
+    if not FACILITY_DATABASES:
+        return DEFAULT_DB_ALIAS
+    return _alias_map().get(facility_id, DEFAULT_DB_ALIAS)
+
+
+def telemetry_databases(facility_ids):
+    """{alias: [facility ids]} for facility_ids"""
+    grouped = {}
+    for facility_id in facility_ids:
+        grouped.setdefault(telemetry_db(facility_id), []).append(facility_id)
+    return grouped
+
+
+def clear():
+    """forget the cached facility -> database map (after adding a facility or changing FACILITY_DATABASES)"""
+    global _loaded_at
+    _loaded_at = None
+
+
+def from_code(code):
+    """active Facility for a ?facility= code, None for an empty code; raises Facility.DoesNotExist"""
+    if not code:
+        return None
+    return Facility.objects.get(code=code, is_active=True)
@@ -0,0 +1,173 @@
+"""
+Load generation for the parking API (see the `benchmark` management command).
+
+Simulates a facility of N slots: sensors posting to sensors/event/, entry/exit
+cameras hitting vehicle/entry/ and vehicle/exit/ (plate text supplied, so OCR
+is not part of the measurement), booking bursts on bookings/ and boards
+polling slots/. Requests go through django.test.Client, i.e. the full
+middleware/view/ORM stack in process, without a socket. Every request's wall
+time and query count are recorded per endpoint. Sensors post with a per-device
+key bound to the seeded slots, as in production (credential cache and token
+bucket included), with a rate no run reaches.
+"""
+import math
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..models import ParkingSlot, SensorDevice, SlotStatus, default_facility
+from . import devices
+
+OCCUPIED_THRESHOLD_CM = getattr(settings, 'OCCUPIED_THRESHOLD_CM', 40)
+
+# relative frequency of each kind of client request
+DEFAULT_MIX = {'sensor_event': 60, 'board_poll': 20, 'vehicle_entry': 7, 'vehicle_exit': 7, 'booking': 6}
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+BENCH_DEVICE = 'bench-sensors'
+BENCH_DEVICE_RATE = 100000  # requests per second and burst: measure the check, never trip it
+
+
+def seed(slots, zones=4):
+    """
+    (re)create slots B-0..B-n across zones with free statuses, the booking user and a sensor device
+    for those slots; returns (slot ids, device key)
+    """
+    facility_id = default_facility()
+    ParkingSlot.objects.filter(facility_id=facility_id, label__startswith='B-').delete()
+    zone_names = string.ascii_uppercase[:zones]
+    objs = ParkingSlot.objects.bulk_create(
+        ParkingSlot(label=f'B-{i}', zone=zone_names[i % zones], facility_id=facility_id) for i in range(slots))
+    SlotStatus.objects.bulk_create(SlotStatus(slot=s, facility_id=facility_id) for s in objs)
+    user, _ = User.objects.get_or_create(username=BENCH_USER)
+    user.set_password(BENCH_PASSWORD)
+    user.save()
+    device, _ = SensorDevice.objects.update_or_create(
+        name=BENCH_DEVICE, defaults={'is_active': True, 'rate_limit': BENCH_DEVICE_RATE, 'burst': BENCH_DEVICE_RATE})
+    device.slots.set(objs)
+    devices.forget()
+    return [s.id for s in objs], devices.issue_key(device)
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[k]
+
+
+class LoadGenerator:
+    def __init__(self, slot_ids, device_key, mix=None, rng_seed=0):
+        self.slot_ids = slot_ids
+        self.device_key = device_key
+        self.mix = mix or DEFAULT_MIX
+        self.rng_seed = rng_seed
+        self.samples = {}  # endpoint -> [(seconds, queries, status)]
+        self._parked = []  # plates inside the facility, for exit requests
+        self._lock = threading.Lock()
+        self._plate_seq = 0
+
+    # ---- client requests
+    def _plate(self, rng):
+        with self._lock:
+            self._plate_seq += 1
+            n = self._plate_seq
+        return f'KA{n % 100:02d}{rng.choice(string.ascii_uppercase)}{rng.choice(string.ascii_uppercase)}{n:04d}'
+
+    def sensor_event(self, client, rng):
+        value = rng.uniform(5, 35) if rng.random() < 0.5 else rng.uniform(OCCUPIED_THRESHOLD_CM + 10, 250)
+        return client.post('/api/sensors/event/', {'slot_id': rng.choice(self.slot_ids), 'value': round(value, 1)},
+                           content_type='application/json', HTTP_X_DEVICE_KEY=self.device_key)
+
+    def board_poll(self, client, rng):
+        return client.get('/api/slots/')
+
+    def vehicle_entry(self, client, rng):
+        plate = self._plate(rng)
+        resp = client.post('/api/vehicle/entry/', {'plate_text': plate, 'slot_id': rng.choice(self.slot_ids)},
+                           content_type='application/json')
+        if resp.status_code == 200:
+            with self._lock:
+                self._parked.append(plate)
+        return resp
+
+    def vehicle_exit(self, client, rng):
+        with self._lock:
+            # another worker may have taken the last parked car; that exit is a 404
+            plate = self._parked.pop(rng.randrange(len(self._parked))) if self._parked else 'ZZ00ZZ0000'
+        return client.post('/api/vehicle/exit/', {'plate_text': plate}, content_type='application/json')
+
+    def booking(self, client, rng):
+        # spread ETAs over the coming week so bursts mostly find a slot
+        eta = timezone.now() + timedelta(minutes=rng.randrange(20, 7 * 24 * 60))
+        return client.post('/api/bookings/', {'vehicle_number': self._plate(rng), 'eta': eta.isoformat()},
+                           content_type='application/json')
+
+    # ---- driver
+    def _client(self):
+        client = Client(raise_request_exception=False)
+        client.login(username=BENCH_USER, password=BENCH_PASSWORD)
+        return client
+
+    def _worker(self, worker_id, count, record, own_connection=False):
+        rng = random.Random(f'{self.rng_seed}:{worker_id}')
+        client = self._client()
+        kinds, weights = zip(*self.mix.items())
+        try:
+            for _ in range(count):
+                kind = rng.choices(kinds, weights)[0]
+                if kind == 'vehicle_exit' and not self._parked:
+                    kind = 'vehicle_entry'
+                connection.queries_log.clear()  # bounded deque; a full one would undercount
+                with CaptureQueriesContext(connection) as queries:
+                    t0 = time.perf_counter()
+                    resp = getattr(self, kind)(client, rng)
+                    elapsed = time.perf_counter() - t0
+                if record:
+                    with self._lock:
+                        self.samples.setdefault(kind, []).append((elapsed, len(queries), resp.status_code))
+        finally:
+            if own_connection:
+                connection.close()
+
+    def run(self, requests, concurrency=1, warmup=0):
+        """issue `requests` requests from `concurrency` threads; returns wall seconds of the measured run"""
+        if warmup:
+            self._worker('warmup', warmup, record=False)
+        per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        t0 = time.perf_counter()
+        if concurrency == 1:
+            self._worker(0, per_worker[0], record=True)
+        else:
+            with ThreadPoolExecutor(concurrency) as pool:
+                for f in [pool.submit(self._worker, i, n, True, True) for i, n in enumerate(per_worker)]:
+                    f.result()
+        return time.perf_counter() - t0
+
+    def summary(self, elapsed):
+        """{endpoint: {requests, errors, rps, p50_ms, p95_ms, p99_ms, mean_ms, queries_per_request}}"""
+        out = {}
+        for kind, samples in sorted(self.samples.items()):
+            times = sorted(s[0] * 1000 for s in samples)
+            out[kind] = {
+                'requests': len(samples),
+                'errors': sum(1 for s in samples if s[2] >= 400),
+                'rps': round(len(samples) / elapsed, 1) if elapsed else None,
+                'p50_ms': round(percentile(times, 50), 2),
+                'p95_ms': round(percentile(times, 95), 2),
+                'p99_ms': round(percentile(times, 99), 2),
+                'mean_ms': round(sum(times) / len(times), 2),
+                'queries_per_request': round(sum(s[1] for s in samples) / len(samples), 2),
+            }
+        return out
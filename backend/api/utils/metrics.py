@@ -0,0 +1,146 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label-value tuples behind one
+lock, so recording costs a few hundred nanoseconds and the middleware can stay
+on for sensor ingestion. Values are per process: with several gunicorn workers
+each scrape of /metrics sees the worker that served it, so scrape every worker
+(or run one worker per pod) and aggregate with sum() in PromQL.
+"""
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in sorted(self._values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labelvalues -> [per-bucket counts..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            row = self._values.get(labelvalues)
+            if row is None:
+                row = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def count(self, *labelvalues):
+        row = self._values.get(labelvalues)
+        return sum(row[:-1]) if row else 0
+
+    def samples(self):
+        for labelvalues, row in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), row):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labelvalues, [le])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(row[-1])}'
+            yield f'{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}'
+
+
+class Callback:
+    """single value read from a callback at scrape time (e.g. counters kept elsewhere)"""
+
+    def __init__(self, name, documentation, read, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = kind
+        _registry.append(self)
+
+    def samples(self):
+        yield f'{self.name} {_number(self.read())}'
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """zero every counter and histogram (tests)"""
+    with _lock:
+        for metric in _registry:
+            if hasattr(metric, '_values'):
+                metric._values.clear()
+
+
+# ---- hot-path metrics
+http_requests = Counter('parking_http_requests_total', 'HTTP responses by view, method and status.',
+                        ('view', 'method', 'status'))
+http_latency = Histogram('parking_http_request_duration_seconds', 'Request latency by view.',
+                         ('view', 'method'))
+db_queries = Histogram('parking_http_db_queries', 'Database queries per request by view.',
+                       ('view',), buckets=QUERY_COUNT_BUCKETS)
+db_time = Counter('parking_http_db_query_seconds_total', 'Time spent in database queries by view.', ('view',))
+ocr_latency = Histogram('parking_ocr_duration_seconds', 'Tesseract time per image (cache misses only).',
+                        ('result',))
+ocr_jobs = Histogram('parking_ocr_job_duration_seconds', 'OCR job time from queueing to finish.', ('status',))
+debounce_transitions = Counter('parking_debounce_transitions_total',
+                               'Slot status changes decided by sensor debouncing.', ('from', 'to'))
+allocation_failures = Counter('parking_allocation_failures_total',
+                              'Bookings rejected because no slot could be allocated.', ('zone', 'vehicle_type'))
+gate_delivery = Histogram('parking_gate_command_delivery_seconds',
+                          'Time from a gate command\'s trigger to its controller receiving it.', ('action',))
+gate_latency = Histogram('parking_gate_command_seconds',
+                         'Time from a gate command\'s trigger (e.g. the booking match) to the controller\'s ack.',
+                         ('action', 'status'))
+sensor_rejections = Counter('parking_sensor_rejections_total',
+                            'Sensor requests turned away before ingestion (bad key, over rate, unassigned slot).',
+                            ('reason',))
+zone_counter_drift = Counter('parking_zone_counter_drift_total',
+                             'Zones whose availability counters were found wrong and corrected by reconciliation.')
@@ -0,0 +1,145 @@
+"""
+OCR engines.
+
+pytesseract starts a tesseract process per image and passes the image and the
+text through temp files, which costs more than recognising a plate. With
+tesserocr installed each process instead keeps up to OCR_ENGINE_POOL_SIZE warm
+in-process TessBaseAPI instances (language data loaded once) and lends them
+out per call; a batch of frames is read on one engine. pytesseract stays the
+fallback when tesserocr or its language data is missing.
+
+    OCR_ENGINE = 'auto'        # 'tesserocr' | 'pytesseract' | 'auto' (tesserocr when it loads)
+    OCR_ENGINE_POOL_SIZE = 2   # engines per process
+    OCR_LANG = 'eng'
+
+Pools are per process: each ocr_jobs pool worker holds its engines for its
+whole lifetime. `manage.py benchmark_ocr` compares the engines per plate.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+
+import pytesseract
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import tesserocr
+except ImportError:  # optional; needs the tesseract C++ library to build
+    tesserocr = None
+
+OCR_ENGINE = getattr(settings, 'OCR_ENGINE', 'auto')
+OCR_ENGINE_POOL_SIZE = getattr(settings, 'OCR_ENGINE_POOL_SIZE', 2)
+OCR_LANG = getattr(settings, 'OCR_LANG', 'eng')
+
+
+class PytesseractEngine:
+    """runs the tesseract binary once per image"""
+    name = 'pytesseract'
+
+    def read(self, img):
+        return pytesseract.image_to_string(img, lang=OCR_LANG, config='--psm 7')  # single line
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """a long-lived in-process TessBaseAPI; not thread-safe, so it is used by one caller at a time"""
+    name = 'tesserocr'
+
+    def __init__(self):
+        if tesserocr is None:
+            raise ImproperlyConfigured("OCR_ENGINE = 'tesserocr' but tesserocr is not installed")
+        self.api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=tesserocr.PSM.SINGLE_LINE)
+
+    def read(self, img):
+        self.api.SetImage(img)
+        return self.api.GetUTF8Text()
+
+    def close(self):
+        self.api.End()
+
+
+ENGINES = {'pytesseract': PytesseractEngine, 'tesserocr': TesserocrEngine}
+
+
+class EnginePool:
+    """
+    at most size engines from factory, created on first use and reused after that;
+    callers beyond size wait for an engine to come back
+    """
+    def __init__(self, factory, size=OCR_ENGINE_POOL_SIZE):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()  # the most recently used engine is the warmest
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self.created -= 1
+            raise
+
+    @contextmanager
+    def engine(self):
+        engine = self._acquire()
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def close(self):
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            engine.close()
+            with self._lock:
+                self.created -= 1
+
+
+def _make_pool():
+    if OCR_ENGINE not in ('auto', *ENGINES):
+        raise ImproperlyConfigured(f'unknown OCR_ENGINE {OCR_ENGINE!r}')
+    name = OCR_ENGINE
+    if name == 'auto':
+        name = 'pytesseract'
+        if tesserocr is not None:
+            try:
+                TesserocrEngine().close()  # language data loads?
+                name = 'tesserocr'
+            except RuntimeError:
+                pass
+    return EnginePool(ENGINES[name])
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _make_pool()
+        return _pool
+
+
+def engine():
+    """context manager lending an engine from this process's pool: `with engine() as e: e.read(img)`"""
+    return get_pool().engine()
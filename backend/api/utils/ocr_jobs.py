@@ -0,0 +1,179 @@
+"""
+Asynchronous OCR jobs.
+
+Tesseract is too slow to run inside a gunicorn sync worker, so uploads become
+OcrJob rows that a per-process dispatcher thread feeds from a local queue into a
+process pool of OCR workers (at most OCR_WORKERS in flight). When a job finishes
+its plate is attached to the job's VehicleLog and matched against bookings.
+Frames already in this process's plate_cache finish without touching the pool.
+Each worker keeps warm OCR engines for its lifetime (see ocr_engines). A worker
+that frees up while jobs are waiting takes up to OCR_BATCH_SIZE of them in one
+call; while workers are idle, each job is sent on its own.
+
+Jobs carry the uploaded bytes, not a file: OCR never touches the disk, and
+storing the frame (see ocr_utils.store_image) is up to the caller. The local
+queue holds at most OCR_QUEUE_SIZE frames; beyond that new jobs fail at once
+rather than growing the worker's memory.
+
+OCR_WORKERS = 0 runs jobs inline, which is what tests and `runserver` want.
+Callers that need an answer straight away use submit(..., wait=True), which
+waits up to OCR_SYNC_TIMEOUT seconds and otherwise leaves the job running.
+
+The queue lives in the process, so jobs still queued or running when their
+worker restarts would never finish. fail_stale() marks jobs older than
+OCR_JOB_STALE_SECONDS failed; it runs when a process starts its pool and from
+`manage.py fail_stale_ocr_jobs`.
+"""
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import OcrJob
+from . import arrivals, metrics
+from .ocr_utils import MISS, extract_plate_text, extract_plate_texts, plate_cache
+
+OCR_WORKERS = getattr(settings, 'OCR_WORKERS', 2)
+OCR_SYNC_TIMEOUT = getattr(settings, 'OCR_SYNC_TIMEOUT', 5)
+OCR_QUEUE_SIZE = getattr(settings, 'OCR_QUEUE_SIZE', 64)
+OCR_BATCH_SIZE = getattr(settings, 'OCR_BATCH_SIZE', 8)
+OCR_JOB_STALE_SECONDS = getattr(settings, 'OCR_JOB_STALE_SECONDS', 300)
+
+_lock = threading.Lock()
+_pending = queue.Queue(OCR_QUEUE_SIZE)
+_executor = None
+_in_flight = None
+_dispatcher = None
+
+
+def _pool():
+    global _executor, _in_flight, _dispatcher
+    with _lock:
+        if _executor is None:
+            # spawn: forking a threaded gunicorn worker is not safe
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _in_flight = threading.BoundedSemaphore(OCR_WORKERS)
+            _dispatcher = threading.Thread(target=_dispatch_loop, name='ocr-dispatcher', daemon=True)
+            _dispatcher.start()
+            fail_stale()  # left behind by a worker that restarted
+    return _executor
+
+
+def fail_stale(older_than=OCR_JOB_STALE_SECONDS):
+    """
+    mark jobs queued or running for longer than older_than seconds failed: their process is gone
+    (queues are per process); returns the number of jobs failed
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=older_than)
+    stale = Q(status='queued', created_at__lt=cutoff) | Q(status='running', started_at__lt=cutoff)
+    return OcrJob.objects.filter(stale).update(
+        status='failed', error='abandoned: the OCR worker restarted before finishing', finished_at=now)
+
+
+def _start(batch):
+    """batch: [(job_id, data, cache_key)], read by one worker in one call"""
+    OcrJob.objects.filter(pk__in=[job_id for job_id, _, _ in batch]).update(status='running',
+                                                                            started_at=timezone.now())
+    return _executor.submit(extract_plate_texts, [data for _, data, _ in batch])
+
+
+def _dispatch_loop():
+    while True:
+        # wait for a free worker first, so whatever queued up meanwhile goes out as one batch
+        _in_flight.acquire()
+        batch = [_pending.get()]
+        while len(batch) < OCR_BATCH_SIZE:
+            try:
+                batch.append(_pending.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _start(batch).add_done_callback(partial(_on_done, batch, True))
+        except Exception as e:
+            _in_flight.release()
+            for job_id, _, _ in batch:
+                finish(job_id, None, error=str(e))
+        finally:
+            connections.close_all()
+
+
+def _on_done(batch, dispatched, future):
+    # runs on the executor's management thread
+    if dispatched:
+        _in_flight.release()
+    try:
+        exc = future.exception()
+        plates = [None] * len(batch) if exc else future.result()
+        for (job_id, _, cache_key), plate in zip(batch, plates):
+            if not exc:
+                plate_cache.store(*cache_key, plate)
+            finish(job_id, plate, error=str(exc) if exc else '')
+    finally:
+        connections.close_all()
+
+
+def finish(job_id, plate_text, error=''):
+    """record a job result and attach the plate to its VehicleLog"""
+    with transaction.atomic():
+        job = OcrJob.objects.select_for_update().select_related('vehicle_log').get(pk=job_id)
+        job.plate_text = plate_text
+        job.error = error
+        job.status = 'failed' if error else 'done'
+        job.finished_at = timezone.now()
+        job.save()
+        # pool workers are separate processes, so time jobs here rather than inside extract_plate_text
+        metrics.ocr_jobs.observe((job.finished_at - job.created_at).total_seconds(), job.status)
+        if job.vehicle_log and plate_text:
+            arrivals.record_arrival(job.vehicle_log, plate_text)
+    return job
+
+
+def _enqueue(job_id, data, cache_key):
+    try:
+        _pending.put_nowait((job_id, data, cache_key))
+    except queue.Full:
+        finish(job_id, None, error='OCR queue full')
+
+
+def submit(data, image_path='', vehicle_log=None, wait=False):
+    """
+    queue OCR for an uploaded image (bytes) and return the OcrJob; image_path is
+    where the caller stored it, if it did.
+    wait=True runs the job ahead of the queue and waits up to OCR_SYNC_TIMEOUT seconds.
+    """
+    job = OcrJob.objects.create(image_path=image_path or '', vehicle_log=vehicle_log)
+    if OCR_WORKERS <= 0:
+        try:
+            plate = extract_plate_text(data)
+        except Exception as e:
+            return finish(job.id, None, error=str(e))
+        return finish(job.id, plate)
+    digest, ph, plate = plate_cache.lookup(data)
+    if plate is not MISS:
+        return finish(job.id, plate)
+    _pool()
+    if not wait:
+        transaction.on_commit(lambda: _enqueue(job.id, data, (digest, ph)))
+        return job
+    batch = [(job.id, data, (digest, ph))]
+    future = _start(batch)
+    try:
+        plate = future.result(timeout=OCR_SYNC_TIMEOUT)[0]
+    except TimeoutError:
+        # too slow for an inline answer; the job completes in the background
+        future.add_done_callback(partial(_on_done, batch, False))
+        job.refresh_from_db()
+        return job
+    except Exception as e:
+        return finish(job.id, None, error=str(e))
+    plate_cache.store(digest, ph, plate)
+    return finish(job.id, plate)
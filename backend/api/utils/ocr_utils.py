@@ -1,29 +1,219 @@
 import re
+import io
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 from PIL import Image, ImageOps, ImageFilter
-import pytesseract
 import os
 from django.conf import settings
 
-def preprocess_image(image_path):
-    img = Image.open(image_path).convert('L')
+from . import metrics, ocr_engines
+
+OCR_CACHE_SIZE = getattr(settings, 'OCR_CACHE_SIZE', 512)
+OCR_CACHE_TTL = getattr(settings, 'OCR_CACHE_TTL', 300)  # seconds
+OCR_CACHE_PHASH = getattr(settings, 'OCR_CACHE_PHASH', False)
+OCR_CACHE_PHASH_DISTANCE = getattr(settings, 'OCR_CACHE_PHASH_DISTANCE', 4)  # bits out of 256
+OCR_TARGET_HEIGHT = getattr(settings, 'OCR_TARGET_HEIGHT', 480)  # pixels, after OCR_CROP
+OCR_CROP = getattr(settings, 'OCR_CROP', None)  # (left, top, right, bottom) as fractions of the frame
+OCR_IMAGE_DIR = 'plates'
+
+MISS = object()
+
+logger = logging.getLogger(__name__)
+
+def dhash(data, crop, size=16):
+    """
+    size*size-bit difference hash of the crop region of an image; near-identical regions
+    differ in a few bits
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        left, top, right, bottom = crop
+        # cheap JPEG decode at reduced scale, keeping the region a few times the hash size
+        img.draft('L', (int(size * 4 / (right - left)), int(size * 4 / (bottom - top))))
+        img = img.convert('L')
+        dw, dh = img.size
+        img = img.crop((int(left * dw), int(top * dh), int(right * dw), int(bottom * dh))).resize((size + 1, size))
+    except Exception:
+        return None
+    px = img.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return bits
+
+class PlateCache:
+    """
+    Bounded LRU/TTL cache of OCR results keyed by image content.
+    Exact hits match a blake2b digest of the upload. With phash enabled and a plate
+    region (crop, normally OCR_CROP) configured, a frame whose difference hash of that
+    region is within max_distance bits of a cached one is a near hit. A hash of the
+    whole frame is never used: two cars at the same barrier differ in too few pixels.
+    """
+    def __init__(self, maxsize=OCR_CACHE_SIZE, ttl=OCR_CACHE_TTL, phash=OCR_CACHE_PHASH, max_distance=OCR_CACHE_PHASH_DISTANCE,
+                 crop=OCR_CROP):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.phash = phash and crop is not None
+        self.crop = crop
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # digest -> (expires, phash, plate)
+        self._lock = threading.Lock()
+        self.hits = self.near_hits = self.misses = self.evictions = 0
+
+    def lookup(self, data):
+        """returns (digest, phash, plate); plate is MISS when nothing matches"""
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return digest, entry[1], entry[2]
+        ph = dhash(data, self.crop) if self.phash else None
+        with self._lock:
+            if ph is not None:
+                for key, (expires, other, plate) in reversed(self._entries.items()):
+                    if expires > now and other is not None and bin(ph ^ other).count('1') <= self.max_distance:
+                        self._entries.move_to_end(key)
+                        self.near_hits += 1
+                        return digest, ph, plate
+            self.misses += 1
+        return digest, ph, MISS
+
+    def store(self, digest, ph, plate):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl, ph, plate)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'near_hits': self.near_hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+plate_cache = PlateCache()
+
+metrics.Callback('parking_ocr_cache_hits_total', 'OCR cache exact hits.', lambda: plate_cache.hits, 'counter')
+metrics.Callback('parking_ocr_cache_near_hits_total', 'OCR cache perceptual-hash hits.',
+                 lambda: plate_cache.near_hits, 'counter')
+metrics.Callback('parking_ocr_cache_misses_total', 'OCR cache misses.', lambda: plate_cache.misses, 'counter')
+
+def preprocess_image(image_file, target_height=OCR_TARGET_HEIGHT, crop=OCR_CROP):
+    """
+    greyscale, inverted, median-filtered OCR input, target_height pixels tall.
+    JPEGs are decoded straight at a reduced scale (img.draft), so a 4K frame is
+    never held at full resolution; crop is an optional region of interest.
+    """
+    img = Image.open(image_file)
+    w, h = img.size
+    left, top, right, bottom = crop or (0, 0, 1, 1)
+    scale = target_height / max(1, (bottom - top) * h)
+    if scale < 1:
+        img.draft('L', (int(w * scale) + 1, int(h * scale) + 1))
+    img = img.convert('L')
+    dw, dh = img.size
+    if crop:
+        img = img.crop((int(left * dw), int(top * dh), int(right * dw), int(bottom * dh)))
+    cw, ch = img.size
+    if ch != target_height:
+        img = img.resize((max(1, round(cw * target_height / ch)), target_height), Image.BILINEAR)
     img = ImageOps.invert(img)
     img = img.filter(ImageFilter.MedianFilter())
-    w,h = img.size
-    img = img.resize((int(w*1.5), int(h*1.5)))
     return img
 
-def extract_plate_text(image_path):
-    try:
-        img = preprocess_image(image_path)
-        txt = pytesseract.image_to_string(img, config='--psm 7')  # single line
-        txt = re.sub(r'[^A-Za-z0-9 ]','', txt).strip().upper()
-        # Indian plate heuristic: look for patterns like KA01AB1234 or KA 01 AB 1234
-        m = re.search(r'[A-Z]{2}\s*\d{1,2}\s*[A-Z]{0,3}\s*\d{1,4}', txt)
-        if m:
-            return re.sub(r'\s+','', m.group(0))
-        if txt:
-            return txt.replace(' ','')
-    except Exception as e:
-        # fallback - stub
-        return None
+def parse_plate(txt):
+    """plate number from raw OCR text, or None"""
+    txt = re.sub(r'[^A-Za-z0-9 ]','', txt).strip().upper()
+    # Indian plate heuristic: look for patterns like KA01AB1234 or KA 01 AB 1234
+    m = re.search(r'[A-Z]{2}\s*\d{1,2}\s*[A-Z]{0,3}\s*\d{1,4}', txt)
+    if m:
+        return re.sub(r'\s+','', m.group(0))
+    if txt:
+        return txt.replace(' ','')
     return None
+
+def _read_plate(image_file, engine):
+    return parse_plate(engine.read(preprocess_image(image_file)))
+
+def extract_plate_texts(images):
+    """
+    plate text for each image (bytes or a file path), via plate_cache; None where OCR fails.
+    cache misses are read one after another on a single pooled engine (see ocr_engines);
+    raises if no engine can be started, so the caller's jobs fail rather than read as plate-less
+    """
+    results = [None] * len(images)
+    misses = {}  # digest -> (data, phash, [indexes]); identical frames are read once
+    for i, image in enumerate(images):
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                data = bytes(image)
+            else:
+                with open(image, 'rb') as f:
+                    data = f.read()
+            digest, ph, plate = plate_cache.lookup(data)
+        except Exception:
+            continue
+        if plate is not MISS:
+            results[i] = plate
+        elif digest in misses:
+            misses[digest][2].append(i)
+        else:
+            misses[digest] = (data, ph, [i])
+    if not misses:
+        return results
+    t0 = time.perf_counter()
+    try:
+        with ocr_engines.engine() as engine:
+            for digest, (data, ph, indexes) in misses.items():
+                t0 = time.perf_counter()
+                try:
+                    plate = _read_plate(io.BytesIO(data), engine)
+                except Exception:
+                    # failures are not cached
+                    metrics.ocr_latency.observe(time.perf_counter() - t0, 'error')
+                    continue
+                metrics.ocr_latency.observe(time.perf_counter() - t0, 'plate' if plate else 'empty')
+                plate_cache.store(digest, ph, plate)
+                for i in indexes:
+                    results[i] = plate
+    except Exception:
+        # typically no engine could be started (tesseract missing or broken)
+        logger.exception('OCR engine failed')
+        metrics.ocr_latency.observe(time.perf_counter() - t0, 'error')
+        raise
+    return results
+
+def extract_plate_text(image):
+    """plate text from image bytes (or a file path), via plate_cache; None if it can't be read"""
+    return extract_plate_texts([image])[0]
+
+def store_image(data, name=''):
+    """
+    write image bytes under MEDIA_ROOT/plates/<aa>/<content hash><ext> unless that
+    file already exists; returns the path relative to MEDIA_ROOT
+    """
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    ext = os.path.splitext(name)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,5}', ext):
+        ext = '.jpg'
+    rel_path = os.path.join(OCR_IMAGE_DIR, digest[:2], digest + ext)
+    path = os.path.join(settings.MEDIA_ROOT, rel_path)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as out:
+            out.write(data)
+        os.replace(tmp, path)  # concurrent writers of the same content race harmlessly
+    return rel_path
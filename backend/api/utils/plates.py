@@ -0,0 +1,158 @@
+"""
+Normalised plate keys and fuzzy plate lookup.
+
+plate_key() keeps only letters and digits, upper-cases them and folds the
+characters Tesseract commonly confuses (O/Q->0, I/L->1, Z->2, S->5, B->8), so
+"ka 01 ab 1234" and "KAO1AB I234" share one indexed key on Booking and
+VehicleLog and the barrier lookups are exact index hits.
+
+For misreads beyond that, PlateIndex returns the keys within a small edit
+distance using a symmetric-deletion index: every known key is stored under each
+variant obtained by deleting up to d characters, and a query only looks up its
+own variants, so the cost doesn't grow with the number of plates. Variant hashes
+are kept in sorted array('q') columns (~12 bytes per variant) rather than a dict
+of strings. The index is per process; it is rebuilt in a background thread every
+PLATE_INDEX_TTL seconds and keys saved in between are added incrementally.
+"""
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+
+PLATE_FUZZY_DISTANCE = getattr(settings, 'PLATE_FUZZY_DISTANCE', 1)  # 0 disables fuzzy matching
+PLATE_INDEX_TTL = getattr(settings, 'PLATE_INDEX_TTL', 600)
+
+PLATE_FOLD = str.maketrans('OQILZSB', '0011258')
+
+
+def plate_key(text):
+    return re.sub(r'[^A-Z0-9]', '', (text or '').upper()).translate(PLATE_FOLD)
+
+
+UNKNOWN_KEY = plate_key('UNKNOWN')
+
+
+def levenshtein(a, b):
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def _variants(key, d):
+    out = frontier = {key}
+    for _ in range(d):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out = out | frontier
+    return out
+
+
+class PlateIndex:
+    def __init__(self, max_distance=PLATE_FUZZY_DISTANCE, ttl=PLATE_INDEX_TTL):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self._keys = []
+        self._hashes = array('q')
+        self._ids = array('i')
+        self._recent = {}  # variant -> keys added since the last build
+        self._built_at = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    def _load_keys(self):
+        from ..models import Booking, VehicleLog
+        keys = set()
+        for model in (Booking, VehicleLog):
+            keys.update(model.objects.exclude(plate_key__in=['', UNKNOWN_KEY])
+                        .values_list('plate_key', flat=True).distinct().iterator(chunk_size=10000))
+        return keys
+
+    def build(self, keys=None):
+        keys = sorted(self._load_keys() if keys is None else set(keys))
+        pairs = sorted((hash(v), i) for i, k in enumerate(keys) for v in _variants(k, self.max_distance))
+        hashes = array('q', (h for h, _ in pairs))
+        ids = array('i', (i for _, i in pairs))
+        built = set(keys)
+        with self._lock:
+            self._keys, self._hashes, self._ids = keys, hashes, ids
+            self._recent = {v: s - built for v, s in self._recent.items() if s - built}
+            self._built_at = time.monotonic()
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        finally:
+            self._building = False
+            connections.close_all()
+
+    def _ensure_fresh(self):
+        with self._lock:
+            stale = self._built_at is None or time.monotonic() - self._built_at > self.ttl
+            if not stale or self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, name='plate-index', daemon=True).start()
+
+    def add(self, key):
+        if not key or key == UNKNOWN_KEY:
+            return
+        with self._lock:
+            for v in _variants(key, self.max_distance):
+                self._recent.setdefault(v, set()).add(key)
+
+    def _candidates(self, key, d):
+        out = set()
+        with self._lock:
+            keys, hashes, ids = self._keys, self._hashes, self._ids
+            for v in _variants(key, d):
+                h = hash(v)
+                i = bisect_left(hashes, h)
+                while i < len(hashes) and hashes[i] == h:
+                    out.add(keys[ids[i]])
+                    i += 1
+                out.update(self._recent.get(v, ()))
+        return out
+
+    def search(self, key, max_distance=None):
+        """ranked [(distance, key)] of known keys within max_distance of key"""
+        self._ensure_fresh()
+        d = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        ranked = []
+        for candidate in self._candidates(key, d):
+            dist = levenshtein(key, candidate)
+            if dist <= d:
+                ranked.append((dist, candidate))
+        return sorted(ranked)
+
+
+plate_index = PlateIndex()
+
+
+def match(qs, plate_text, unique=False):
+    """
+    first row of qs (in its ordering) whose plate_key equals plate_text's key,
+    else the first row among the nearest fuzzy candidates; None if nothing matches.
+    unique=True only accepts a fuzzy match that is the one row of qs at that distance
+    """
+    key = plate_key(plate_text)
+    if not key:
+        return None
+    obj = qs.filter(plate_key=key).first()
+    if obj is None and PLATE_FUZZY_DISTANCE:
+        ranked = plate_index.search(key)
+        for dist in sorted({d for d, _ in ranked if d}):
+            rows = list(qs.filter(plate_key__in=[k for d, k in ranked if d == dist])[:2])
+            if rows:
+                return None if unique and len(rows) > 1 else rows[0]
+    return obj
@@ -0,0 +1,195 @@
+"""
+Bulk slot provisioning.
+
+import_slots() upserts slots in chunks, each in one transaction: a multi-row
+INSERT ... ON CONFLICT (facility, label) DO UPDATE for ParkingSlot, so
+re-running an import is safe and updates zone / vehicle type / active flag,
+and one INSERT ... SELECT for the SlotStatus rows still missing (new rows
+start free, existing ones are left alone). On PostgreSQL and SQLite this runs
+through the cursor, since the per-instance ORM work of bulk_create costs
+several times the inserts (100k slots: ~15s vs a few seconds here); other
+backends use bulk_create(update_conflicts=True). Rows are read lazily from
+CSV or JSON. The import sends no signals: once it ends - also when a bad row
+stops it, since earlier chunks are committed - the slot snapshot is
+invalidated and each touched facility's zone counters are reconciled.
+
+reset_zone() sets every slot of a zone to one status with a single UPDATE
+and sends slot_status_changed for what changed, so the snapshot, the stream
+and the zone counters follow. Reserved slots are left alone unless asked
+for: their bookings still hold them.
+"""
+import csv
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import DEFAULT_FACILITY_CODE, Facility, ParkingSlot, SlotStatus
+from ..signals import slot_status_changed
+from . import slot_snapshot, zones
+
+IMPORT_CHUNK_SIZE = 2000
+TRUE = ('1', 'true', 'yes', 'y')
+
+
+def csv_rows(f):
+    """dicts from a CSV file with a header row (label, zone, max_vehicle_type, is_active, facility)"""
+    yield from csv.DictReader(f)
+
+
+def json_rows(f, bufsize=1 << 16):
+    """objects of a top-level JSON array, or of NDJSON lines, decoded as the file is read"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,[]':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            buf, pos = f.read(bufsize), 0
+            eof = not buf
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = '' if eof else f.read(bufsize)
+            if not more:
+                raise ValueError(f'invalid JSON near {buf[pos:pos + 40]!r}')
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if not isinstance(obj, dict):
+            raise ValueError('each slot must be a JSON object')
+        yield obj
+        pos = end
+
+
+def _slot(row, facility_id):
+    """(facility_id, label, zone, max_vehicle_type, is_active) of one input row"""
+    label = str(row.get('label') or '').strip()
+    if not label:
+        raise ValueError(f'slot without a label: {row!r}')
+    is_active = row.get('is_active', True)
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() in TRUE if is_active.strip() else True
+    return (facility_id, label, str(row.get('zone') or '').strip(),
+            str(row.get('max_vehicle_type') or '').strip() or 'car', bool(is_active))
+
+
+def _upsert_sql(cursor, slots):
+    # INSERT ... ON CONFLICT straight through the cursor: building, preparing and compiling a model
+    # instance per row costs several times the inserts themselves
+    qn = connection.ops.quote_name
+    slot_table, status_table = qn(ParkingSlot._meta.db_table), qn(SlotStatus._meta.db_table)
+    fields = ('facility_id', 'label', 'zone', 'max_vehicle_type', 'is_active')
+    size = min(1000, connection.ops.bulk_batch_size(fields, slots))
+    for start in range(0, len(slots), size):
+        batch = slots[start:start + size]
+        values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+        cursor.execute(
+            f'INSERT INTO {slot_table} ({", ".join(fields)}) VALUES {values} '
+            f'ON CONFLICT (facility_id, label) DO UPDATE SET zone = excluded.zone, '
+            f'max_vehicle_type = excluded.max_vehicle_type, is_active = excluded.is_active',
+            [value for slot in batch for value in slot])
+    by_facility = {}
+    for facility_id, label, *_ in slots:
+        by_facility.setdefault(facility_id, []).append(label)
+    for facility_id, labels in by_facility.items():
+        for start in range(0, len(labels), 1000):
+            batch = labels[start:start + 1000]
+            cursor.execute(
+                f'INSERT INTO {status_table} (slot_id, facility_id, status, last_update) '
+                f'SELECT p.id, p.facility_id, %s, %s FROM {slot_table} p '
+                f'WHERE p.facility_id = %s AND p.label IN ({", ".join(["%s"] * len(batch))}) '
+                f'AND NOT EXISTS (SELECT 1 FROM {status_table} s WHERE s.slot_id = p.id)',
+                ['free', timezone.now(), facility_id, *batch])
+
+
+def _upsert_orm(slots):
+    objs = ParkingSlot.objects.bulk_create(
+        [ParkingSlot(facility_id=f, label=label, zone=zone, max_vehicle_type=vtype, is_active=active)
+         for f, label, zone, vtype, active in slots],
+        update_conflicts=True, unique_fields=['facility', 'label'],
+        update_fields=['zone', 'max_vehicle_type', 'is_active'])
+    if any(s.pk is None for s in objs):  # backends that don't return ids from an upsert
+        ids = {(f, label): pk for pk, f, label in ParkingSlot.objects.filter(
+            facility_id__in={s.facility_id for s in objs}, label__in=[s.label for s in objs])
+            .values_list('pk', 'facility_id', 'label')}
+        for s in objs:
+            s.pk = ids[(s.facility_id, s.label)]
+    SlotStatus.objects.bulk_create([SlotStatus(slot_id=s.pk, facility_id=s.facility_id) for s in objs],
+                                   ignore_conflicts=True)
+
+
+def _upsert(slots):
+    """upsert one chunk of _slot() tuples and create missing SlotStatus rows; returns the number of new slots"""
+    with transaction.atomic():
+        existing = set(ParkingSlot.objects.filter(facility_id__in={s[0] for s in slots},
+                                                  label__in=[s[1] for s in slots])
+                       .values_list('facility_id', 'label'))
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                _upsert_sql(cursor, slots)
+        else:
+            _upsert_orm(slots)
+    return sum(s[:2] not in existing for s in slots)
+
+
+def import_slots(rows, facility=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    upsert slots from row dicts (a 'facility' code per row overrides facility, default the main facility);
+    each chunk commits on its own. returns (slots imported, of which new)
+    """
+    default = facility or Facility.objects.get(code=DEFAULT_FACILITY_CODE)
+    facility_ids = {default.code: default.pk}
+    chunk, total, created = {}, 0, 0
+    touched = set()
+
+    def flush():
+        nonlocal total, created
+        created += _upsert(list(chunk.values()))
+        total += len(chunk)
+        touched.update(facility_id for facility_id, _ in chunk)
+        chunk.clear()
+
+    try:
+        for row in rows:
+            code = row.get('facility') or default.code
+            if code not in facility_ids:
+                facility_ids[code] = Facility.objects.get(code=code).pk
+            slot = _slot(row, facility_ids[code])
+            chunk[slot[:2]] = slot  # last row wins within a chunk
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        # chunks already committed must reach the snapshot and the counters even if a later row failed
+        if total:
+            slot_snapshot.invalidate()
+            for facility_id in sorted(touched):
+                zones.reconcile(facility_id)
+    return total, created
+
+
+def reset_zone(zone, status='free', facility_id=None, keep_reserved=True):
+    """
+    set every slot of the zone to status in one UPDATE; returns the number of slots changed.
+    reserved slots are only reset with keep_reserved=False
+    """
+    features = connection.features
+    with transaction.atomic():
+        rows = SlotStatus.objects.filter(slot__zone=zone).exclude(status=status)
+        if facility_id:
+            rows = rows.filter(facility_id=facility_id)
+        if keep_reserved:
+            rows = rows.exclude(status='reserved')
+        locked = rows
+        if features.has_select_for_update:
+            locked = rows.select_for_update(of=('self',) if features.has_select_for_update_of else ())
+        changes = list(locked.values_list('slot_id', 'status'))
+        if not changes:
+            return 0
+        rows.update(status=status, last_update=timezone.now())
+        slot_status_changed.send(sender=SlotStatus, changes=[(slot_id, old, status) for slot_id, old in changes])
+    return len(changes)
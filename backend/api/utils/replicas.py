@@ -0,0 +1,75 @@
+"""
+Read replicas.
+
+DATABASE_REPLICA_URLS adds replica aliases (REPLICA_DATABASES). Writes always go
+to 'default'. Reads go to a random replica only inside reads() - the views
+that can live with replication lag opt in: slot listing, booking history,
+analytics, admin change lists - and only while the client isn't pinned to the
+primary. A request pins itself as soon as it writes anything, and
+ReplicaPinMiddleware keeps that client pinned for REPLICA_PIN_SECONDS through
+a cookie, so a user who has just booked sees the booking on the next page.
+
+Locally, two SQLite files stand in for primary and replica:
+
+    cp db.sqlite3 replica.sqlite3
+    DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py runserver
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA_DATABASES = getattr(settings, 'REPLICA_DATABASES', [])
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+PIN_COOKIE = 'db_pin'
+
+_allowed = contextvars.ContextVar('replica_reads', default=False)
+_request = contextvars.ContextVar('replica_request', default=None)  # {'pinned': bool, 'wrote': bool}
+
+
+@contextmanager
+def reads():
+    """let reads in this block go to a replica (unless the client is pinned to the primary)"""
+    token = _allowed.set(True)
+    try:
+        yield
+    finally:
+        _allowed.reset(token)
+
+
+def replica_reads(view):
+    """view decorator form of reads()"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        with reads():
+            return view(*args, **kwargs)
+    return wrapped
+
+
+@contextmanager
+def request_scope(pinned=False):
+    """per-request pinning state; yields it so the caller can see whether the request wrote"""
+    state = {'pinned': pinned, 'wrote': False}
+    token = _request.set(state)
+    try:
+        yield state
+    finally:
+        _request.reset(token)
+
+
+def read_db():
+    """replica alias for a read here and now, or None for the primary"""
+    if not REPLICA_DATABASES or not _allowed.get():
+        return None
+    state = _request.get()
+    if state and (state['pinned'] or state['wrote']):
+        return None
+    return random.choice(REPLICA_DATABASES)
+
+
+def wrote():
+    state = _request.get()
+    if state is not None:
+        state['wrote'] = True
@@ -0,0 +1,93 @@
+"""
+Time-window reservations.
+
+A slot can hold any number of active bookings as long as their
+[reserved_from, reserved_until) windows don't overlap. Overlap checks and the
+"which slots are free between T1 and T2" query are single NOT EXISTS queries
+backed by the (slot, reserved_from, reserved_until) index on Booking.
+
+Bookings whose window starts within RESERVATION_HOLD_AHEAD minutes also claim
+the slot's live SlotStatus (free -> reserved) through api.utils.allocation;
+later bookings only record the window.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from ..models import Booking, ParkingSlot
+from . import allocation
+
+HOLD_AHEAD = timedelta(minutes=getattr(settings, 'RESERVATION_HOLD_AHEAD', 15))
+CANDIDATE_WINDOW = getattr(settings, 'ALLOCATION_CANDIDATE_WINDOW', 16)
+MAX_ATTEMPTS = getattr(settings, 'ALLOCATION_MAX_ATTEMPTS', 5)
+
+
+class _Conflict(Exception):
+    pass
+
+
+def overlapping(start, end):
+    """active bookings whose window intersects [start, end)"""
+    return Booking.objects.filter(status='active', reserved_from__lt=end, reserved_until__gt=start)
+
+
+def is_immediate(start):
+    return start <= timezone.now() + HOLD_AHEAD
+
+
+def available_slots(start, end, zone=None, vehicle_type=None, facility=None):
+    """active slots with no overlapping booking (and not occupied right now, if the window is current)"""
+    qs = ParkingSlot.objects.filter(is_active=True).filter(
+        ~Exists(overlapping(start, end).filter(slot=OuterRef('pk'))))
+    if facility:
+        qs = qs.filter(facility_id=facility)
+    if zone:
+        qs = qs.filter(zone=zone)
+    if vehicle_type:
+        qs = qs.filter(max_vehicle_type=vehicle_type)
+    if is_immediate(start):
+        qs = qs.exclude(status__status='occupied')
+    return qs
+
+
+def _pick_future(start, end, zone, vehicle_type, slot_id, facility):
+    features = connection.features
+    # zone is a preference, like in allocation.claim_slot
+    for scope in ([zone, None] if zone and not slot_id else [zone]):
+        qs = available_slots(start, end, scope, vehicle_type, facility)
+        if slot_id:
+            qs = qs.filter(pk=slot_id)
+        if features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True, of=('self',) if features.has_select_for_update_of else ())
+        ids = list(qs.values_list('pk', flat=True)[:CANDIDATE_WINDOW])
+        if ids:
+            return ParkingSlot.objects.get(pk=random.choice(ids))
+    raise allocation.NoFreeSlot()
+
+
+def reserve(start, end, zone=None, vehicle_type=None, slot_id=None, facility=None):
+    """
+    pick a slot (in facility, an id, if given) with no booking overlapping [start, end) and return it.
+    call inside the caller's transaction; the slot row stays locked until it commits,
+    so a concurrent booking for the same slot re-checks after we're done. raises NoFreeSlot.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                if is_immediate(start):
+                    busy = overlapping(start, end)
+                    slot = allocation.claim_slot(zone, vehicle_type, slot_id, busy=busy, facility=facility).slot
+                else:
+                    slot = _pick_future(start, end, zone, vehicle_type, slot_id, facility)
+                # lock the slot row and re-check: another booking may have committed meanwhile
+                list(ParkingSlot.objects.select_for_update().filter(pk=slot.pk).values_list('pk'))
+                if overlapping(start, end).filter(slot=slot).exists():
+                    raise _Conflict()
+                return slot
+        except _Conflict:
+            continue
+    raise allocation.NoFreeSlot()
@@ -0,0 +1,129 @@
+"""
+SensorEvent rollups and retention.
+
+Raw readings are aggregated into per-slot, per-sensor-type minute buckets, and
+minute buckets into hour buckets (count, min, max, mean, occupied count). Each
+run recomputes from a little before the last rolled-up bucket (to pick up
+late-arriving gateway readings) up to the last closed bucket, upserting rows,
+so runs are idempotent. Raw rows past the retention age are then deleted in
+bounded batches, each in its own short transaction, and never ahead of what
+has been rolled up. Everything runs per facility, on the facility's telemetry
+database (api.utils.facilities), through the (facility, ts) and
+(facility, granularity, bucket) indexes.
+
+Reporting should read SensorRollup (see occupancy_series) rather than SensorEvent.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import Cast, TruncHour, TruncMinute
+from django.utils import timezone
+
+from ..models import Facility, SensorEvent, SensorRollup
+from . import facilities
+
+OCCUPIED_THRESHOLD_CM = getattr(settings, 'OCCUPIED_THRESHOLD_CM', 40)
+ROLLUP_LATENESS = timedelta(minutes=getattr(settings, 'SENSOR_ROLLUP_LATENESS_MINUTES', 10))
+CHUNK = {'minute': timedelta(hours=1), 'hour': timedelta(days=1)}
+UPDATE_FIELDS = ['count', 'occupied_count', 'min_value', 'max_value', 'mean_value']
+
+
+def _floor(ts, granularity):
+    ts = ts.replace(second=0, microsecond=0)
+    return ts.replace(minute=0) if granularity == 'hour' else ts
+
+
+def _upsert(db, facility_id, rows, granularity):
+    objs = [SensorRollup(slot_id=r['slot_id'], facility_id=facility_id, sensor_type=r['sensor_type'], granularity=granularity,
+                         bucket=r['bucket'], count=r['count'], occupied_count=r['occupied'],
+                         min_value=r['min'], max_value=r['max'], mean_value=r['mean'])
+            for r in rows]
+    SensorRollup.objects.using(db).bulk_create(objs, batch_size=1000, update_conflicts=True,
+                                     unique_fields=['slot', 'sensor_type', 'granularity', 'bucket'],
+                                     update_fields=UPDATE_FIELDS)
+    return len(objs)
+
+
+def _minute_rows(events, start, end):
+    return (events.filter(ts__gte=start, ts__lt=end)
+            .annotate(bucket=TruncMinute('ts')).values('slot_id', 'sensor_type', 'bucket')
+            .annotate(count=Count('id'), occupied=Count('id', filter=Q(value__lt=OCCUPIED_THRESHOLD_CM)),
+                      min=Min('value'), max=Max('value'), mean=Avg('value')))
+
+
+def _hour_rows(minutes, start, end):
+    rows = (minutes.filter(bucket__gte=start, bucket__lt=end)
+            .annotate(hour=TruncHour('bucket')).values('slot_id', 'sensor_type', 'hour')
+            .annotate(weighted=Sum(F('mean_value') * Cast('count', FloatField())), n=Sum('count'),
+                      occupied=Sum('occupied_count'), min=Min('min_value'), max=Max('max_value')))
+    for r in rows:
+        r['count'] = r.pop('n')
+        r['bucket'] = r.pop('hour')
+        r['mean'] = r.pop('weighted') / r['count'] if r['count'] else None
+        yield r
+
+
+def _rollup_facility(granularity, facility_id, end):
+    db = facilities.telemetry_db(facility_id)
+    if granularity == 'minute':
+        source, field = SensorEvent.objects.using(db).filter(facility_id=facility_id), 'ts'
+    else:
+        source, field = SensorRollup.objects.using(db).filter(facility_id=facility_id, granularity='minute'), 'bucket'
+    last = (SensorRollup.objects.using(db).filter(facility_id=facility_id, granularity=granularity)
+            .order_by('-bucket').values_list('bucket', flat=True).first())
+    start = _floor(last - ROLLUP_LATENESS, granularity) if last else None
+    upserted = 0
+    while True:
+        # skip gaps: jump to the next bucket that has data
+        qs = source.filter(**{f'{field}__gte': start}) if start else source
+        nxt = qs.order_by(field).values_list(field, flat=True).first()
+        if nxt is None or nxt >= end:
+            break
+        start = _floor(nxt, granularity)
+        stop = min(start + CHUNK[granularity], end)
+        rows = _minute_rows(source, start, stop) if granularity == 'minute' else _hour_rows(source, start, stop)
+        upserted += _upsert(db, facility_id, rows, granularity)
+        start = stop
+    return upserted
+
+
+def rollup(granularity, now=None, facility_id=None):
+    """
+    roll closed buckets of one granularity for one facility (default: each in turn);
+    returns (rows upserted, end of rolled range)
+    """
+    end = _floor(now or timezone.now(), granularity)
+    ids = [facility_id] if facility_id else Facility.objects.values_list('pk', flat=True)
+    return sum(_rollup_facility(granularity, pk, end) for pk in ids), end
+
+
+def delete_in_batches(qs, batch_size, pause=0.0):
+    """delete qs in primary-key batches so no single statement holds locks for long"""
+    manager = qs.model._base_manager.db_manager(qs.db)
+    deleted = 0
+    while True:
+        ids = list(qs.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        manager.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def occupancy_series(slot_ids, start, end, granularity='hour', using='default'):
+    """
+    [{bucket, count, occupied_fraction, mean, min, max}] across slot_ids, read from rollups;
+    using: the slots' telemetry database (facilities.telemetry_db)
+    """
+    rows = (SensorRollup.objects.using(using).filter(slot_id__in=slot_ids, granularity=granularity,
+                                        bucket__gte=start, bucket__lt=end)
+            .values('bucket').order_by('bucket')
+            .annotate(weighted=Sum(F('mean_value') * Cast('count', FloatField())), n=Sum('count'),
+                      occupied=Sum('occupied_count'), min=Min('min_value'), max=Max('max_value')))
+    return [{'bucket': r['bucket'], 'count': r['n'],
+             'occupied_fraction': r['occupied'] / r['n'] if r['n'] else None,
+             'mean': r['weighted'] / r['n'] if r['n'] else None,
+             'min': r['min'], 'max': r['max']} for r in rows]
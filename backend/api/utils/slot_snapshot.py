@@ -0,0 +1,79 @@
+"""
+Cached snapshot of the slot list for display boards.
+
+The serialized list (and a compact label -> status map) is built once per
+version and kept in the cache; the version is bumped whenever a slot or its
+status changes (see api.signals), so pollers get the same bytes - or a 304 -
+until something actually moves. The version has to be seen by every worker,
+which is why settings require a shared cache (redis) unless DEBUG is on.
+Each facility's list is a snapshot of its own (sharing the version), next to
+the all-facilities one, whose compact map is keyed by facility code, then
+label (labels are only unique within a facility). The full list and the
+compact map carry ETags of their own. Snapshots are always built from the
+primary: one built from a lagging replica would be cached under the new
+version and stay stale until the next change.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from ..models import ParkingSlot
+from ..serializers import ParkingSlotSerializer
+
+VERSION_KEY = 'slots:version'
+SNAPSHOT_TTL = 3600
+
+
+def version():
+    v = cache.get(VERSION_KEY)
+    if v is None:
+        # start from the clock so a flushed cache never reissues an old ETag
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        v = cache.get(VERSION_KEY)
+    return v
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        version()
+
+
+def _build(v, facility_id):
+    slots = ParkingSlot.objects.using(DEFAULT_DB_ALIAS).select_related('status', 'facility').order_by('label')
+    if facility_id:
+        slots = slots.filter(facility_id=facility_id)
+    slots = list(slots)
+    updates = [s.status.last_update for s in slots if hasattr(s, 'status')]
+    last_modified = int(max(updates).timestamp()) if updates else None
+    data = ParkingSlotSerializer(slots, many=True).data
+    if facility_id:
+        compact = {row['label']: row['status'] for row in data}
+    else:
+        compact = {}
+        for slot, row in zip(slots, data):
+            compact.setdefault(slot.facility.code, {})[row['label']] = row['status']
+    tag = f'slots-{facility_id}-{v}' if facility_id else f'slots-{v}'
+    return {
+        'etag': f'"{tag}"',
+        'compact_etag': f'"{tag}-compact"',
+        'last_modified': last_modified,
+        'slots': [dict(row) for row in data],
+        'compact': compact,
+    }
+
+
+def get(facility_id=None):
+    """
+    the current snapshot of all slots, or of one facility's:
+    {'etag', 'compact_etag', 'last_modified' (epoch seconds or None), 'slots', 'compact'}
+    """
+    v = version()
+    key = f'slots:snapshot:{facility_id}:{v}' if facility_id else f'slots:snapshot:{v}'
+    snap = cache.get(key)
+    if snap is None:
+        snap = _build(v, facility_id)
+        cache.set(key, snap, SNAPSHOT_TTL)
+    return snap
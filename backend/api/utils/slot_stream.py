@@ -0,0 +1,153 @@
+"""
+Push-based slot status streaming (Server-Sent Events over ASGI).
+
+Committed status transitions (api.signals.slot_status_changed) are appended to
+a short sequence log in the shared cache. Each ASGI worker runs one tail task
+that reads new log entries - woken immediately for transitions made in the same
+process, otherwise every STREAM_POLL_INTERVAL seconds - and fans them out to its
+subscribers, so the cost per transition is independent of the number of
+connected boards and nothing polls the database.
+
+publish() takes a sequence number before it stores the event under it, so a
+tail can see the number first; a missing event is retried for up to
+STREAM_MISSING_GRACE seconds before it counts as expired and subscribers are
+resynced. The log has to be shared by every worker, which is why settings
+require redis unless DEBUG is on.
+
+Every subscriber has a bounded queue. A consumer that falls STREAM_QUEUE_SIZE
+batches behind has its backlog dropped and is sent a fresh snapshot instead,
+which keeps memory per connection bounded.
+"""
+import asyncio
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ..models import ParkingSlot
+
+STREAM_POLL_INTERVAL = getattr(settings, 'STREAM_POLL_INTERVAL', 0.5)
+STREAM_QUEUE_SIZE = getattr(settings, 'STREAM_QUEUE_SIZE', 100)
+STREAM_LOG_TTL = getattr(settings, 'STREAM_LOG_TTL', 300)
+STREAM_MISSING_GRACE = getattr(settings, 'STREAM_MISSING_GRACE', 0.5)  # seconds, see _read_event
+
+SEQ_KEY = 'slots:stream:seq'
+RESYNC = 'resync'
+
+
+def _event_key(seq):
+    return f'slots:stream:{seq}'
+
+
+def publish(changes):
+    """append committed (slot_id, old, new) changes to the stream log"""
+    slots = ParkingSlot.objects.in_bulk([c[0] for c in changes])
+    events = [{'slot': slot_id, 'label': slots[slot_id].label, 'zone': slots[slot_id].zone,
+               'facility': slots[slot_id].facility_id, 'status': new, 'previous': old}
+              for slot_id, old, new in changes if slot_id in slots]
+    if not events:
+        return
+    cache.add(SEQ_KEY, 0, None)
+    seq = cache.incr(SEQ_KEY)
+    cache.set(_event_key(seq), events, STREAM_LOG_TTL)
+    broker.wake()
+
+
+class Subscription:
+    def __init__(self, zones, facility_id=None, maxsize=STREAM_QUEUE_SIZE):
+        self.zones = set(zones)
+        self.facility_id = facility_id
+        self.queue = asyncio.Queue(maxsize)
+        self.resync_pending = False
+
+    def offer(self, events):
+        if self.facility_id:
+            events = [e for e in events if e['facility'] == self.facility_id]
+        if self.zones:
+            events = [e for e in events if e['zone'] in self.zones]
+        if not events or self.resync_pending:
+            return
+        try:
+            self.queue.put_nowait(events)
+        except asyncio.QueueFull:
+            self.resync()
+
+    def resync(self):
+        # drop the backlog; the consumer gets a snapshot instead
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+        self.resync_pending = True
+
+    async def get(self):
+        """next list of events for this subscriber, or RESYNC"""
+        item = await self.queue.get()
+        if item == RESYNC:
+            self.resync_pending = False
+        return item
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers = set()
+        self._loop = None
+        self._wake = None
+        self._task = None
+
+    async def subscribe(self, zones=(), facility_id=None):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            last = await cache.aget(SEQ_KEY, 0)
+            if self._task is None or self._task.done() or self._loop is not loop:
+                self._loop = loop
+                self._wake = asyncio.Event()
+                self._task = loop.create_task(self._tail(last))
+        sub = Subscription(zones, facility_id)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+    def wake(self):
+        """called from any thread after a publish in this process"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    def _resync_all(self):
+        for sub in list(self.subscribers):
+            if not sub.resync_pending:
+                sub.resync()
+
+    async def _read_event(self, seq):
+        # a publisher may have taken seq without having stored its event yet
+        delay, waited = 0.005, 0.0
+        while True:
+            events = await cache.aget(_event_key(seq))
+            if events is not None or waited >= STREAM_MISSING_GRACE:
+                return events
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 0.1)
+
+    async def _tail(self, last):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self._wake.wait(), STREAM_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            seq = await cache.aget(SEQ_KEY, 0)
+            if seq < last:  # cache was flushed
+                self._resync_all()
+            for n in range(last + 1, seq + 1):
+                events = await self._read_event(n)
+                if events is None:  # expired before we read it (or its publisher died)
+                    self._resync_all()
+                    break
+                for sub in list(self.subscribers):
+                    sub.offer(events)
+            last = seq
+
+
+broker = Broker()
@@ -0,0 +1,112 @@
+"""
+Per-zone availability counters.
+
+Entrance signs and the app only need "N free in zone B". ZoneAvailability
+keeps the free / occupied / reserved counts of each (facility, zone)'s active
+slots, so reading them is one indexed row per zone instead of counting
+SlotStatus rows.
+
+Every status change - sensors, bookings, arrivals, entry / exit, the expiry
+sweep - sends slot_status_changed inside its transaction, and apply() moves
+the counters there with F() increments, so they commit or roll back with the
+change. A zone without a counter row yet is counted from scratch instead.
+Slot edits that move a slot between zones of its facility (or (de)activate
+it) and slot deletes recount the zones involved; slots never change facility. Changes made behind the signal's back
+(raw update(), bulk_create) are caught by reconcile(), run periodically with
+`manage.py reconcile_zone_counters`.
+
+A recount locks the counter row before counting, so a status change that
+commits meanwhile applies its increment after the recount rather than being
+overwritten by it.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from ..models import ParkingSlot, SlotStatus, ZoneAvailability
+from . import metrics
+
+STATUSES = ('free', 'occupied', 'reserved')
+
+
+def apply(changes):
+    """move the counters for [(slot_id, old_status, new_status), ...]; call inside the change's transaction"""
+    slots = {pk: (facility_id, zone) for pk, facility_id, zone in
+             ParkingSlot.objects.filter(pk__in={c[0] for c in changes}, is_active=True)
+             .values_list('pk', 'facility_id', 'zone')}
+    deltas = {}
+    for slot_id, old, new in changes:
+        if slot_id in slots:
+            delta = deltas.setdefault(slots[slot_id], Counter())
+            if old in STATUSES:
+                delta[old] -= 1
+            if new in STATUSES:
+                delta[new] += 1
+    now = timezone.now()
+    for (facility_id, zone), delta in sorted(deltas.items()):  # fixed order, no lock cycles between zones
+        updates = {status: F(status) + n for status, n in delta.items() if n}
+        if not updates:
+            continue
+        if not ZoneAvailability.objects.filter(facility_id=facility_id, zone=zone).update(updated_at=now, **updates):
+            recount(facility_id, zone)
+
+
+def _counts(facility_id, zone):
+    return SlotStatus.objects.filter(facility_id=facility_id, slot__zone=zone, slot__is_active=True).aggregate(
+        **{status: Count('pk', filter=Q(status=status)) for status in STATUSES})
+
+
+def recount(facility_id, zone):
+    """set the zone's counters from its SlotStatus rows; returns True if they had drifted"""
+    with transaction.atomic():
+        ZoneAvailability.objects.bulk_create([ZoneAvailability(facility_id=facility_id, zone=zone)],
+                                             ignore_conflicts=True)
+        row = ZoneAvailability.objects.select_for_update().get(facility_id=facility_id, zone=zone)
+        counts = _counts(facility_id, zone)
+        drifted = any(getattr(row, status) != counts[status] for status in STATUSES)
+        if drifted:
+            ZoneAvailability.objects.filter(pk=row.pk).update(updated_at=timezone.now(), **counts)
+    return drifted
+
+
+def reconcile(facility_id=None):
+    """
+    recount every zone (of one facility), drop counters of zones without active slots;
+    returns the number of zones whose counters had drifted
+    """
+    slots = ParkingSlot.objects.filter(is_active=True)
+    rows = ZoneAvailability.objects.all()
+    if facility_id:
+        slots, rows = slots.filter(facility_id=facility_id), rows.filter(facility_id=facility_id)
+    live = set(slots.values_list('facility_id', 'zone').distinct())
+    rows.exclude(pk__in=[pk for pk, f, z in rows.values_list('pk', 'facility_id', 'zone') if (f, z) in live]).delete()
+    drifted = 0
+    for facility, zone in sorted(live):
+        if recount(facility, zone):
+            metrics.zone_counter_drift.inc()
+            drifted += 1
+    return drifted
+
+
+def slot_changed(slot, deleted=False):
+    """recount the zones a slot left and joined (edit of zone or is_active, or a delete)"""
+    before = slot._loaded_zone
+    after = None if deleted else (slot.facility_id, slot.zone, slot.is_active)
+    slot._loaded_zone = after
+    if before is None or before == after:
+        return  # a new slot has no status yet; its SlotStatus counts itself in
+    for facility_id, zone in sorted({before[:2]} | ({after[:2]} if after else set())):
+        recount(facility_id, zone)
+
+
+def availability(facility_id=None, zone=None):
+    """[{facility, zone, free, occupied, reserved, updated_at}] straight from the counters"""
+    rows = ZoneAvailability.objects.select_related('facility').order_by('facility_id', 'zone')
+    if facility_id:
+        rows = rows.filter(facility_id=facility_id)
+    if zone is not None:
+        rows = rows.filter(zone=zone)
+    return [{'facility': r.facility.code, 'zone': r.zone, 'free': r.free, 'occupied': r.occupied,
+             'reserved': r.reserved, 'updated_at': r.updated_at} for r in rows]
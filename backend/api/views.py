@@ -1,21 +1,37 @@
 import os
 import io
 import json
+import math
+import asyncio
 from datetime import timedelta, datetime
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 
-from rest_framework import viewsets, status, permissions, generics
+from django.db import transaction
+
+from rest_framework import viewsets, status, permissions, generics, serializers
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import authenticate, login, logout
-from .models import ParkingSlot, SlotStatus, Booking, VehicleLog, SensorEvent
+from .models import Facility, ParkingSlot, SlotStatus, Booking, VehicleLog, SensorEvent, OcrJob
 from .serializers import (ParkingSlotSerializer, SlotStatusSerializer,
                           BookingSerializer, BookingCreateSerializer,
-                          VehicleLogSerializer, SensorEventSerializer, UserSerializer)
+                          VehicleLogSerializer, SensorEventSerializer, UserSerializer,
+                          OcrJobSerializer)
 from django.contrib.auth.models import User
+from .pagination import KeysetPagination
+from .signals import slot_status_changed
+from .utils import (allocation, analytics, arrivals, debounce, devices, event_buffer, exports, facilities, metrics,
+                    ocr_jobs, ocr_utils, plates, replicas, reservations, rollups, slot_snapshot, slot_stream, zones)
 
 # ---- Simple Auth endpoints (session-based)
 class LoginView(APIView):
@@ -34,14 +50,150 @@ class LogoutView(APIView):
         logout(request)
         return Response({'detail':'Logged out'})
 
+def _facility_id(code):
+    """id of the facility with this code (None for no code); unknown codes are a 404"""
+    try:
+        facility = facilities.from_code(code)
+    except Facility.DoesNotExist:
+        raise NotFound('facility not found')
+    return facility.pk if facility else None
+
+class ReplicaReadsMixin:
+    """runs the actions in replica_actions with replica reads allowed (see api.utils.replicas)"""
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.action_map.get(request.method.lower()) in self.replica_actions:  # (self.action isn't set yet)
+            with replicas.reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+def _query_datetime(params, name):
+    """the ISO datetime in query parameter name, made aware if naive; None if missing or invalid"""
+    try:
+        value = parse_datetime(params.get(name) or '')
+    except ValueError:  # well formed but not a real date
+        return None
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
 # ---- Slots
-class SlotViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = ParkingSlot.objects.all().order_by('label')
+class SlotViewSet(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = ParkingSlot.objects.select_related('status').order_by('label')
     serializer_class = ParkingSlotSerializer
     permission_classes = [permissions.AllowAny]
+    replica_actions = ('list', 'retrieve', 'available', 'occupancy')
+
+    def list(self, request, *args, **kwargs):
+        """
+        served from a cached snapshot; honours If-None-Match / If-Modified-Since with a 304.
+        compact=1 returns a {label: status} map for display boards ({facility code: {label: status}} across
+        facilities); facility=<code> limits it to one facility
+        """
+        snap = slot_snapshot.get(_facility_id(request.query_params.get('facility')))
+        compact = str(request.query_params.get('compact', '')).lower() in ('1', 'true', 'yes')
+        etag = snap['compact_etag'] if compact else snap['etag']
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=snap['last_modified'])
+        if not_modified is not None:
+            return not_modified
+        resp = Response(snap['compact'] if compact else snap['slots'])
+        resp['ETag'] = etag
+        if snap['last_modified']:
+            resp['Last-Modified'] = http_date(snap['last_modified'])
+        resp['Cache-Control'] = 'no-cache'
+        return resp
+
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        """
+        slots with no booking overlapping the window
+        expects: from, until (ISO datetimes), facility, zone, vehicle_type (optional)
+        """
+        facility_id = _facility_id(request.query_params.get('facility'))
+        start = _query_datetime(request.query_params, 'from')
+        end = _query_datetime(request.query_params, 'until')
+        if not start or not end or start >= end:
+            return Response({'detail':'from and until required (ISO datetimes, from < until)'}, status=400)
+        qs = reservations.available_slots(start, end, zone=request.query_params.get('zone'),
+                                          vehicle_type=request.query_params.get('vehicle_type'), facility=facility_id)
+        return Response(ParkingSlotSerializer(qs.select_related('status').order_by('label'), many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def occupancy(self, request, pk=None):
+        """
+        sensor occupancy series for one slot, read from the rollup tables
+        expects: from, until (ISO datetimes), granularity (hour | minute, default hour)
+        """
+        slot = self.get_object()
+        granularity = request.query_params.get('granularity', 'hour')
+        start = _query_datetime(request.query_params, 'from')
+        end = _query_datetime(request.query_params, 'until')
+        if granularity not in ('hour', 'minute') or not start or not end:
+            return Response({'detail':'from, until (ISO datetimes) and granularity hour|minute required'}, status=400)
+        return Response(rollups.occupancy_series([slot.id], start, end, granularity,
+                                                 using=facilities.telemetry_db(slot.facility_id)))
+
+# ---- Zone availability counters (signs, app)
+@replicas.replica_reads
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def zone_availability(request):
+    """
+    free / occupied / reserved counts per zone, read from the counters kept by api.utils.zones
+    expects: facility (code), zone (optional)
+    """
+    facility_id = _facility_id(request.query_params.get('facility'))
+    return Response({'zones': zones.availability(facility_id, request.query_params.get('zone'))})
+
+# ---- Slot status streaming (Server-Sent Events, ASGI only)
+STREAM_HEARTBEAT = getattr(settings, 'STREAM_HEARTBEAT', 15)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _zone_snapshot(zones, facility_id):
+    snap = await sync_to_async(slot_snapshot.get)(facility_id)
+    return [s for s in snap['slots'] if not zones or s['zone'] in zones]
+
+async def slot_status_stream(request):
+    """
+    text/event-stream of slot status: a 'snapshot' event on connect (and after falling behind),
+    then 'delta' events as statuses change. zone=A&zone=B limits the stream to those zones,
+    facility=<code> to one facility.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail':'streaming requires the ASGI server (parking.asgi)'}, status=501)
+    zones = request.GET.getlist('zone')
+    try:
+        facility_id = await sync_to_async(_facility_id)(request.GET.get('facility'))
+    except NotFound as e:
+        return JsonResponse({'detail':str(e.detail)}, status=404)
+    sub = await slot_stream.broker.subscribe(zones, facility_id)
+
+    async def events():
+        try:
+            yield _sse('snapshot', await _zone_snapshot(zones, facility_id))
+            while True:
+                try:
+                    item = await asyncio.wait_for(sub.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if item == slot_stream.RESYNC:
+                    yield _sse('snapshot', await _zone_snapshot(zones, facility_id))
+                else:
+                    yield _sse('delta', item)
+        finally:
+            slot_stream.broker.unsubscribe(sub)
+
+    resp = StreamingHttpResponse(events(), content_type='text/event-stream')
+    resp['Cache-Control'] = 'no-cache'
+    resp['X-Accel-Buffering'] = 'no'
+    return resp
 
 # ---- Bookings
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all().order_by('-created_at')
     serializer_class = BookingSerializer
 
@@ -59,89 +211,268 @@ class BookingViewSet(viewsets.ModelViewSet):
         user = self.request.user
         vehicle = serializer.validated_data.get('vehicle_number')
         eta = serializer.validated_data.get('eta')
+        requested = serializer.validated_data.get('slot')
+        facility = serializer.validated_data.get('facility')
 
-        # allocation logic: find first free slot (status.free) and reserve it
-        slotstatus = SlotStatus.objects.filter(status='free').select_related('slot').first()
-        if not slotstatus:
-            raise serializers.ValidationError({'detail':'No free slots available'})
-
-        slot = slotstatus.slot
-        # mark reserved
-        slotstatus.status = 'reserved'
         now = timezone.now()
-        slotstatus.save()
         # reserved_from = eta - 10 minutes (or now)
         reserved_from = eta - timedelta(minutes=15) if eta else now
         reserved_until = eta + timedelta(minutes=15) if eta else now + timedelta(minutes=30)
-        booking = Booking.objects.create(user=user, slot=slot, vehicle_number=vehicle,
-                                         eta=eta, reserved_from=reserved_from,
-                                         reserved_until=reserved_until)
+
+        with transaction.atomic():
+            # allocation logic: pick a slot with no overlapping booking (zone / vehicle type preferences);
+            # bookings starting soon also reserve the slot's live status
+            try:
+                slot = reservations.reserve(reserved_from, reserved_until,
+                                            zone=serializer.validated_data.get('zone'),
+                                            vehicle_type=serializer.validated_data.get('vehicle_type'),
+                                            slot_id=requested.id if requested else None,
+                                            facility=facility.pk if facility else None)
+            except allocation.NoFreeSlot:
+                zone = serializer.validated_data.get('zone') or ''
+                vtype = serializer.validated_data.get('vehicle_type') or ''
+                # labels come from the client: only values some slot actually has, so they stay bounded
+                if zone and not ParkingSlot.objects.filter(zone=zone).exists():
+                    zone = 'other'
+                if vtype and not ParkingSlot.objects.filter(max_vehicle_type=vtype).exists():
+                    vtype = 'other'
+                metrics.allocation_failures.inc(zone, vtype)
+                raise serializers.ValidationError({'detail':'No free slots available'})
+
+            booking = Booking.objects.create(user=user, slot=slot, vehicle_number=vehicle,
+                                             eta=eta, reserved_from=reserved_from,
+                                             reserved_until=reserved_until)
+        serializer.instance = booking
         return booking
 
     def list(self, request, *args, **kwargs):
-        qs = Booking.objects.filter(user=request.user).order_by('-created_at')
-        serializer = BookingSerializer(qs, many=True)
-        return Response(serializer.data)
+        """
+        the user's bookings, newest first, in keyset pages (see api.pagination)
+        filters: status, facility (code), from / until (ISO datetimes, on created_at), page_size, cursor
+        """
+        qs = Booking.objects.filter(user=request.user).select_related('slot', 'user')
+        if request.query_params.get('facility'):
+            qs = qs.filter(facility_id=_facility_id(request.query_params['facility']))
+        if request.query_params.get('status'):
+            qs = qs.filter(status=request.query_params['status'])
+        for param, lookup in (('from', 'created_at__gte'), ('until', 'created_at__lt')):
+            if request.query_params.get(param):
+                value = _query_datetime(request.query_params, param)
+                if value is None:
+                    return Response({'detail':f'{param} must be an ISO datetime'}, status=400)
+                qs = qs.filter(**{lookup: value})
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(BookingSerializer(page, many=True).data)
 
 # ---- Sensor ingestion with debounce logic
-# simple device token validation
-SENSOR_DEVICE_TOKEN = getattr(settings, 'SENSOR_DEVICE_TOKEN', 'DEVKEY12345')
-OCCUPIED_THRESHOLD_CM = getattr(settings, 'OCCUPIED_THRESHOLD_CM', 40)  # <40cm => occupied
+SENSOR_BATCH_MAX = getattr(settings, 'SENSOR_BATCH_MAX', 1000)
+SLOT_ID_MAX = 2 ** 63 - 1  # BigAutoField
+SENSOR_TYPE_MAX_LENGTH = SensorEvent._meta.get_field('sensor_type').max_length
+
+def _sensor_device(token):
+    """
+    (credential, None) for a device key within its rate, else (None, error response);
+    no ORM work unless the key isn't cached yet, see api.utils.devices
+    """
+    device = devices.authenticate(token)
+    if device is None:
+        metrics.sensor_rejections.inc('auth')
+        return None, Response({'detail':'invalid device token'}, status=401)
+    wait = devices.throttle(device)
+    if wait:
+        metrics.sensor_rejections.inc('rate')
+        return None, Response({'detail':'rate limit exceeded'}, status=429,
+                              headers={'Retry-After': str(max(1, math.ceil(min(wait, 3600))))})
+    return device, None
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def sensor_event(request):
     # require a header x-device-key
     token = request.headers.get('x-device-key') or request.data.get('device_key')
-    if token != SENSOR_DEVICE_TOKEN:
-        return Response({'detail':'invalid device token'}, status=401)
+    device, error = _sensor_device(token)
+    if error:
+        return error
 
     slot_id = request.data.get('slot_id')
     sensor_type = request.data.get('sensor_type', 'ultrasonic')
     value = request.data.get('value')
     if slot_id is None or value is None:
         return Response({'detail':'slot_id and value required'}, status=400)
+    if not device.allows(slot_id):
+        metrics.sensor_rejections.inc('slot')
+        return Response({'detail':'slot not assigned to this device'}, status=403)
 
     try:
         slot = ParkingSlot.objects.get(pk=slot_id)
     except ParkingSlot.DoesNotExist:
         return Response({'detail':'slot not found'}, status=404)
 
-    # save sensor event
-    SensorEvent.objects.create(slot=slot, sensor_type=sensor_type, value=float(value))
+    # debounce against the shared window first, then save sensor event
+    status_to_set = debounce.observe(slot, sensor_type, [value])
+    event_buffer.save([SensorEvent(slot=slot, facility_id=slot.facility_id, sensor_type=sensor_type,
+                                   value=float(value))])
 
-    # debounce logic: check last N events
-    last_events = SensorEvent.objects.filter(slot=slot, sensor_type=sensor_type).order_by('-ts')[:5]
-    occupied_count = sum(1 for e in last_events if float(e.value) < OCCUPIED_THRESHOLD_CM)
-    status_to_set = 'occupied' if occupied_count >= 3 else 'free'
     # If there's an active reservation overlapping now and vehicle is approaching, might remain reserved
     ss, _ = SlotStatus.objects.get_or_create(slot=slot)
     if ss.status != status_to_set:
+        metrics.debounce_transitions.inc(ss.status, status_to_set)
         ss.status = status_to_set
         ss.save()
     return Response({'status': ss.status})
 
+def _parse_reading(reading):
+    """
+    validate one batch reading; returns (slot_id, sensor_type, value, ts) or raises ValueError
+    """
+    if not isinstance(reading, dict):
+        raise ValueError('reading must be an object')
+    slot_id = reading.get('slot_id')
+    value = reading.get('value')
+    if slot_id is None or value is None:
+        raise ValueError('slot_id and value required')
+    try:
+        slot_id = int(slot_id)
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('invalid slot_id or value')
+    if not 0 < slot_id <= SLOT_ID_MAX or not math.isfinite(value):
+        raise ValueError('invalid slot_id or value')
+    sensor_type = reading.get('sensor_type') or 'ultrasonic'
+    if not isinstance(sensor_type, str) or len(sensor_type) > SENSOR_TYPE_MAX_LENGTH:
+        raise ValueError(f'sensor_type must be a string of at most {SENSOR_TYPE_MAX_LENGTH} characters')
+    ts = reading.get('ts')
+    if ts:
+        try:
+            ts = datetime.fromisoformat(str(ts))
+        except ValueError:
+            raise ValueError('invalid ts')
+        if timezone.is_naive(ts):
+            ts = timezone.make_aware(ts)
+    return slot_id, sensor_type, value, ts or None
+
+@api_view(['POST'])
+@permission_classes([permissions.AllowAny])
+def sensor_event_batch(request):
+    """
+    Batch ingestion for gateways.
+    expects: {"readings": [{slot_id, sensor_type, value, ts}, ...]} (or a bare list)
+    returns a result per reading and the final status of every affected slot
+    """
+    payload = request.data
+    readings = payload if isinstance(payload, list) else payload.get('readings') if isinstance(payload, dict) else None
+    token = request.headers.get('x-device-key')
+    if not token and isinstance(payload, dict):
+        token = payload.get('device_key')
+    device, error = _sensor_device(token)
+    if error:
+        return error
+    if not isinstance(readings, list) or not readings:
+        return Response({'detail':'readings list required'}, status=400)
+    if len(readings) > SENSOR_BATCH_MAX:
+        return Response({'detail':f'at most {SENSOR_BATCH_MAX} readings per batch'}, status=400)
+
+    results = [None] * len(readings)
+    parsed = []
+    for i, reading in enumerate(readings):
+        try:
+            reading = _parse_reading(reading)
+        except ValueError as e:
+            results[i] = {'index': i, 'ok': False, 'detail': str(e)}
+            continue
+        if not device.allows(reading[0]):
+            metrics.sensor_rejections.inc('slot')
+            results[i] = {'index': i, 'slot_id': reading[0], 'ok': False, 'detail': 'slot not assigned to this device'}
+            continue
+        parsed.append((i,) + reading)
+
+    # validate all slots in one query
+    slots = ParkingSlot.objects.in_bulk({p[1] for p in parsed})
+    now = timezone.now()
+    events = []
+    for i, slot_id, sensor_type, value, ts in parsed:
+        if slot_id not in slots:
+            results[i] = {'index': i, 'slot_id': slot_id, 'ok': False, 'detail': 'slot not found'}
+            continue
+        events.append(SensorEvent(slot_id=slot_id, facility_id=slots[slot_id].facility_id,
+                                  sensor_type=sensor_type, value=value, ts=ts or now))
+        results[i] = {'index': i, 'slot_id': slot_id, 'ok': True}
+
+    # feed each (slot, sensor_type) window in time order; the slot's newest reading decides its status
+    windows = {}
+    for e in sorted(events, key=lambda e: e.ts):
+        windows.setdefault((e.slot_id, e.sensor_type), []).append(e.value)
+    latest = {e.slot_id: e.sensor_type for e in sorted(events, key=lambda e: e.ts)}
+    decided = {key: debounce.observe(slots[key[0]], key[1], values) for key, values in windows.items()}
+    event_buffer.save(events)  # each facility's readings go to its telemetry database
+
+    statuses = {ss.slot_id: ss for ss in SlotStatus.objects.filter(slot_id__in=latest)}
+    changed = []
+    for slot_id, sensor_type in latest.items():
+        status_to_set = decided[(slot_id, sensor_type)]
+        ss = statuses.get(slot_id)
+        if ss is None:
+            statuses[slot_id] = SlotStatus.objects.create(slot=slots[slot_id], status=status_to_set)
+        elif ss.status != status_to_set:
+            metrics.debounce_transitions.inc(ss.status, status_to_set)
+            changed.append((slot_id, ss.status, status_to_set))
+            ss.status = status_to_set
+            ss.last_update = now
+    if changed:
+        with transaction.atomic():
+            SlotStatus.objects.bulk_update([statuses[c[0]] for c in changed], ['status', 'last_update'])
+            slot_status_changed.send(sender=SlotStatus, changes=changed)
+    return Response({'results': results,
+                     'slots': {str(slot_id): statuses[slot_id].status for slot_id in latest}})
+
 # ---- OCR upload endpoint (accepts multipart/form-data file)
+OCR_STORE_IMAGES = getattr(settings, 'OCR_STORE_IMAGES', True)
+OCR_MAX_UPLOAD_BYTES = getattr(settings, 'OCR_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+
+def _wants_sync(request):
+    return str(request.query_params.get('sync') or request.data.get('sync') or '').lower() in ('1', 'true', 'yes')
+
+def _read_upload(f):
+    """
+    upload bytes, or None if the file is over OCR_MAX_UPLOAD_BYTES.
+    OCR works on these bytes; the frame is written to MEDIA_ROOT only by _store_upload.
+    """
+    if f.size > OCR_MAX_UPLOAD_BYTES:
+        return None
+    return f.read()
+
+def _store_upload(data, name):
+    """content-addressed path under MEDIA_ROOT (identical frames are stored once), or None when storage is off"""
+    return ocr_utils.store_image(data, name) if OCR_STORE_IMAGES else None
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def ocr_plate(request):
-    # accepts 'image' file
+    """
+    accepts 'image' file; queues an OCR job and returns its id (202).
+    sync=1 waits up to OCR_SYNC_TIMEOUT seconds for the plate instead.
+    """
     f = request.FILES.get('image')
     if f is None:
         return Response({'detail':'image file required'}, status=400)
-    # save temporarily
-    folder = os.path.join(settings.MEDIA_ROOT, 'plates')
-    os.makedirs(folder, exist_ok=True)
-    file_path = os.path.join(folder, f"{int(timezone.now().timestamp())}_{f.name}")
-    with open(file_path, 'wb') as out:
-        for chunk in f.chunks():
-            out.write(chunk)
-    # attempt OCR
-    from .utils.ocr_utils import extract_plate_text
-    plate = extract_plate_text(file_path)
-    # return plate and stored path
-    rel_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-    return Response({'plate_text': plate, 'plate_image': f"/media/{rel_path}"})
+    data = _read_upload(f)
+    if data is None:
+        return Response({'detail':f'image larger than {OCR_MAX_UPLOAD_BYTES} bytes'}, status=413)
+    rel_path = _store_upload(data, f.name)
+    job = ocr_jobs.submit(data, image_path=rel_path, wait=_wants_sync(request))
+    data = {'job_id': str(job.id), 'status': job.status, 'plate_text': job.plate_text,
+            'plate_image': f"/media/{rel_path}" if rel_path else None}
+    return Response(data, status=200 if job.status in ('done', 'failed') else 202)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def ocr_job_status(request, job_id):
+    try:
+        job = OcrJob.objects.get(pk=job_id)
+    except OcrJob.DoesNotExist:
+        return Response({'detail':'ocr job not found'}, status=404)
+    return Response(OcrJobSerializer(job).data)
 
 # ---- Vehicle entry/exit endpoints
 @api_view(['POST'])
@@ -149,33 +480,20 @@ def ocr_plate(request):
 def vehicle_entry(request):
     """
     called when camera captures plate at entry or when system wants to record entry
-    expects: image (optional), slot_id (optional), ts (optional)
+    expects: image (optional), slot_id (optional), ts (optional), plate_text (optional), sync (optional)
+    without plate_text the image is OCR'd by a background job that completes the entry
     """
     image = request.FILES.get('image')
     slot_id = request.data.get('slot_id')
     ts = request.data.get('ts')  # optional ISO
     plate_text = request.data.get('plate_text')
 
-    stored_path = None
+    data = stored_path = None
     if image:
-        folder = os.path.join(settings.MEDIA_ROOT, 'plates')
-        os.makedirs(folder, exist_ok=True)
-        file_path = os.path.join(folder, f"{int(timezone.now().timestamp())}_{image.name}")
-        with open(file_path, 'wb') as out:
-            for chunk in image.chunks():
-                out.write(chunk)
-        stored_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
-        if not plate_text:
-            from .utils.ocr_utils import extract_plate_text
-            plate_text = extract_plate_text(file_path)
-
-    # create vehicle log entry
-    booking = None
-    matched_booking = None
-    if plate_text:
-        # find active booking for this vehicle
-        matched_booking = Booking.objects.filter(vehicle_number__icontains=plate_text, status='active').order_by('-created_at').first()
-        booking = matched_booking
+        data = _read_upload(image)
+        if data is None:
+            return Response({'detail':f'image larger than {OCR_MAX_UPLOAD_BYTES} bytes'}, status=413)
+        stored_path = _store_upload(data, image.name)
 
     slot = None
     if slot_id:
@@ -184,17 +502,20 @@ def vehicle_entry(request):
         except ParkingSlot.DoesNotExist:
             slot = None
 
+    # create vehicle log entry
     entry_ts = timezone.now() if not ts else timezone.make_aware(datetime.fromisoformat(ts))
-    vl = VehicleLog.objects.create(vehicle_number=plate_text or 'UNKNOWN', slot=slot, entry_ts=entry_ts, booking=booking, plate_image=f"plates/{os.path.basename(stored_path)}" if stored_path else None, ocr_text=plate_text)
-    # if booking exists, mark slot as occupied
-    if booking:
-        booking.status = 'active'
-        booking.save()
-        if booking.slot:
-            ss, _ = SlotStatus.objects.get_or_create(slot=booking.slot)
-            ss.status = 'occupied'
-            ss.save()
-    return Response(VehicleLogSerializer(vl).data)
+    vl = VehicleLog.objects.create(vehicle_number=plate_text or 'UNKNOWN', slot=slot, entry_ts=entry_ts, plate_image=stored_path, ocr_text=plate_text)
+    job = None
+    if plate_text:
+        # find active booking for this vehicle and mark its slot occupied
+        arrivals.record_arrival(vl, plate_text)
+    elif data:
+        job = ocr_jobs.submit(data, image_path=stored_path, vehicle_log=vl, wait=_wants_sync(request))
+        vl.refresh_from_db()
+    data = VehicleLogSerializer(vl).data
+    if job:
+        data['ocr_job'] = {'id': str(job.id), 'status': job.status}
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -211,7 +532,9 @@ def vehicle_exit(request):
         except VehicleLog.DoesNotExist:
             return Response({'detail':'vehicle log not found'}, status=404)
     elif plate_text:
-        vl = VehicleLog.objects.filter(vehicle_number__icontains=plate_text).order_by('-entry_ts').first()
+        # only vehicles still inside, and a misread plate only when it points at one of them
+        vl = plates.match(VehicleLog.objects.filter(exit_ts__isnull=True).order_by('-entry_ts'), plate_text,
+                          unique=True)
         if not vl:
             return Response({'detail':'vehicle log not found'}, status=404)
     else:
@@ -229,3 +552,62 @@ def vehicle_exit(request):
         vl.booking.status = 'completed'
         vl.booking.save()
     return Response(VehicleLogSerializer(vl).data)
+
+# ---- Analytics
+@replicas.replica_reads
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def occupancy_analytics(request):
+    """
+    per-bucket occupancy, peak utilisation, dwell time and sensor occupancy for capacity planning
+    expects: from, until (ISO datetimes), facility (code), zone (optional, default all),
+    granularity (hour | day, default hour)
+    """
+    facility_id = _facility_id(request.query_params.get('facility'))
+    start = _query_datetime(request.query_params, 'from')
+    end = _query_datetime(request.query_params, 'until')
+    if not start or not end:
+        return Response({'detail':'from and until (ISO datetimes) required'}, status=400)
+    try:
+        data = analytics.occupancy(request.query_params.get('zone') or None, start, end,
+                                   request.query_params.get('granularity', 'hour'), facility_id)
+    except ValueError as e:
+        return Response({'detail':str(e)}, status=400)
+    return Response(data)
+
+# ---- History exports (finance, auditors)
+def export_history(request, kind):
+    """
+    staff only: vehicle-logs or bookings whose entry / creation time falls in [from, until),
+    streamed as CSV or NDJSON without loading the range into memory (see api.utils.exports)
+    expects: from, until (ISO datetimes), format (csv | ndjson, default csv), facility (code, optional)
+    """
+    if not (request.user.is_active and request.user.is_staff):
+        return JsonResponse({'detail':'staff only'}, status=403)
+    if kind not in exports.EXPORTS:
+        return JsonResponse({'detail':'unknown export'}, status=404)
+    fmt = request.GET.get('format', 'csv')
+    start = _query_datetime(request.GET, 'from')
+    end = _query_datetime(request.GET, 'until')
+    if fmt not in exports.FORMATS or not start or not end:
+        return JsonResponse({'detail':'from, until (ISO datetimes) and format csv|ndjson required'}, status=400)
+    try:
+        facility_id = _facility_id(request.GET.get('facility'))
+    except NotFound as e:
+        return JsonResponse({'detail':str(e.detail)}, status=404)
+    with replicas.reads():
+        db = replicas.read_db()  # picked now: the rows are read after the view has returned
+    lines, content_type = exports.FORMATS[fmt]
+    rows = exports.rows(exports.queryset(kind, start, end, facility_id, using=db), kind)
+    resp = StreamingHttpResponse(lines(rows, kind), content_type=content_type)
+    resp['Content-Disposition'] = f'attachment; filename="{kind}-{start:%Y%m%d}-{end:%Y%m%d}.{fmt}"'
+    return resp
+
+# ---- Prometheus scrape endpoint
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+def metrics_view(request):
+    """this process's metrics in Prometheus text format; bearer METRICS_TOKEN required when set"""
+    if METRICS_TOKEN and request.headers.get('authorization') != f'Bearer {METRICS_TOKEN}':
+        return HttpResponse('unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,6 +2,11 @@
 ASGI config for parking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the production entry point (see the Procfile:
+``gunicorn parking.asgi:application -k uvicorn_worker.UvicornWorker``): the
+slot status stream (api/slots/stream/) only works here, and gate controller
+long-polls (gates/<id>/commands/) wait without holding a worker. parking.wsgi
+is kept for `runserver`-style tooling.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -0,0 +1,189 @@
+"""
+Gate command channel.
+
+Arrivals (and anything else that moves a barrier) issue GateCommands. Each
+gate's controller long-polls GET gates/<id>/commands/?after=<last command id>
+and acknowledges what it did with POST gates/commands/<id>/ack/.
+
+Waiting controllers cost no database polling: a committed command bumps the
+gate's sequence number in the shared cache and wakes the long-polls waiting in
+this process at once; long-polls in other processes see the sequence move
+within GATE_POLL_INTERVAL seconds (one cache read). Only then is the command
+table read. A command nobody picked up within GATE_COMMAND_TTL seconds expires
+rather than opening a barrier long after the car has left.
+
+Time from the trigger (e.g. the booking match) to delivery and to the ack is
+kept on the command and exported as the parking_gate_command_* histograms.
+
+Every gate's controller has a key of its own (`manage.py issue_gate_key`),
+stored as a sha256 like sensor device keys (api.utils.devices); it only
+reaches that gate's commands. The shared GATE_CONTROLLER_TOKEN, if set, still
+reaches every gate while controllers are moved over. Long-polls need the ASGI
+server; under WSGI they are cut to GATE_WSGI_LONG_POLL_TIMEOUT so a waiting
+controller doesn't hold a worker.
+"""
+import asyncio
+import hmac
+import secrets
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from api.utils import devices, metrics
+
+from .models import Gate, GateCommand
+
+GATE_LONG_POLL_TIMEOUT = getattr(settings, 'GATE_LONG_POLL_TIMEOUT', 25)
+GATE_POLL_INTERVAL = getattr(settings, 'GATE_POLL_INTERVAL', 0.02)
+GATE_COMMAND_TTL = timedelta(seconds=getattr(settings, 'GATE_COMMAND_TTL', 30))
+GATE_WSGI_LONG_POLL_TIMEOUT = getattr(settings, 'GATE_WSGI_LONG_POLL_TIMEOUT', 1)
+GATE_CONTROLLER_TOKEN = getattr(settings, 'GATE_CONTROLLER_TOKEN', '')
+
+ANY_GATE = 'any'  # what the shared GATE_CONTROLLER_TOKEN authorizes
+
+
+def issue_key(gate):
+    """give the gate's controller a new random key (replacing any old one) and return it; only its hash is kept"""
+    key = secrets.token_urlsafe(24)
+    gate.key_hash = devices.hash_key(key)
+    gate.save(update_fields=['key_hash'] if gate.pk else None)
+    return key
+
+
+def authorize(key):
+    """the id of the gate a controller key belongs to, ANY_GATE for the shared key, None for no valid key"""
+    if not key:
+        return None
+    if GATE_CONTROLLER_TOKEN and hmac.compare_digest(key.encode(), GATE_CONTROLLER_TOKEN.encode()):
+        return ANY_GATE
+    return Gate.objects.filter(key_hash=devices.hash_key(key), is_active=True).values_list('pk', flat=True).first()
+
+
+def _seq_key(gate_id):
+    return f'gates:seq:{gate_id}'
+
+
+class Notifier:
+    """wakes the long-polls of this process waiting on a gate; notify() may be called from any thread"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}  # gate id -> {(loop, asyncio.Event)}
+
+    def register(self, gate_id):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(gate_id, set()).add(waiter)
+        return waiter
+
+    def unregister(self, gate_id, waiter):
+        with self._lock:
+            waiters = self._waiters.get(gate_id)
+            if waiters:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[gate_id]
+
+    def notify(self, gate_id):
+        with self._lock:
+            waiters = list(self._waiters.get(gate_id, ()))
+        for loop, event in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+
+notifier = Notifier()
+
+
+def _publish(gate_id):
+    cache.add(_seq_key(gate_id), 0, None)
+    try:
+        cache.incr(_seq_key(gate_id))
+    except ValueError:  # evicted between add and incr
+        cache.add(_seq_key(gate_id), 1, None)
+    notifier.notify(gate_id)
+
+
+def issue(gate, action, booking=None, requested_at=None):
+    """queue a command for the gate's controller; it is woken when the caller's transaction commits"""
+    command = GateCommand.objects.create(gate=gate, action=action, booking=booking,
+                                         requested_at=requested_at or timezone.now())
+    transaction.on_commit(lambda: _publish(gate.pk))
+    return command
+
+
+def entry_gate(slot, gate_id=None):
+    """the gate to open for an arrival: the one asked for, the slot's entry gate, or the first active entry gate"""
+    gates = Gate.objects.filter(is_active=True)
+    if gate_id:
+        return gates.filter(pk=gate_id).first()
+    if slot.gate_id and slot.gate.is_active:
+        return slot.gate
+    return gates.filter(kind='entry').order_by('pk').first()
+
+
+def take(gate_id, after=0, now=None):
+    """pending commands for the gate with id > after, oldest first; stale ones are expired, new ones marked delivered"""
+    now = now or timezone.now()
+    pending = GateCommand.objects.filter(gate_id=gate_id, status='pending')
+    pending.filter(requested_at__lt=now - GATE_COMMAND_TTL).update(status='expired')
+    commands = list(pending.filter(id__gt=after).order_by('id'))
+    fresh = [c for c in commands if c.delivered_at is None]
+    if fresh:
+        GateCommand.objects.filter(pk__in=[c.pk for c in fresh], delivered_at__isnull=True).update(delivered_at=now)
+        for c in fresh:
+            c.delivered_at = now
+            metrics.gate_delivery.observe((now - c.requested_at).total_seconds(), c.action)
+    Gate.objects.filter(pk=gate_id).update(last_seen=now)
+    return commands
+
+
+async def wait(gate_id, after=0, timeout=GATE_LONG_POLL_TIMEOUT):
+    """take(), waiting up to timeout seconds for a command to be issued when there is none yet"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    waiter = notifier.register(gate_id)  # before the first read, so a command issued meanwhile still wakes us
+    try:
+        seq = await cache.aget(_seq_key(gate_id), 0)
+        while True:
+            commands = await sync_to_async(take)(gate_id, after)
+            if commands:
+                return commands
+            # sleep until woken in-process or the shared sequence moves
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return []
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(GATE_POLL_INTERVAL, remaining))
+                except asyncio.TimeoutError:
+                    current = await cache.aget(_seq_key(gate_id), 0)
+                    if current == seq:
+                        continue
+                    seq = current
+                else:
+                    waiter[1].clear()
+                    seq = await cache.aget(_seq_key(gate_id), 0)
+                break
+    finally:
+        notifier.unregister(gate_id, waiter)
+
+
+def ack(command, ok=True, detail='', now=None):
+    """record the controller's result; returns False if the command was already acknowledged"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        updated = GateCommand.objects.filter(pk=command.pk, acked_at__isnull=True).update(
+            status='done' if ok else 'failed', acked_at=now, detail=detail[:200])
+        if not updated:
+            return False
+        if ok:
+            Gate.objects.filter(pk=command.gate_id).update(
+                status='open' if command.action == 'open' else 'closed', last_toggled=now)
+    command.refresh_from_db()
+    metrics.gate_latency.observe(command.latency, command.action, command.status)
+    return True
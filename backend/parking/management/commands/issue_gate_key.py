@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import DEFAULT_FACILITY_CODE, Facility
+from api.utils import facilities
+from parking import gates
+from parking.models import Gate
+
+
+class Command(BaseCommand):
+    help = ("Give a gate's controller a new x-gate-key (replacing any old one) and print it. Only a hash is "
+            "stored, so the key is shown this once; it reaches this gate's commands only.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('code', help='gate code')
+        parser.add_argument('--facility', help='facility code of the gate (default: the main facility)')
+
+    def handle(self, *args, **opts):
+        try:
+            facility = facilities.from_code(opts['facility'] or DEFAULT_FACILITY_CODE)
+        except Facility.DoesNotExist:
+            raise CommandError(f"unknown facility {opts['facility']!r}")
+        try:
+            gate = Gate.objects.get(facility=facility, code=opts['code'])
+        except Gate.DoesNotExist:
+            raise CommandError(f"unknown gate {opts['code']!r}")
+        key = gates.issue_key(gate)
+        self.stdout.write(f"new key for gate {gate.code}: {key}")
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:07
+
+import api.models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def name_existing_gates(apps, schema_editor):
+    # gates from before codes existed (the single gate mark_arrived used to create) become gate-<pk>
+    Gate = apps.get_model('parking', 'Gate')
+    for gate in Gate.objects.filter(code=''):
+        gate.code = f'gate-{gate.pk}'
+        gate.save(update_fields=['code'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_facilities'),
+        ('parking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GateCommand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('open', 'Open'), ('close', 'Close')], max_length=8)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed'), ('expired', 'Expired')], default='pending', max_length=8)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('acked_at', models.DateTimeField(blank=True, null=True)),
+                ('detail', models.CharField(blank=True, max_length=200)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='code',
+            field=models.SlugField(default='', max_length=30),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='facility',
+            field=models.ForeignKey(default=api.models.default_facility, on_delete=django.db.models.deletion.CASCADE, related_name='gates', to='api.facility'),
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='kind',
+            field=models.CharField(choices=[('entry', 'Entry'), ('exit', 'Exit')], default='entry', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='slot',
+            name='gate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='parking.gate'),
+        ),
+        migrations.RunPython(name_existing_gates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='gate',
+            constraint=models.UniqueConstraint(fields=('facility', 'code'), name='gate_facility_code_uniq'),
+        ),
+        migrations.AddField(
+            model_name='gatecommand',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gate_commands', to='parking.booking'),
+        ),
+        migrations.AddField(
+            model_name='gatecommand',
+            name='gate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commands', to='parking.gate'),
+        ),
+        migrations.AddIndex(
+            model_name='gatecommand',
+            index=models.Index(fields=['gate', 'status', 'id'], name='gatecommand_gate_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0002_gate_commands'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gate',
+            name='key_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
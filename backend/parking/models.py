@@ -1,9 +1,13 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from api.models import Facility, default_facility
 
 class Slot(models.Model):
     name = models.CharField(max_length=64)
     is_occupied = models.BooleanField(default=False)
+    gate = models.ForeignKey('Gate', on_delete=models.SET_NULL, null=True, blank=True, related_name='slots')  # entry gate
 
     def __str__(self):
         return self.name
@@ -24,5 +28,57 @@ class Booking(models.Model):
         return f"{self.slot} - {self.status} - {self.vehicle_no}"
 
 class Gate(models.Model):
-    status = models.CharField(max_length=16, default='closed')
+    """a barrier; its controller long-polls for GateCommands (see parking.gates)"""
+    KIND_CHOICES = [
+        ('entry','Entry'),
+        ('exit','Exit'),
+    ]
+    facility = models.ForeignKey(Facility, on_delete=models.CASCADE, related_name='gates', default=default_facility)
+    code = models.SlugField(max_length=30)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, default='entry')
+    is_active = models.BooleanField(default=True)
+    status = models.CharField(max_length=16, default='closed')  # as last acknowledged by the controller
     last_toggled = models.DateTimeField(auto_now=True)
+    last_seen = models.DateTimeField(null=True, blank=True)  # last controller poll
+    key_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)  # controller key, sha256 hex
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facility', 'code'], name='gate_facility_code_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.code} ({self.status})"
+
+class GateCommand(models.Model):
+    ACTION_CHOICES = [
+        ('open','Open'),
+        ('close','Close'),
+    ]
+    STATUS_CHOICES = [
+        ('pending','Pending'),
+        ('done','Done'),
+        ('failed','Failed'),
+        ('expired','Expired'),
+    ]
+    gate = models.ForeignKey(Gate, on_delete=models.CASCADE, related_name='commands')
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES)
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='gate_commands')
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='pending')
+    requested_at = models.DateTimeField(default=timezone.now)  # the trigger, e.g. the booking match
+    delivered_at = models.DateTimeField(null=True, blank=True)  # first handed to the controller
+    acked_at = models.DateTimeField(null=True, blank=True)
+    detail = models.CharField(max_length=200, blank=True)  # controller's message on failure
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['gate', 'status', 'id'], name='gatecommand_gate_pending_idx'),
+        ]
+
+    @property
+    def latency(self):
+        """seconds from the trigger to the controller's ack"""
+        return (self.acked_at - self.requested_at).total_seconds() if self.acked_at else None
+
+    def __str__(self):
+        return f"{self.action} {self.gate.code} ({self.status})"
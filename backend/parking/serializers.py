@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Slot, Booking, Gate
+from .models import Slot, Booking, Gate, GateCommand
 
 class SlotSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,3 +10,9 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = '__all__'
+
+class GateCommandSerializer(serializers.ModelSerializer):
+    latency = serializers.ReadOnlyField()
+    class Meta:
+        model = GateCommand
+        fields = ['id','gate','action','booking','status','requested_at','delivered_at','acked_at','detail','latency']
@@ -16,6 +16,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # BASE_DIR probably already defined below; keep it as-is.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,10 +54,13 @@ INSTALLED_APPS = [
 
     'rest_framework', 
     'api',
+    'parking',
 ]
 
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',  # outermost, so latency covers the whole stack
+    'api.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware", 
@@ -96,6 +100,29 @@ DATABASES = {
         conn_max_age=600
     )
 }
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # take the write lock up front so concurrent requests wait instead of failing with "database is locked"
+    DATABASES["default"]["OPTIONS"] = {"transaction_mode": "IMMEDIATE", "timeout": 20}
+    # file-backed test db so the allocation stress test can use several connections
+    DATABASES["default"]["TEST"] = {"NAME": str(BASE_DIR / "test_db.sqlite3")}
+
+# facilities whose sensor tables (SensorEvent, SensorRollup) live on a database of their own,
+# e.g. FACILITY_DATABASE_URLS="north=postgres://... south=postgres://..." (see api.utils.facilities);
+# migrate each with: manage.py migrate --database facility_<code>
+FACILITY_DATABASES = {}
+for _item in os.getenv("FACILITY_DATABASE_URLS", "").split():
+    _code, _url = _item.split("=", 1)
+    DATABASES[f"facility_{_code}"] = dj_database_url.parse(_url, conn_max_age=600)
+    FACILITY_DATABASES[_code] = f"facility_{_code}"
+# read replicas for reads that tolerate lag (see api.utils.replicas), e.g.
+# DATABASE_REPLICA_URLS="postgres://replica-1/parking postgres://replica-2/parking"
+REPLICA_DATABASES = []
+for _i, _url in enumerate(os.getenv("DATABASE_REPLICA_URLS", "").split()):
+    DATABASES[f"replica_{_i}"] = dj_database_url.parse(_url, conn_max_age=600)
+    DATABASES[f"replica_{_i}"]["TEST"] = {"MIRROR": "default"}
+    REPLICA_DATABASES.append(f"replica_{_i}")
+REPLICA_PIN_SECONDS = 5  # a client reads the primary this long after its last write
+DATABASE_ROUTERS = ["api.routers.FacilityRouter", "api.routers.ReplicaRouter"]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +174,103 @@ MEDIA_ROOT = BASE_DIR / 'media'  # if BASE_DIR is a Path
 # or if BASE_DIR is str:
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-SENSOR_DEVICE_TOKEN = 'DEVKEY12345'   # change for production
+# CACHE
+# a shared cache (redis) lets all workers see the same debounce windows, slot snapshot versions, slot
+# stream and gate wake-ups; the per-process LocMemCache fallback is only allowed with DEBUG on
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+elif DEBUG:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    raise ImproperlyConfigured("REDIS_URL must be set when DEBUG is off: workers share state through the cache")
+
+# OCR jobs: size of the per-worker OCR process pool (0 = run inline), and how long sync=1 callers wait
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_SYNC_TIMEOUT = float(os.getenv("OCR_SYNC_TIMEOUT", "5"))
+# OCR result cache (per process): entries, seconds, and near-duplicate matching by a perceptual hash of
+# the plate region - only used when OCR_CROP frames the plate, whole frames of two cars hash alike
+OCR_CACHE_SIZE = 512
+OCR_CACHE_TTL = 300
+OCR_CACHE_PHASH = False
+OCR_CACHE_PHASH_DISTANCE = 4  # bits out of 256
+
+# OCR input: preprocessing scales the (optionally cropped) frame to this height; OCR_CROP is a
+# region of interest (left, top, right, bottom) as fractions, for fixed barrier cameras
+OCR_TARGET_HEIGHT = 480
+OCR_CROP = None
+# uploads are OCR'd from memory; storing them (content-addressed under MEDIA_ROOT/plates) is optional
+OCR_STORE_IMAGES = os.getenv("OCR_STORE_IMAGES", "True").lower() in ("1", "true", "yes")
+OCR_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+FILE_UPLOAD_MAX_MEMORY_SIZE = OCR_MAX_UPLOAD_BYTES  # keep camera frames off temp files
+OCR_QUEUE_SIZE = 64  # frames waiting for a pool worker, per process
+OCR_BATCH_SIZE = 8  # queued frames a freed worker takes in one call
+OCR_JOB_STALE_SECONDS = 300  # queued / running jobs older than this were lost with their worker (fail_stale_ocr_jobs)
+# OCR engine: 'tesserocr' keeps warm in-process engines (pip install tesserocr; needs libtesseract),
+# 'pytesseract' runs the tesseract binary per image, 'auto' picks tesserocr when it loads
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_ENGINE_POOL_SIZE = 2  # engines per process
+OCR_LANG = "eng"
+
+# plate matching: max edit distance for fuzzy matches (0 = exact normalised key only), index rebuild interval
+PLATE_FUZZY_DISTANCE = 1
+PLATE_INDEX_TTL = 600
+
+# SensorEvent retention (see `manage.py rollup_sensor_events`)
+SENSOR_RAW_RETENTION_DAYS = 7
+SENSOR_MINUTE_ROLLUP_RETENTION_DAYS = 90
+SENSOR_ROLLUP_LATENESS_MINUTES = 10
+# write-behind for raw SensorEvent rows (api.utils.event_buffer): readings are appended to a per-process log
+# under SENSOR_BUFFER_DIR (local disk) and inserted once FLUSH_SIZE are waiting or every FLUSH_SECONDS;
+# SENSOR_BUFFER_FSYNC makes each append survive a power cut, not just a process crash
+SENSOR_WRITE_BEHIND = os.getenv("SENSOR_WRITE_BEHIND", "False").lower() in ("1", "true", "yes")
+SENSOR_BUFFER_DIR = BASE_DIR / "sensor_buffer"
+SENSOR_BUFFER_FLUSH_SIZE = 500
+SENSOR_BUFFER_FLUSH_SECONDS = 1.0
+SENSOR_BUFFER_FSYNC = False
+
+# slot status stream (SSE): cross-process poll interval, per-client queue bound, keepalive seconds
+STREAM_POLL_INTERVAL = 0.5
+STREAM_QUEUE_SIZE = 100
+STREAM_HEARTBEAT = 15
+
+# occupancy analytics (api/analytics/occupancy/): cache seconds for closed ranges / ranges touching the last hour
+ANALYTICS_CACHE_TTL = 3600
+ANALYTICS_LIVE_CACHE_TTL = 60
+ANALYTICS_MAX_DAYS = 366
+
+# gate controllers (parking.gates): long-poll length (ASGI; WSGI requests are cut short so they don't hold a
+# worker), cross-process wake-up check interval, seconds after which an undelivered command is dropped
+GATE_LONG_POLL_TIMEOUT = 25
+GATE_WSGI_LONG_POLL_TIMEOUT = 1
+GATE_POLL_INTERVAL = 0.02
+GATE_COMMAND_TTL = 30
+# controllers authenticate with per-gate keys (`manage.py issue_gate_key`); a shared x-gate-key for every
+# gate is only accepted when this is set, e.g. while controllers are moved over
+GATE_CONTROLLER_TOKEN = os.getenv("GATE_CONTROLLER_TOKEN", "")
+
+# no-show bookings are cancelled this long after reserved_until (see `manage.py expire_reservations`)
+RESERVATION_EXPIRY_GRACE_MINUTES = 0
+
+# /metrics (Prometheus text format) requires "Authorization: Bearer <token>" when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# sensors authenticate with per-device keys (api.SensorDevice, `manage.py issue_device_key`); the old
+# shared key is off unless set here, and then works for any slot within one shared rate limit
+SENSOR_DEVICE_TOKEN = os.getenv("SENSOR_DEVICE_TOKEN", "")
+# per-device token bucket (requests/second, burst; per process) and the in-process credential cache
+SENSOR_DEVICE_RATE = 5
+SENSOR_DEVICE_BURST = 20
+SENSOR_DEVICE_LEGACY_RATE = 50  # shared by every sensor on SENSOR_DEVICE_TOKEN
+SENSOR_DEVICE_LEGACY_BURST = 200
+SENSOR_DEVICE_CACHE_TTL = 60  # seconds until another process notices a revoked key
 OCCUPIED_THRESHOLD_CM = 40
+# debounce window per (slot, sensor_type); override per '<facility code>:<zone>' / '<facility code>:<slot label>',
+# see api.utils.debounce
+SENSOR_DEBOUNCE = {
+    'window': 5,
+    'votes': 3,
+    'zones': {},
+    'slots': {},
+}
 
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import gates
+from .models import Booking, Gate, GateCommand, Slot
+
+class GateCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.lobby = Gate.objects.create(code='lobby')
+        self.gate = Gate.objects.create(code='north')
+        self.slot = Slot.objects.create(name='N1', gate=self.gate)
+        self.booking = Booking.objects.create(slot=self.slot, eta=timezone.now(), vehicle_no='KA01AB1234')
+        self.headers = {'HTTP_X_GATE_KEY': gates.issue_key(self.gate)}
+
+    def issue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return gates.issue(self.gate, 'open')
+
+    def test_arrival_opens_the_slots_gate_and_ack_records_latency(self):
+        resp = self.client.post(f'/bookings/{self.booking.id}/arrive/')
+        command_id = resp.data['gate_command']['id']
+        self.assertEqual(resp.data['gate_command']['gate'], self.gate.id)
+
+        resp = self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 0}, **self.headers)
+        self.assertEqual([c['id'] for c in resp.json()['commands']], [command_id])
+        self.assertIsNotNone(GateCommand.objects.get(pk=command_id).delivered_at)
+        resp = self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 0, 'after': command_id}, **self.headers)
+        self.assertEqual(resp.json()['commands'], [])
+        self.assertEqual(self.client.get(f'/gates/{self.gate.id}/commands/').status_code, 401)
+
+        resp = self.client.post(f'/gates/commands/{command_id}/ack/', {'ok': True}, format='json', **self.headers)
+        self.assertEqual(resp.data['status'], 'done')
+        self.assertGreaterEqual(resp.data['latency'], 0)
+        self.assertEqual(Gate.objects.get(pk=self.gate.id).status, 'open')
+        self.assertEqual(Gate.objects.get(pk=self.lobby.id).status, 'closed')
+        resp = self.client.post(f'/gates/commands/{command_id}/ack/', {'ok': True}, format='json', **self.headers)
+        self.assertEqual(resp.status_code, 409)
+
+    def test_gate_keys_only_reach_their_own_gate(self):
+        command = self.issue()
+        lobby = {'HTTP_X_GATE_KEY': gates.issue_key(self.lobby)}
+        self.assertEqual(self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 0}, **lobby).status_code, 403)
+        resp = self.client.post(f'/gates/commands/{command.id}/ack/', {'ok': True}, format='json', **lobby)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(GateCommand.objects.get(pk=command.pk).status, 'pending')
+        # no shared key unless one is configured
+        self.assertEqual(self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 0},
+                                         HTTP_X_GATE_KEY='GATEKEY12345').status_code, 401)
+        with mock.patch.object(gates, 'GATE_CONTROLLER_TOKEN', 'shared-key'):
+            resp = self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 0}, HTTP_X_GATE_KEY='shared-key')
+        self.assertEqual([c['id'] for c in resp.json()['commands']], [command.id])
+
+    def test_wsgi_long_poll_is_cut_short(self):
+        t0 = time.monotonic()
+        with mock.patch.object(gates, 'GATE_WSGI_LONG_POLL_TIMEOUT', 0.1):
+            resp = self.client.get(f'/gates/{self.gate.id}/commands/', {'timeout': 20}, **self.headers)
+        self.assertEqual(resp.json()['commands'], [])
+        self.assertLess(time.monotonic() - t0, 5)
+
+    def test_stale_commands_expire_instead_of_opening_late(self):
+        command = self.issue()
+        GateCommand.objects.filter(pk=command.pk).update(requested_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(gates.take(self.gate.id), [])
+        self.assertEqual(GateCommand.objects.get(pk=command.pk).status, 'expired')
+
+    async def test_long_poll_is_woken_in_process(self):
+        async def issue_soon():
+            await asyncio.sleep(0.05)
+            return await sync_to_async(self.issue)()
+
+        # a long cross-process check interval, so only the in-process wake-up can answer in time
+        with mock.patch.object(gates, 'GATE_POLL_INTERVAL', 10):
+            t0 = time.monotonic()
+            task = asyncio.ensure_future(issue_soon())
+            commands = await gates.wait(self.gate.id, timeout=5)
+            command = await task
+        self.assertEqual([c.pk for c in commands], [command.pk])
+        self.assertLess(time.monotonic() - t0, 1)
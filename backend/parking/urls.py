@@ -1,9 +1,16 @@
-from django.urls import path
+from django.contrib import admin
+from django.urls import path, include
 from . import views
+from api.views import metrics_view
 
 urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('api.urls')),
+    path('metrics', metrics_view),
     path('slots/', views.slots_list),
     path('bookings/', views.create_booking),
     path('slots/<int:pk>/sensor/', views.sensor_update),
     path('bookings/<int:booking_id>/arrive/', views.mark_arrived),
+    path('gates/<int:gate_id>/commands/', views.gate_commands),
+    path('gates/commands/<int:command_id>/ack/', views.ack_gate_command),
 ]
@@ -1,12 +1,18 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Slot, Booking, Gate
-from .serializers import SlotSerializer, BookingSerializer
+from .models import Slot, Booking, Gate, GateCommand
+from .serializers import SlotSerializer, BookingSerializer, GateCommandSerializer
+from . import gates
+from api.utils import replicas
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 
+@replicas.replica_reads
 @api_view(['GET'])
 def slots_list(request):
     slots = Slot.objects.all()
@@ -45,11 +51,58 @@ def sensor_update(request, pk):
 
 @api_view(['POST'])
 def mark_arrived(request, booking_id):
-    booking = get_object_or_404(Booking, pk=booking_id)
-    booking.status = 'arrived'
-    booking.save()
-    # optionally open gate
-    gate, _ = Gate.objects.get_or_create(pk=1)
-    gate.status = 'open'
-    gate.save()
-    return Response({"ok":True,"booking":BookingSerializer(booking).data})
+    """
+    optional: gate (id) to open instead of the slot's entry gate
+    """
+    matched_at = timezone.now()
+    booking = get_object_or_404(Booking.objects.select_related('slot__gate'), pk=booking_id)
+    with transaction.atomic():
+        booking.status = 'arrived'
+        booking.save()
+        # the gate's controller is woken as soon as this commits
+        gate = gates.entry_gate(booking.slot, request.data.get('gate'))
+        command = gates.issue(gate, 'open', booking=booking, requested_at=matched_at) if gate else None
+    return Response({"ok":True,"booking":BookingSerializer(booking).data,
+                     "gate_command":GateCommandSerializer(command).data if command else None})
+
+# ---- Gate controllers
+def _controller_may(allowed, gate_id):
+    return allowed == gates.ANY_GATE or allowed == gate_id
+
+async def gate_commands(request, gate_id):
+    """
+    long-poll for a gate's commands: returns pending commands with id > after at once,
+    otherwise waits up to timeout seconds (default GATE_LONG_POLL_TIMEOUT) for one.
+    needs the gate's x-gate-key; under WSGI the wait is cut to GATE_WSGI_LONG_POLL_TIMEOUT.
+    """
+    allowed = await sync_to_async(gates.authorize)(request.headers.get('x-gate-key'))
+    if allowed is None:
+        return JsonResponse({'detail':'invalid gate key'}, status=401)
+    if not _controller_may(allowed, gate_id):
+        return JsonResponse({'detail':'key not valid for this gate'}, status=403)
+    limit = gates.GATE_LONG_POLL_TIMEOUT if isinstance(request, ASGIRequest) else gates.GATE_WSGI_LONG_POLL_TIMEOUT
+    try:
+        after = int(request.GET.get('after', 0))
+        timeout = min(float(request.GET.get('timeout', limit)), limit)
+    except ValueError:
+        return JsonResponse({'detail':'after and timeout must be numbers'}, status=400)
+    if not await Gate.objects.filter(pk=gate_id, is_active=True).aexists():
+        return JsonResponse({'detail':'gate not found'}, status=404)
+    commands = await gates.wait(gate_id, after, max(0.0, timeout))
+    return JsonResponse({'commands': GateCommandSerializer(commands, many=True).data})
+
+@api_view(['POST'])
+def ack_gate_command(request, command_id):
+    """
+    controller's acknowledgement: { "ok": true } or { "ok": false, "detail": "..." }; needs the gate's x-gate-key
+    """
+    allowed = gates.authorize(request.headers.get('x-gate-key'))
+    if allowed is None:
+        return Response({"detail":"invalid gate key"}, status=401)
+    command = get_object_or_404(GateCommand, pk=command_id)
+    if not _controller_may(allowed, command.gate_id):
+        return Response({"detail":"key not valid for this gate"}, status=403)
+    ok = str(request.data.get('ok', True)).lower() not in ('0', 'false', 'no')
+    if not gates.ack(command, ok=ok, detail=str(request.data.get('detail') or '')):
+        return Response({"detail":"already acknowledged"}, status=409)
+    return Response(GateCommandSerializer(command).data)